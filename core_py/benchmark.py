@@ -0,0 +1,574 @@
+# core_py/benchmark.py
+"""
+后端热路径基准测试。完全无头运行（不启动 tracker 的输入钩子，不需要显示器或输入设备）。
+
+用法:
+    python benchmark.py --output results.json
+    python benchmark.py --sizes 10000,100000 --only save,recent,verify
+    python benchmark.py --report-sizes 20000 --only serving --concurrent-reports 4
+    python benchmark.py --report-sizes 20000 --only input_latency
+    python benchmark.py --report-sizes 100000 --only log_renderer
+    python benchmark.py --output new.json --compare old.json
+
+结果以 JSON 输出，包含运行环境信息，便于跨版本对比。
+"""
+
+import argparse
+import json
+import os
+import platform
+import queue
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import psutil
+
+RESULT_SCHEMA_VERSION = 1
+ALL_SCENARIOS = ["save", "recent", "api", "report", "verify", "encoding", "serving", "input_latency", "log_renderer"]
+
+
+def _percentiles(samples):
+    """返回毫秒为单位的延迟分布"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+    return {
+        "count": len(ordered), "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": ordered[-1] * 1000,
+    }
+
+
+class PeakRSSSampler:
+    """在后台线程中采样进程 RSS，记录相对于起始值的峰值增量"""
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.process = psutil.Process()
+        self._stop = threading.Event()
+        self.baseline = 0
+        self.peak = 0
+
+    def __enter__(self):
+        self.baseline = self.peak = self.process.memory_info().rss
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set(); self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+    @property
+    def peak_delta_mb(self):
+        return (self.peak - self.baseline) / (1024 * 1024)
+
+
+def _fresh_database(data_dir: Path):
+    """把 config/database 指向一个全新的数据目录"""
+    import config
+    import database
+    if database.engine is not None:
+        database.engine.dispose()
+        database.engine = None
+    if data_dir.exists():
+        shutil.rmtree(data_dir)
+    config.set_data_paths(str(data_dir))
+    database.init_db()
+
+
+def bench_save(workdir: Path, count: int):
+    import database
+    from workload import SyntheticWorkload
+    _fresh_database(workdir / "save")
+    latencies = []
+    started = time.perf_counter()
+    for _, event_type, details in SyntheticWorkload(seed=1).events(count):
+        t0 = time.perf_counter()
+        database.save_event(event_type, details)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    return {"events": count, "events_per_second": count / elapsed, "latency": _percentiles(latencies)}
+
+
+def _with_background_writer(fn, write_interval: float):
+    """在后台持续写入事件的同时执行 fn，返回 (fn 的结果, 写入条数)"""
+    import database
+    from workload import SyntheticWorkload
+    stop = threading.Event()
+    written = [0]
+    def writer():
+        for _, event_type, details in SyntheticWorkload(seed=2).events(10 ** 9):
+            if stop.is_set(): break
+            database.save_event(event_type, details)
+            written[0] += 1
+            if write_interval: time.sleep(write_interval)
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    try:
+        return fn(), written[0]
+    finally:
+        stop.set(); thread.join()
+
+
+def bench_recent(workdir: Path, size: int, iterations: int, write_interval: float):
+    import database
+    from workload import populate_database
+    _fresh_database(workdir / f"recent_{size}")
+    populate_database(size)
+    def run():
+        latencies = []
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            database.get_recent_events()
+            latencies.append(time.perf_counter() - t0)
+        return _percentiles(latencies)
+    latency, written = _with_background_writer(run, write_interval)
+    return {"db_events": size, "concurrent_writes": written, "latency": latency}
+
+
+def bench_api(workdir: Path, size: int, iterations: int, write_interval: float):
+    from workload import populate_database
+    _fresh_database(workdir / f"api_{size}")
+    populate_database(size)
+    from main import app
+    client = app.test_client()
+    def run():
+        latencies, errors = [], 0
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            response = client.get("/api/events")
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code != 200: errors += 1
+        return _percentiles(latencies), errors
+    (latency, errors), written = _with_background_writer(run, write_interval)
+    return {"db_events": size, "concurrent_writes": written, "errors": errors, "latency": latency}
+
+
+def bench_report(workdir: Path, size: int, log_renderer: str = None, populate: bool = True):
+    from workload import populate_database, DEFAULT_START
+    from report_generator import ReportGenerator
+    if populate:
+        _fresh_database(workdir / f"report_{size}")
+        populate_database(size)
+    out_dir = workdir / f"report_{size}_out"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    options = {"log_renderer": log_renderer} if log_renderer else {}
+    generator = ReportGenerator(
+        start_date=DEFAULT_START, end_date=DEFAULT_START + timedelta(days=3650),
+        user_info={"name": "benchmark", "company": "benchmark"},
+        save_path=str(out_dir / f"report_{log_renderer or 'default'}.pdf"), final_screenshot_dir_for_report=str(out_dir),
+        **options
+    )
+    with PeakRSSSampler() as sampler:
+        t0 = time.perf_counter()
+        filepath = generator.generate()
+        elapsed = time.perf_counter() - t0
+    return {
+        "db_events": size, "seconds": elapsed, "events_per_second": size / elapsed,
+        "peak_rss_delta_mb": sampler.peak_delta_mb,
+        "pdf_bytes": os.path.getsize(filepath) if filepath else None,
+    }
+
+
+def bench_log_renderer(workdir: Path, size: int):
+    """同一数据库上分别用 flowable 与 canvas 引擎生成报告；主指标为 canvas 引擎的耗时"""
+    from report_generator import LOG_RENDERERS
+    result = {"db_events": size}
+    for index, engine in enumerate(LOG_RENDERERS):
+        result[engine] = bench_report(workdir, size, log_renderer=engine, populate=index == 0)
+    result["seconds"] = result["canvas"]["seconds"]
+    result["speedup"] = result["flowable"]["seconds"] / result["canvas"]["seconds"]
+    return result
+
+
+def _http_request(port: int, method: str, path: str, body=None):
+    import http.client
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+    try:
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        conn.request(method, path, body=payload, headers={"Content-Type": "application/json", "Accept-Encoding": "gzip"})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+# 在独立进程中轮询，避免客户端自身与服务端争抢 GIL（真实客户端是 Electron 前端）
+_POLLER_SCRIPT = """
+import http.client, json, sys, threading, time
+port, path, interval = int(sys.argv[1]), sys.argv[2], float(sys.argv[3])
+stop = threading.Event()
+threading.Thread(target=lambda: (sys.stdin.read(), stop.set()), daemon=True).start()
+latencies = []
+while not stop.is_set():
+    t0 = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("GET", path, headers={"Accept-Encoding": "gzip"}); conn.getresponse().read(); conn.close()
+    latencies.append(time.perf_counter() - t0)
+    stop.wait(interval)
+print(json.dumps(latencies))
+"""
+
+
+def bench_serving(workdir: Path, size: int, concurrent_reports: int, probe_path: str, poll_interval: float):
+    """
+    在真实 HTTP 服务器上同时发起多个报告生成请求，期间持续轮询一个轻量接口，分别测量 dev 与 production 模式下的轮询延迟。
+    默认轮询 /api/status，即 STATUS_P99_TARGET_SECONDS 所针对的接口；采集后端固定为 stub，
+    /api/status 按需创建追踪器时不需要显示器与输入设备。
+    """
+    os.environ["LEX_CAPTURE_BACKEND"] = "stub"
+    from werkzeug.serving import make_server
+    from workload import populate_database, DEFAULT_START
+    from config import STATUS_P99_TARGET_SECONDS, SERVER_SWITCH_INTERVAL_SECONDS
+    from server import TieredWSGIServer
+    _fresh_database(workdir / f"serving_{size}")
+    populate_database(size)
+    from main import app
+
+    result = {"db_events": size, "concurrent_reports": concurrent_reports, "probe_path": probe_path,
+              "p99_target_ms": STATUS_P99_TARGET_SECONDS * 1000}
+    for mode in ("dev", "production"):
+        if mode == "dev":
+            server = make_server("127.0.0.1", 0, app, threaded=True)
+        else:
+            # 与 server.serve() 一样在启动时设置进程级的 GIL 切换间隔；dev 已先测完，不需要恢复
+            sys.setswitchinterval(SERVER_SWITCH_INTERVAL_SECONDS)
+            server = TieredWSGIServer("127.0.0.1", 0, app)
+        port = server.server_address[1]
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        out_dir = workdir / f"serving_{size}_{mode}"
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        statuses = []
+        def build_report(i):
+            statuses.append(_http_request(port, "POST", "/api/generate_report", {
+                "savePath": str(out_dir / f"report_{i}.pdf"), "startDate": DEFAULT_START.isoformat(),
+                "endDate": (DEFAULT_START + timedelta(days=3650)).isoformat(),
+                "userInfo": {"name": "benchmark", "company": "benchmark"}, "archiveScope": "range",
+            }))
+        try:
+            _http_request(port, "GET", probe_path)  # 预热路由与导入
+            reports = [threading.Thread(target=build_report, args=(i,)) for i in range(concurrent_reports)]
+            started = time.perf_counter()
+            for thread in reports: thread.start()
+            poller = subprocess.Popen([sys.executable, "-c", _POLLER_SCRIPT, str(port), probe_path, str(poll_interval)],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+            for thread in reports: thread.join()
+            elapsed = time.perf_counter() - started
+            latencies = json.loads(poller.communicate("")[0])
+        finally:
+            server.shutdown(); server.server_close(); server_thread.join()
+        latency = _percentiles(latencies)
+        result[mode] = {
+            "latency": latency, "reports_seconds": elapsed,
+            "reports_ok": statuses.count(200), "reports_rejected": statuses.count(503),
+            # 目标是针对 /api/status 定的，轮询其他接口时不作判断
+            "meets_target": (bool(latency) and latency["p99_ms"] <= STATUS_P99_TARGET_SECONDS * 1000
+                             if probe_path == "/api/status" else None),
+        }
+    # 主指标取 production 模式
+    result["latency"] = result["production"]["latency"]
+    return result
+
+
+def _measure_input_latency(tracker, interval: float, stop_event):
+    """
+    模拟键盘钩子：按固定节拍产生按键，另一个线程像 pynput 的监听线程一样被唤醒后调用 tracker._on_press。
+    延迟从按键的计划时刻算到回调返回，包含唤醒、等待 GIL 与回调本身（同进程模式下还包括写库）的耗时。
+    """
+    pending = queue.SimpleQueue()
+    latencies = []
+    def listener():
+        while True:
+            pressed_at = pending.get()
+            if pressed_at is None: return
+            tracker._on_press(None)
+            latencies.append(time.perf_counter() - pressed_at)
+    thread = threading.Thread(target=listener, daemon=True)
+    thread.start()
+    scheduled = time.perf_counter()
+    while not stop_event.wait(max(0.0, scheduled + interval - time.perf_counter())):
+        scheduled += interval
+        pending.put(scheduled)
+    pending.put(None)
+    thread.join()
+    return latencies
+
+
+def _input_latency_capture_main(conn, data_dir: str, interval: float):
+    """采集进程模式下的子进程入口：与 capture._capture_main 相同的事件通道，但只驱动模拟按键"""
+    import config
+    config.set_data_paths(data_dir)
+    from capture import PipeEventSink
+    from tracker import ActivityTracker
+    sink = PipeEventSink(conn)
+    tracker = ActivityTracker(event_sink=sink, run_retention=False)
+    stop = threading.Event()
+    def wait_for_stop():
+        try:
+            conn.recv()
+        except (EOFError, OSError):
+            pass
+        stop.set()
+    threading.Thread(target=wait_for_stop, daemon=True).start()
+    latencies = _measure_input_latency(tracker, interval, stop)
+    sink.send(("stopped", latencies))
+    conn.close()
+
+
+def bench_input_latency(workdir: Path, size: int, concurrent_reports: int, key_interval: float):
+    """
+    同时生成多个报告，期间持续产生模拟按键，分别测量追踪器与报告同进程（thread）和在独立采集进程中（process）时
+    按键回调的延迟。两种模式下事件都写入同一个数据库，报告生成都在本进程内进行。
+    """
+    import config
+    import database
+    from workload import populate_database, DEFAULT_START
+    from report_generator import ReportGenerator
+    from capture import CaptureProcess
+    from tracker import ActivityTracker
+    _fresh_database(workdir / f"input_latency_{size}")
+    populate_database(size)
+
+    result = {"db_events": size, "concurrent_reports": concurrent_reports, "key_interval_ms": key_interval * 1000}
+    for mode in ("thread", "process"):
+        out_dir = workdir / f"input_latency_{size}_{mode}"
+        out_dir.mkdir(parents=True, exist_ok=True)
+        def build_report(i):
+            ReportGenerator(
+                start_date=DEFAULT_START, end_date=DEFAULT_START + timedelta(days=3650),
+                user_info={"name": "benchmark", "company": "benchmark"},
+                save_path=str(out_dir / f"report_{i}.pdf"), final_screenshot_dir_for_report=str(out_dir)
+            ).generate()
+        with database.SessionLocal() as db:
+            keys_before = db.query(database.Event).filter(database.Event.event_type == "keyboard_press").count()
+
+        reports = [threading.Thread(target=build_report, args=(i,)) for i in range(concurrent_reports)]
+        if mode == "thread":
+            stop = threading.Event()
+            collected = []
+            tracker = ActivityTracker(event_sink=database.save_event, run_retention=False)
+            probe = threading.Thread(target=lambda: collected.extend(_measure_input_latency(tracker, key_interval, stop)))
+            probe.start()
+        else:
+            capture = CaptureProcess(target=_input_latency_capture_main,
+                                     target_args=(str(config.BASE_DATA_DIR), key_interval))
+            capture.start()
+        started = time.perf_counter()
+        for thread in reports: thread.start()
+        for thread in reports: thread.join()
+        elapsed = time.perf_counter() - started
+        if mode == "thread":
+            stop.set(); probe.join()
+            latencies = collected
+        else:
+            latencies = capture.stop() or []
+
+        with database.SessionLocal() as db:
+            keys_saved = db.query(database.Event).filter(database.Event.event_type == "keyboard_press").count() - keys_before
+        result[mode] = {"latency": _percentiles(latencies), "reports_seconds": elapsed,
+                        "keys_pressed": len(latencies), "keys_saved": keys_saved}
+    # 主指标取 process 模式
+    result["latency"] = result["process"]["latency"]
+    return result
+
+
+def bench_verify(workdir: Path, size: int):
+    import database
+    from workload import populate_database
+    _fresh_database(workdir / f"verify_{size}")
+    populate_database(size)
+    t0 = time.perf_counter()
+    result = database.verify_chain()
+    elapsed = time.perf_counter() - t0
+    if not result["ok"]:
+        raise RuntimeError(f"Synthetic chain failed verification: {result}")
+    return {"db_events": size, "seconds": elapsed, "events_per_second": result["checked"] / elapsed}
+
+
+def bench_encoding(workdir: Path, size: int):
+    """对比 JSON 与紧凑编码：库文件大小（VACUUM 后）、details 解码速度、链校验速度"""
+    import config
+    import database
+    from sqlalchemy import text
+    from details_codec import HAS_MSGPACK, ENCODING_JSON, ENCODING_MSGPACK
+    from workload import populate_database
+    encodings = [ENCODING_JSON] + ([ENCODING_MSGPACK] if HAS_MSGPACK else [])
+    original = config.DETAILS_ENCODING
+    result = {"db_events": size}
+    try:
+        for encoding in encodings:
+            config.DETAILS_ENCODING = encoding
+            _fresh_database(workdir / f"encoding_{encoding}_{size}")
+            populate_database(size)
+            with database.engine.connect() as conn:
+                conn.execute(text("VACUUM"))
+            db_bytes = os.path.getsize(config.DATABASE_PATH)
+            with database.engine.connect() as conn:
+                # details 自身占用的字节数（含字符串表），不受 FTS、汇总表等其他结构影响
+                details_bytes = conn.execute(text(
+                    "SELECT COALESCE(SUM(LENGTH(CAST(details AS BLOB))), 0) + COALESCE(SUM(LENGTH(details_blob)), 0) FROM events"
+                )).scalar() + conn.execute(text(
+                    "SELECT COALESCE(SUM(LENGTH(CAST(value AS BLOB))), 0) FROM interned_strings")).scalar()
+
+            events = list(database.iter_events(batch_size=10000))
+            database._interner.reset()  # 模拟冷启动：字符串表需要从库中加载
+            t0 = time.perf_counter()
+            for event in events:
+                database.load_details(event)
+            decode_seconds = time.perf_counter() - t0
+            del events
+
+            t0 = time.perf_counter()
+            verified = database.verify_chain()
+            verify_seconds = time.perf_counter() - t0
+            if not verified["ok"]:
+                raise RuntimeError(f"Chain failed verification with {encoding} encoding: {verified}")
+            result[encoding] = {"db_bytes": db_bytes, "details_bytes": details_bytes, "decode_events_per_second": size / decode_seconds,
+                                "verify_seconds": verify_seconds}
+    finally:
+        config.DETAILS_ENCODING = original
+    if ENCODING_MSGPACK in result:
+        result["size_ratio"] = result[ENCODING_MSGPACK]["db_bytes"] / result[ENCODING_JSON]["db_bytes"]
+        result["details_size_ratio"] = result[ENCODING_MSGPACK]["details_bytes"] / result[ENCODING_JSON]["details_bytes"]
+        result["decode_speedup"] = result[ENCODING_MSGPACK]["decode_events_per_second"] / result[ENCODING_JSON]["decode_events_per_second"]
+    return result
+
+
+def _environment():
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent,
+                                           stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        revision = None
+    return {
+        "git_revision": revision, "python_version": platform.python_version(),
+        "platform": platform.platform(), "cpu_count": os.cpu_count(),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+def run(args):
+    scenarios = args.only.split(",") if args.only else ALL_SCENARIOS
+    sizes = [int(s) for s in args.sizes.split(",")]
+    report_sizes = [int(s) for s in args.report_sizes.split(",")] if args.report_sizes else sizes
+    results = {"schema_version": RESULT_SCHEMA_VERSION, "environment": _environment(), "results": {}}
+
+    workdir = Path(tempfile.mkdtemp(prefix="lex_bench_"))
+    try:
+        if "save" in scenarios:
+            results["results"]["save_event"] = bench_save(workdir, args.save_events)
+            _print_line("save_event", results["results"]["save_event"])
+        for size in sizes:
+            if "recent" in scenarios:
+                key = f"get_recent_events@{size}"
+                results["results"][key] = bench_recent(workdir, size, args.iterations, args.write_interval)
+                _print_line(key, results["results"][key])
+            if "api" in scenarios:
+                key = f"api_events@{size}"
+                results["results"][key] = bench_api(workdir, size, args.iterations, args.write_interval)
+                _print_line(key, results["results"][key])
+            if "verify" in scenarios:
+                key = f"verify_chain@{size}"
+                results["results"][key] = bench_verify(workdir, size)
+                _print_line(key, results["results"][key])
+            if "encoding" in scenarios:
+                key = f"details_encoding@{size}"
+                results["results"][key] = bench_encoding(workdir, size)
+                _print_line(key, results["results"][key])
+        if "serving" in scenarios:
+            for size in report_sizes:
+                key = f"serving@{size}"
+                results["results"][key] = bench_serving(workdir, size, args.concurrent_reports, args.probe_path, args.poll_interval)
+                _print_line(key, results["results"][key])
+        if "input_latency" in scenarios:
+            for size in report_sizes:
+                key = f"input_latency@{size}"
+                results["results"][key] = bench_input_latency(workdir, size, args.concurrent_reports, args.key_interval)
+                _print_line(key, results["results"][key])
+        if "report" in scenarios:
+            for size in report_sizes:
+                key = f"report_generate@{size}"
+                results["results"][key] = bench_report(workdir, size)
+                _print_line(key, results["results"][key])
+        if "log_renderer" in scenarios:
+            for size in report_sizes:
+                key = f"log_renderer@{size}"
+                results["results"][key] = bench_log_renderer(workdir, size)
+                _print_line(key, results["results"][key])
+    finally:
+        import database
+        if database.engine is not None: database.engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _headline(entry):
+    """每个结果取一个主指标用于打印和对比：越小越好的指标带 _ms/seconds"""
+    if "latency" in entry: return "p99_ms", entry["latency"].get("p99_ms")
+    if "seconds" in entry: return "seconds", entry["seconds"]
+    if "size_ratio" in entry: return "size_ratio", entry["size_ratio"]
+    return None, None
+
+
+def _print_line(name, entry):
+    metric, value = _headline(entry)
+    extra = f"  {entry['events_per_second']:.0f} ev/s" if "events_per_second" in entry else ""
+    print(f"[BENCH] {name:<32} {metric}={value:.3f}{extra}" if metric else f"[BENCH] {name}: {entry}")
+
+
+def compare(current, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"\n[BENCH] Comparison against {baseline_path} ({baseline['environment'].get('git_revision')}):")
+    for name, entry in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        metric, value = _headline(entry)
+        if not old or metric is None: continue
+        _, old_value = _headline(old)
+        if not old_value: continue
+        change = (value - old_value) / old_value * 100
+        print(f"  {name:<32} {metric}: {old_value:.3f} -> {value:.3f} ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lex Laboris backend benchmarks")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="数据库规模，逗号分隔")
+    parser.add_argument("--report-sizes", default=None, help="报告生成基准使用的规模，默认与 --sizes 相同")
+    parser.add_argument("--save-events", type=int, default=5000, help="save_event 吞吐测试的事件数")
+    parser.add_argument("--iterations", type=int, default=500, help="读延迟测试的请求次数")
+    parser.add_argument("--write-interval", type=float, default=0.001, help="并发写入线程每次写入后的间隔秒数")
+    parser.add_argument("--concurrent-reports", type=int, default=4, help="serving 与 input_latency 场景同时生成的报告数")
+    parser.add_argument("--probe-path", default="/api/status", help="serving 场景轮询的轻量接口")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="serving 场景的轮询间隔秒数")
+    parser.add_argument("--key-interval", type=float, default=0.05, help="input_latency 场景模拟按键的间隔秒数")
+    parser.add_argument("--only", default=None, help=f"只运行指定场景: {','.join(ALL_SCENARIOS)}")
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    parser.add_argument("--compare", default=None, help="与之前的结果 JSON 对比")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"[BENCH] Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    return results
+
+
+if __name__ == "__main__":
+    main()
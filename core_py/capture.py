@@ -0,0 +1,232 @@
+# core_py/capture.py
+"""
+采集模式：追踪器与写库进程的关系。
+
+"thread" 模式下 ActivityTracker 直接运行在 HTTP 服务所在的进程里，键盘钩子回调要和报告排版、
+截图编码、请求处理争抢同一个 GIL，报告生成期间按键回调可能被推迟，会话时间戳随之偏移。
+"process" 模式下追踪器运行在只加载采集所需模块的子进程中，事件连同在事件源处记录的时间戳
+经 multiprocessing 管道发回本进程，由接收线程按到达顺序写入哈希链；数据库只由本进程持有。
+
+截图请求同样经管道转交采集进程；截图保留策略需要读写哈希链，始终在本进程运行。
+帧存储由采集进程写入，它每取一个新关键帧就经管道告知本进程（先于该帧的截图事件到达），
+本进程的保留策略据此跳过仍在接收差分帧的关键帧组。
+采集进程内的指标（截图各阶段耗时、按键回调耗时等）只存在于该进程，不出现在 /api/metrics 中。
+"""
+
+import os
+import sys
+import threading
+import itertools
+import logging
+import multiprocessing
+
+from config import CAPTURE_MODE, CAPTURE_REQUEST_TIMEOUT_SECONDS, CAPTURE_STOP_TIMEOUT_SECONDS, RETENTION_ENABLED
+
+log = logging.getLogger(__name__)
+
+CAPTURE_MODES = ("thread", "process")
+
+
+def resolve_capture_mode() -> str:
+    """环境变量 LEX_CAPTURE_MODE 优先，其次是 config.CAPTURE_MODE"""
+    mode = os.environ.get("LEX_CAPTURE_MODE") or CAPTURE_MODE
+    if mode not in CAPTURE_MODES:
+        raise ValueError(f"Unknown capture mode {mode!r}, expected one of {CAPTURE_MODES}")
+    return mode
+
+
+class CaptureError(Exception):
+    pass
+
+
+# --- 采集进程一侧 ---
+class PipeEventSink:
+    """ActivityTracker 的 event_sink：把事件发回写库的进程。追踪器的多个线程共用一个连接，发送需加锁"""
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            self._conn.send(message)
+
+    def __call__(self, event_type: str, details: dict, timestamp):
+        self.send(("event", event_type, details, timestamp))
+
+
+def _capture_main(conn, data_dir: str):
+    """采集进程入口：启动追踪器，处理来自写库进程的请求，收到 stop 或管道关闭时停止"""
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - [capture] [%(filename)s:%(lineno)d] - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    import config
+    config.set_data_paths(data_dir)
+    from tracker import ActivityTracker
+
+    from screenshot_store import get_store
+
+    sink = PipeEventSink(conn)
+    get_store().keyframe_listener = lambda name: sink.send(("keyframe", name))
+    tracker = ActivityTracker(event_sink=sink, run_retention=False)
+    tracker.start()
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "stop": break
+            if message[0] == "screenshot":
+                _, request_id, bbox = message
+                sink.send(("reply", request_id, tracker.take_manual_screenshot(bbox=bbox)))
+    except (EOFError, OSError):
+        log.warning("CAPTURE: connection to the main process lost, stopping")
+    finally:
+        session = tracker.stop()
+        try:
+            sink.send(("stopped", session))
+        except OSError:
+            pass
+        conn.close()
+
+
+# --- 写库进程一侧 ---
+class CaptureProcess:
+    """
+    在写库进程中代表采集进程，对 main.py 提供与 ActivityTracker 相同的接口
+    （is_running、is_idle、start、stop、take_manual_screenshot、take_fullscreen_screenshot）。
+    is_idle 与调节器级别由收到的 status_change / governor_throttle 事件推出，不需要额外的同步消息。
+    """
+    def __init__(self, record_event=None, target=None, target_args=()):
+        if record_event is None:
+            from database import save_event as record_event
+        self.record_event = record_event
+        # 基准测试可以换用其他入口，入口函数的第一个参数固定为管道连接
+        self.target = target or _capture_main
+        self.target_args = tuple(target_args)
+        self.is_running = False; self.is_idle = False; self.governor_level = 0
+        self._conn = None; self._process = None; self._receiver = None
+        self._send_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self._replies = {}; self._reply_events = {}
+        self._stopped_payload = None
+        self.stop_event = threading.Event(); self.threads = []
+        self.retention = None
+        if self.target is _capture_main:
+            from retention import RetentionWorker
+            self.retention = RetentionWorker(should_yield=lambda: self.governor_level > 0)
+
+    def start(self):
+        if self.is_running: return
+        from config import BASE_DATA_DIR
+        if BASE_DATA_DIR is None:
+            raise CaptureError("Data paths are not initialized")
+        # spawn：子进程不继承本进程的线程、数据库连接与已导入的重模块
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        args = (child_conn, str(BASE_DATA_DIR)) if self.target is _capture_main else (child_conn, *self.target_args)
+        self._process = context.Process(target=self.target, args=args, name="lex-capture", daemon=True)
+        self._process.start()
+        child_conn.close()
+        self.is_idle = False; self.governor_level = 0; self._stopped_payload = None
+        self.stop_event.clear()
+        self._receiver = threading.Thread(target=self._receive, name="capture-receiver", daemon=True)
+        self.threads = [self._receiver]
+        if RETENTION_ENABLED and self.retention is not None:
+            self.threads.append(threading.Thread(target=self.retention.run, args=(self.stop_event,), daemon=True))
+        self.is_running = True
+        for t in self.threads: t.start()
+        log.info(f"CAPTURE: capture process started (pid {self._process.pid})")
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == "event":
+                _, event_type, details, timestamp = message
+                if event_type == "status_change":
+                    self.is_idle = details.get("status") == "idle"
+                elif event_type == "governor_throttle":
+                    self.governor_level = details.get("level", 0)
+                self.record_event(event_type, details, timestamp=timestamp)
+            elif kind == "reply":
+                _, request_id, result = message
+                self._replies[request_id] = result
+                waiter = self._reply_events.get(request_id)
+                if waiter is not None: waiter.set()
+            elif kind == "keyframe":
+                from screenshot_store import get_store
+                get_store().set_live_keyframe(message[1])
+            elif kind == "stopped":
+                self._stopped_payload = message[1]
+        if self.target is _capture_main:
+            # 采集进程已退出，不会再有引用其关键帧的差分帧
+            from screenshot_store import get_store
+            get_store().set_live_keyframe(None)
+        if self.is_running and not self.stop_event.is_set():
+            log.error("CAPTURE: capture process exited unexpectedly")
+            self.is_running = False
+            self.stop_event.set()
+        for waiter in list(self._reply_events.values()): waiter.set()
+
+    def _send(self, message):
+        with self._send_lock:
+            self._conn.send(message)
+
+    def take_manual_screenshot(self, bbox=None, is_auto=False):
+        """在采集进程中截图；返回文件路径，失败或超时返回 None。截图事件先于回复到达，返回时已经写入哈希链"""
+        if not self.is_running: return None
+        request_id = next(self._request_ids)
+        waiter = self._reply_events[request_id] = threading.Event()
+        try:
+            self._send(("screenshot", request_id, bbox))
+            if not waiter.wait(CAPTURE_REQUEST_TIMEOUT_SECONDS):
+                log.error(f"CAPTURE: screenshot request {request_id} timed out")
+            return self._replies.pop(request_id, None)
+        except OSError as e:
+            log.error(f"CAPTURE: cannot reach the capture process: {e}")
+            return None
+        finally:
+            self._reply_events.pop(request_id, None)
+
+    def take_fullscreen_screenshot(self):
+        if not self.is_running:
+            return None
+        return self.take_manual_screenshot(bbox=None)
+
+    def stop(self):
+        """停止采集进程；返回其停止时发回的内容（追踪器为会话起止时间），进程未能正常停止时返回 None"""
+        if not self.is_running: return None
+        self.stop_event.set()
+        try:
+            self._send(("stop",))
+        except OSError:
+            pass
+        # 先等接收线程把管道中剩余的事件全部写库，再回收进程
+        self._receiver.join(timeout=CAPTURE_STOP_TIMEOUT_SECONDS)
+        self._process.join(timeout=CAPTURE_STOP_TIMEOUT_SECONDS)
+        if self._process.is_alive():
+            log.error("CAPTURE: capture process did not stop in time, terminating")
+            self._process.terminate(); self._process.join()
+        for t in self.threads: t.join(timeout=2)
+        self._conn.close()
+        self.threads.clear(); self.is_running = False
+        log.info("CAPTURE: capture process stopped.")
+        return self._stopped_payload
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    """按采集模式返回进程内的 ActivityTracker 或代表采集进程的 CaptureProcess"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            if resolve_capture_mode() == "process":
+                _tracker = CaptureProcess()
+            else:
+                from tracker import ActivityTracker
+                _tracker = ActivityTracker()
+        return _tracker
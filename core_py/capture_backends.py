@@ -0,0 +1,240 @@
+# core_py/capture_backends.py
+"""
+采集后端：ActivityTracker 与操作系统打交道的三处（截屏、活动窗口、键盘钩子）。
+分屏截图（monitor_capture.py）另外需要 monitors() 与 grab_monitor()：显示器几何为虚拟桌面坐标下的
+(left, top, width, height)，grab_monitor 只截取这一块区域，不经过整个虚拟桌面的拼接位图。
+
+"native" 使用 PIL.ImageGrab、window_monitor 与 pynput，需要显示器和输入设备；
+"stub" 生成确定性的合成画面、轮换的虚拟窗口和按固定速率到达的按键，供负载测试（loadtest.py）
+在无头环境中运行完整的 main.py。可用环境变量 LEX_CAPTURE_BACKEND 覆盖 config.CAPTURE_BACKEND，
+LEX_STUB_KEYS_PER_SECOND 覆盖 config.STUB_KEYS_PER_SECOND（负载测试用它控制事件写入速率）。
+"""
+
+import os
+import sys
+import threading
+import logging
+
+from PIL import Image, ImageDraw
+
+from config import CAPTURE_BACKEND, STUB_MONITORS, STUB_KEYS_PER_SECOND, STUB_WINDOW_SWITCH_SECONDS
+
+log = logging.getLogger(__name__)
+
+CAPTURE_BACKENDS = ("native", "stub")
+
+
+def resolve_capture_backend() -> str:
+    """环境变量 LEX_CAPTURE_BACKEND 优先，其次是 config.CAPTURE_BACKEND"""
+    backend = os.environ.get("LEX_CAPTURE_BACKEND") or CAPTURE_BACKEND
+    if backend not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown capture backend {backend!r}, expected one of {CAPTURE_BACKENDS}")
+    return backend
+
+
+class NativeBackend:
+    name = "native"
+
+    def grab(self, bbox=None):
+        from PIL import ImageGrab
+        return ImageGrab.grab(bbox=bbox, all_screens=True)
+
+    def active_window(self):
+        from window_monitor import get_active_window_info
+        return get_active_window_info()
+
+    def keyboard_listener(self, on_press):
+        # 延迟导入：pynput 在导入时就需要显示环境
+        from pynput import keyboard
+        return keyboard.Listener(on_press=on_press)
+
+    def monitors(self) -> list:
+        """[(left, top, width, height)]；无法检测时返回空列表，调用方退回拼接截图"""
+        try:
+            if sys.platform == "win32": return self._monitors_win32()
+            if sys.platform == "darwin": return self._monitors_darwin()
+            if sys.platform.startswith("linux"): return self._monitors_x11()
+        except Exception as e:
+            log.warning(f"CAPTURE: cannot enumerate monitors: {e}")
+        return []
+
+    def grab_monitor(self, geometry):
+        # ImageGrab 带 bbox 时仍会先截取整个虚拟桌面再裁剪，这里直接截取单个显示器
+        if sys.platform == "win32": return self._grab_win32(geometry)
+        if sys.platform == "darwin": return self._grab_darwin(geometry)
+        if sys.platform.startswith("linux"): return self._grab_x11(geometry)
+        left, top, width, height = geometry
+        return self.grab(bbox=(left, top, left + width, top + height))
+
+    def _monitors_win32(self):
+        import win32api
+        monitors = []
+        for handle, _, _ in win32api.EnumDisplayMonitors():
+            left, top, right, bottom = win32api.GetMonitorInfo(handle)["Monitor"]
+            monitors.append((left, top, right - left, bottom - top))
+        return monitors
+
+    def _grab_win32(self, geometry):
+        import win32con, win32gui, win32ui
+        left, top, width, height = geometry
+        desktop = win32gui.GetDesktopWindow()
+        desktop_dc = win32gui.GetWindowDC(desktop)
+        source = win32ui.CreateDCFromHandle(desktop_dc)
+        memory = source.CreateCompatibleDC()
+        bitmap = win32ui.CreateBitmap()
+        try:
+            bitmap.CreateCompatibleBitmap(source, width, height)
+            memory.SelectObject(bitmap)
+            memory.BitBlt((0, 0), (width, height), source, (left, top), win32con.SRCCOPY)
+            return Image.frombuffer("RGB", (width, height), bitmap.GetBitmapBits(True), "raw", "BGRX", 0, 1)
+        finally:
+            win32gui.DeleteObject(bitmap.GetHandle())
+            memory.DeleteDC(); source.DeleteDC()
+            win32gui.ReleaseDC(desktop, desktop_dc)
+
+    def _monitors_darwin(self):
+        import Quartz
+        _, display_ids, count = Quartz.CGGetActiveDisplayList(32, None, None)
+        self._display_ids = {}
+        for display_id in display_ids[:count]:
+            bounds = Quartz.CGDisplayBounds(display_id)
+            # 以点为单位；Retina 显示器截得的图像像素数是它的整数倍
+            geometry = (int(bounds.origin.x), int(bounds.origin.y), int(bounds.size.width), int(bounds.size.height))
+            self._display_ids[geometry] = display_id
+        return list(self._display_ids)
+
+    def _grab_darwin(self, geometry):
+        import Quartz
+        image_ref = Quartz.CGDisplayCreateImage(self._display_ids[geometry])
+        width, height = Quartz.CGImageGetWidth(image_ref), Quartz.CGImageGetHeight(image_ref)
+        data = Quartz.CGDataProviderCopyData(Quartz.CGImageGetDataProvider(image_ref))
+        return Image.frombuffer("RGB", (width, height), bytes(data), "raw", "BGRX", Quartz.CGImageGetBytesPerRow(image_ref), 1)
+
+    def _monitors_x11(self):
+        from Xlib import display as XlibDisplay
+        d = XlibDisplay.Display()
+        try:
+            root = d.screen().root
+            try:
+                monitors = [(m.x, m.y, m.width_in_pixels, m.height_in_pixels) for m in root.xrandr_get_monitors().monitors]
+            except Exception:
+                monitors = []  # 没有 RandR 1.5 时整个根窗口视为一个显示器
+            if not monitors:
+                geometry = root.get_geometry()
+                monitors = [(0, 0, geometry.width, geometry.height)]
+            return monitors
+        finally:
+            d.close()
+
+    def _grab_x11(self, geometry):
+        from Xlib import display as XlibDisplay, X
+        left, top, width, height = geometry
+        d = XlibDisplay.Display()
+        try:
+            raw = d.screen().root.get_image(left, top, width, height, X.ZPixmap, 0xffffffff)
+            return Image.frombuffer("RGB", (width, height), raw.data, "raw", "BGRX", 0, 1)
+        finally:
+            d.close()
+
+
+class _StubKeyboardListener(threading.Thread):
+    """与 pynput.keyboard.Listener 相同的 start/stop/is_alive 接口，按固定速率回调 on_press"""
+    def __init__(self, on_press, keys_per_second: float):
+        super().__init__(name="stub-keyboard", daemon=True)
+        self.on_press = on_press
+        self.interval = 1.0 / keys_per_second if keys_per_second > 0 else None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        if self.interval is None: return
+        while not self._stop_event.wait(self.interval):
+            self.on_press(None)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class StubBackend:
+    """
+    合成画面由静态背景与一块随截图次数移动的色块组成，色块只出现在第一个显示器上：相邻两帧只有少量图块变化，
+    其他显示器保持不变，差分存储、分屏截图的跳过逻辑与保留策略的行为接近真实桌面。
+    窗口按 STUB_WINDOW_SWITCH_SECONDS 在固定列表中轮换。
+    """
+    name = "stub"
+    WINDOWS = [("code.exe", "main.py - lex-laboris"), ("chrome.exe", "Pull Request #88 - GitHub"),
+               ("WINWORD.EXE", "需求规格说明书_v3.docx - Word")]
+
+    def __init__(self, monitors=None, keys_per_second: float = None, window_switch_seconds: float = None):
+        self._monitors = [tuple(m) for m in (monitors or STUB_MONITORS)]
+        self.keys_per_second = STUB_KEYS_PER_SECOND if keys_per_second is None else keys_per_second
+        self.window_switch_seconds = window_switch_seconds or STUB_WINDOW_SWITCH_SECONDS
+        self._lock = threading.Lock()
+        self._frames = 0
+        self._backgrounds = {}
+        self._polls = 0
+
+    def _desktop(self):
+        """整个虚拟桌面的 (left, top, right, bottom)"""
+        return (min(m[0] for m in self._monitors), min(m[1] for m in self._monitors),
+                max(m[0] + m[2] for m in self._monitors), max(m[1] + m[3] for m in self._monitors))
+
+    def _background(self, region) -> Image.Image:
+        """region 范围内的静态画面；不属于任何显示器的部分为黑色，与拼接截图一致"""
+        image = self._backgrounds.get(region)
+        if image is None:
+            left, top, right, bottom = region
+            image = Image.new("RGB", (right - left, bottom - top), (0, 0, 0))
+            draw = ImageDraw.Draw(image)
+            for m_left, m_top, width, height in self._monitors:
+                x0, y0 = m_left - left, m_top - top
+                draw.rectangle([x0, y0, x0 + width - 1, y0 + height - 1], fill=(236, 236, 236))
+                for y in range(y0, y0 + height, 24):
+                    draw.line([(x0, y), (x0 + width - 1, y)], fill=(200, 200, 210))
+                draw.rectangle([x0, y0, x0 + width - 1, y0 + 32], fill=(40, 44, 52))
+            self._backgrounds[region] = image
+        return image
+
+    def _render(self, region, advance: bool):
+        with self._lock:
+            frame = self._frames
+            if advance: self._frames += 1
+            image = self._background(region).copy()
+        left, top = region[0], region[1]
+        m_left, m_top, width, height = self._monitors[0]
+        x = m_left - left + (frame * 97) % max(1, width - 200)
+        y = m_top - top + 40 + (frame * 53) % max(1, height - 240)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle([x, y, x + 200, y + 200], fill=((frame * 37) % 256, 90, 160))
+        draw.text((m_left - left + 10, m_top - top + 10), f"stub frame {frame}", fill=(255, 255, 255))
+        return image
+
+    def grab(self, bbox=None):
+        # 每次截图前进一帧；分屏截图以截取第一个显示器为一帧
+        return self._render(tuple(bbox) if bbox else self._desktop(), advance=True)
+
+    def monitors(self) -> list:
+        return list(self._monitors)
+
+    def grab_monitor(self, geometry):
+        left, top, width, height = geometry
+        return self._render((left, top, left + width, top + height), advance=geometry == self._monitors[0])
+
+    def active_window(self):
+        from config import WINDOW_CHECK_INTERVAL_SECONDS
+        # 按轮询次数而不是墙钟时间切换窗口，相同的调用序列总是得到相同的结果
+        with self._lock:
+            polls = self._polls; self._polls += 1
+        process_name, title = self.WINDOWS[int(polls * WINDOW_CHECK_INTERVAL_SECONDS // self.window_switch_seconds) % len(self.WINDOWS)]
+        return {"title": title, "process_name": process_name, "exe_path": f"C:\\Program Files\\stub\\{process_name}"}
+
+    def keyboard_listener(self, on_press):
+        return _StubKeyboardListener(on_press, self.keys_per_second)
+
+
+def get_backend(name: str = None):
+    name = name or resolve_capture_backend()
+    if name == "stub":
+        log.warning("CAPTURE: using the stub capture backend, no real screen or input is recorded")
+        keys_per_second = os.environ.get("LEX_STUB_KEYS_PER_SECOND")
+        return StubBackend(keys_per_second=float(keys_per_second) if keys_per_second else None)
+    return NativeBackend()
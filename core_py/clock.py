@@ -0,0 +1,36 @@
+# core_py/clock.py
+"""
+ActivityTracker 使用的时钟。实时运行时是系统时钟；回放（replay.py）时换成由驱动器推进的虚拟时钟，
+空闲判定、心跳、应用会话与截图文件名都按虚拟时间计算，同一条输入轨迹每次回放得到相同的事件与哈希链。
+"""
+
+import time
+from datetime import datetime
+
+
+class SystemClock:
+    def time(self) -> float:
+        return time.time()
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+
+class VirtualClock:
+    """只在 advance_to 时前进的时钟；time() 与 now() 表示同一时刻，与 datetime.fromtimestamp 互逆"""
+    def __init__(self, start: datetime):
+        self._now = start
+
+    def time(self) -> float:
+        return self._now.timestamp()
+
+    def now(self) -> datetime:
+        return self._now
+
+    def advance_to(self, moment: datetime):
+        if moment < self._now:
+            raise ValueError(f"Virtual clock cannot move backwards: {moment} < {self._now}")
+        self._now = moment
+
+
+SYSTEM_CLOCK = SystemClock()
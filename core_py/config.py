@@ -7,16 +7,18 @@ import os
 # 【修改】将 BASE_DATA_DIR 初始化为 None，它将在运行时被设置
 BASE_DATA_DIR = None
 DATABASE_URL = None
+DATABASE_PATH = None
 SCREENSHOT_DIR = None
 
 def set_data_paths(base_path_str: str):
     """由主程序调用，用于设置所有数据路径"""
-    global BASE_DATA_DIR, DATABASE_URL, SCREENSHOT_DIR
+    global BASE_DATA_DIR, DATABASE_URL, DATABASE_PATH, SCREENSHOT_DIR
     
     BASE_DATA_DIR = Path(base_path_str)
     BASE_DATA_DIR.mkdir(parents=True, exist_ok=True)
     
-    DATABASE_URL = f"sqlite:///{BASE_DATA_DIR / 'work_log.db'}"
+    DATABASE_PATH = BASE_DATA_DIR / 'work_log.db'
+    DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
     
     SCREENSHOT_DIR = BASE_DATA_DIR / "screenshots"
     SCREENSHOT_DIR.mkdir(exist_ok=True)
@@ -30,5 +32,108 @@ WINDOW_CHECK_INTERVAL_SECONDS = 2
 IDLE_CHECK_INTERVAL_SECONDS = 10
 HEARTBEAT_INTERVAL_SECONDS = 5 * 60
 
+# --- 采集进程 ---
+# "thread": 追踪器与 HTTP 服务、报告生成共用一个进程；"process": 追踪器运行在独立的精简进程中（capture.py），
+# 事件经管道发回本进程写库，报告生成等重负载不再与键盘回调争抢 GIL。可用环境变量 LEX_CAPTURE_MODE 覆盖
+CAPTURE_MODE = "thread"
+CAPTURE_REQUEST_TIMEOUT_SECONDS = 30  # 等待采集进程完成截图等请求的最长时间
+CAPTURE_STOP_TIMEOUT_SECONDS = 5
+# "native": 真实的截屏、活动窗口与键盘钩子；"stub": 合成数据，供无头环境下的负载测试使用（capture_backends.py）。
+# 可用环境变量 LEX_CAPTURE_BACKEND 覆盖
+CAPTURE_BACKEND = "native"
+STUB_MONITORS = ((0, 0, 1920, 1080),)  # 每个显示器的 (left, top, width, height)
+STUB_KEYS_PER_SECOND = 5  # 0 表示不产生按键
+STUB_WINDOW_SWITCH_SECONDS = 20
+
+# --- 自动截图存储 ---
+# 自动截图按图块与最近的关键帧比较，只保存变化的图块；每 SCREENSHOT_KEYFRAME_INTERVAL 帧、
+# 画面尺寸变化或变化图块超过 SCREENSHOT_DELTA_MAX_CHANGED_RATIO 时重新保存完整关键帧
+SCREENSHOT_DELTA_ENABLED = True
+SCREENSHOT_TILE_SIZE = 128
+SCREENSHOT_KEYFRAME_INTERVAL = 12
+SCREENSHOT_DELTA_MAX_CHANGED_RATIO = 0.5
+SCREENSHOT_CACHE_ENTRIES = 16  # 还原后的 PNG 缓存条数
+
+# --- 分屏截图 ---
+# 开启后全屏截图（自动截图与快捷键截图）逐个显示器截取、并行编码为各自的 PNG，画面未变化的显示器不再保存，
+# 一次截图仍只记录一条事件（monitor_capture.py）。关闭时所有显示器拼接成一张图。区域截图不受影响
+SCREENSHOT_PER_MONITOR = False
+SCREENSHOT_ENCODE_WORKERS = None  # None 表示 min(显示器数, CPU 核数)
+
+# --- 截图保留策略 ---
+# 最近的截图保持原始分辨率；更早的按年龄逐级降采样，超出磁盘预算时从最旧的开始提前降级。截图不会被删除
+RETENTION_ENABLED = True
+SCREENSHOT_DISK_BUDGET_BYTES = 2 * 1024 ** 3
+SCREENSHOT_FULL_RESOLUTION_HOURS = 24
+SCREENSHOT_RETENTION_TIERS = ((7 * 24, 0.5), (30 * 24, 0.25))  # (达到的小时数, 相对原始分辨率的比例)
+RETENTION_CHECK_INTERVAL_SECONDS = 10 * 60
+RETENTION_PAUSE_SECONDS = 0.2  # 每处理一张截图后休眠，降低对前台的影响
+
+# --- 追踪器开销预算 ---
+# 超出预算时逐级降低截图频率/分辨率、放宽键盘聚合窗口、延长窗口轮询，负载回落后再恢复
+GOVERNOR_ENABLED = True
+GOVERNOR_SAMPLE_INTERVAL_SECONDS = 10
+GOVERNOR_CPU_BUDGET_PERCENT = 2.0  # 追踪器线程合计占用单核的百分比
+GOVERNOR_WRITE_BUDGET_BYTES_PER_SECOND = 256 * 1024
+
+# --- 工时汇总配置 ---
+# 工作日 WORKDAY_START_HOUR 之前、OVERTIME_START_HOUR 之后以及周末的活跃时间计为加班
+WORKDAY_START_HOUR = 9
+OVERTIME_START_HOUR = 18
+
+# --- 事件存储编码 ---
+# "json": details 以规范 JSON 文本存储；"msgpack": 紧凑二进制 + 字符串表（需要安装 msgpack）
+# 两种编码可以在同一个库中混存，哈希始终基于规范 JSON 计算
+DETAILS_ENCODING = "json"
+
+# --- 最近事件缓冲 ---
+# 前端日志视图只显示最新的 50 条事件，由内存环形缓冲区直接提供
+RECENT_EVENTS_BUFFER_SIZE = 50
+
+# --- 报告排版 ---
+# 详细活动日志的渲染引擎："flowable" 为每条事件构造 Table/Paragraph；"canvas" 以固定版式直接绘制（log_renderer.py），
+# 事件很多时构建速度快得多
+REPORT_LOG_RENDERER = "flowable"
+
+# --- 报告截图缩略图 ---
+# 报告默认只列出截图路径；开启后（或请求中 embedThumbnails 为 true）内嵌缩小后的 JPEG 缩略图
+REPORT_EMBED_THUMBNAILS = False
+REPORT_THUMBNAIL_MAX_SIZE = (640, 400)  # 像素，保持宽高比缩小到此范围内
+REPORT_THUMBNAIL_JPEG_QUALITY = 70
+REPORT_THUMBNAIL_WORKERS = None  # None 表示按 CPU 数自动选择
+
+# --- 数据库归档配置 ---
+# 在线备份每一步复制的页数，以及两步之间让出写锁的时间，保证追踪器写入不会被长时间阻塞
+ARCHIVE_BACKUP_PAGES_PER_STEP = 256
+ARCHIVE_BACKUP_STEP_PAUSE_SECONDS = 0.005
+# 备份因并发写入而被反复重启的次数上限，超过后持锁一次性完成剩余部分
+ARCHIVE_BACKUP_MAX_RESTARTS = 5
+# 按时间范围导出事件时每批复制的行数；每批持有 db_lock，批与批之间同样让出 ARCHIVE_BACKUP_STEP_PAUSE_SECONDS
+ARCHIVE_EXPORT_ROWS_PER_CHUNK = 2000
+
+# --- HTTP 服务配置 ---
+# "dev": Flask 自带服务器；"production": 分级线程池服务器（server.py）。
+# 打包后的程序默认使用 production，可用环境变量 LEX_SERVER_MODE 覆盖
+SERVER_MODE = None
+# 桌面端固定连接 5001；负载测试可用环境变量 LEX_SERVER_PORT 改用其他端口
+SERVER_PORT = 5001
+# 耗时接口（报告、截图、导出）与轻量接口（状态轮询、事件列表、截图查看等）使用各自的有界线程池，
+# 排队已满时直接返回 503，耗时请求再多也不会占满状态轮询的线程。
+# 截图查看（/api/screenshots/<文件名>）是界面浏览时的逐张请求，且有 PNG 缓存，留在轻量池中，免得被报告生成排在后面
+SERVER_HEAVY_ROUTES = ("/api/generate_report", "/api/take_screenshot", "/api/shortcut_screenshot",
+                       "/api/export", "/api/summary/rebuild")
+SERVER_HEAVY_WORKERS = 2
+SERVER_HEAVY_QUEUE_SIZE = 4
+SERVER_LIGHT_WORKERS = 4
+SERVER_LIGHT_QUEUE_SIZE = 32
+# production 模式下的 GIL 切换间隔（Python 默认 5ms）。报告生成是纯 Python 的 CPU 密集任务，
+# 缩短间隔可以让轻量请求的线程更快拿到 GIL，代价是少量的吞吐下降。
+# 该设置作用于整个进程（包括线程模式下的追踪器线程），只在 server.serve() 启动时设置一次
+SERVER_SWITCH_INTERVAL_SECONDS = 0.001
+# 大于该字节数且客户端接受 gzip 的 JSON 响应会被压缩
+SERVER_GZIP_MIN_BYTES = 1024
+# 报告生成期间 /api/status 的 p99 延迟目标（超过约 250ms 轮询界面就会显得卡顿），由 benchmark.py 的 serving 场景检查
+STATUS_P99_TARGET_SECONDS = 0.25
+
 # --- 文件监控配置 (不变) ---
 WATCHED_DIRECTORIES = []
\ No newline at end of file
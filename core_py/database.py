@@ -1,13 +1,22 @@
 import hashlib
 import json
-from datetime import datetime
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
 import threading
 import traceback
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from collections import deque
+from itertools import islice
+from sqlalchemy import create_engine, func, inspect, text, Column, Integer, String, Text, DateTime, Index, LargeBinary
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 # 【修改】只导入 set_data_paths 函数，不导入变量
-from config import set_data_paths
+from config import set_data_paths, RECENT_EVENTS_BUFFER_SIZE
+from metrics import DB_SAVE_EVENT_SECONDS, DB_EVENTS_SAVED, DB_SAVE_ERRORS
+from details_codec import (canonical_json, encode_compact, decode_compact,
+                           HAS_MSGPACK, ENCODING_JSON, ENCODING_MSGPACK)
 
 Base = declarative_base()
 
@@ -16,14 +25,58 @@ engine = None
 SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 db_lock = threading.Lock()
 
+# 预先取好各阶段的直方图子指标，避免在写入热路径上查找标签
+_SAVE_LOCK_WAIT = DB_SAVE_EVENT_SECONDS.labels("lock_wait")
+_SAVE_HASH = DB_SAVE_EVENT_SECONDS.labels("hash")
+_SAVE_COMMIT = DB_SAVE_EVENT_SECONDS.labels("commit")
+_SAVE_TOTAL = DB_SAVE_EVENT_SECONDS.labels("total")
+
 class Event(Base):
     __tablename__ = "events"
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime, default=datetime.now, index=True)
     event_type = Column(String, index=True)
-    details = Column(Text)
+    details = Column(Text)  # 规范 JSON；采用紧凑编码的行此列为空
+    details_blob = Column(LargeBinary)
+    details_encoding = Column(String(16))  # None 等同于 "json"
     data_hash = Column(String(64), index=True) 
     previous_hash = Column(String(64))
+    # app_session 常用字段的冗余列，仅用于查询与索引；哈希只覆盖 details 原文，不受这些列影响
+    process_name = Column(String, index=True)
+    app_title = Column(String)
+    duration_seconds = Column(Integer)
+
+    __table_args__ = (
+        # 覆盖“某时段内按应用汇总聚焦时长”的查询，无需回表
+        Index("ix_events_app_usage", "event_type", "timestamp", "process_name", "duration_seconds"),
+    )
+
+class InternedString(Base):
+    """紧凑编码使用的字符串表：进程名、窗口标题、路径只存一次"""
+    __tablename__ = "interned_strings"
+    id = Column(Integer, primary_key=True)
+    value = Column(String, unique=True, nullable=False)
+
+# 由 save_event 从 details 中提取、写入冗余列的字段
+SIDE_COLUMN_EVENT_TYPES = {"app_session"}
+SIDE_COLUMNS = {"process_name": String, "app_title": String, "duration_seconds": Integer}
+# 旧版本数据库需要通过 ALTER TABLE 补齐的列
+ADDED_COLUMNS = {"process_name": "VARCHAR", "app_title": "VARCHAR", "duration_seconds": "INTEGER",
+                 "details_blob": "BLOB", "details_encoding": "VARCHAR(16)"}
+
+def _side_columns(event_type: str, details: dict) -> dict:
+    if event_type not in SIDE_COLUMN_EVENT_TYPES: return {}
+    return {name: details.get(name) for name in SIDE_COLUMNS}
+
+class ActivityMinute(Base):
+    """按分钟汇总的活动数据，与事件在同一事务中增量维护，可随时由哈希链重建"""
+    __tablename__ = "activity_minutes"
+    minute = Column(DateTime, primary_key=True)
+    state = Column(String(8))  # "active" / "idle"，None 表示该分钟内没有能判断状态的事件
+    event_count = Column(Integer, nullable=False, default=0)
+    keystrokes = Column(Integer, nullable=False, default=0)
+    screenshots = Column(Integer, nullable=False, default=0)
+    process_name = Column(String)  # 该分钟内的前台进程
 
 def init_db():
     """
@@ -43,14 +96,91 @@ def init_db():
         print(f"[DB] Engine created and SessionLocal configured for: {DATABASE_URL}")
 
     Base.metadata.create_all(bind=engine)
+    _migrate_schema()
+    search_index_created = _ensure_search_index()
     print("[DB] Database tables checked/created.")
 
+    # 旧版本创建的数据库没有分钟汇总与全文索引，首次启动时从哈希链补建
+    with SessionLocal() as db:
+        has_events = db.query(Event.id).first() is not None
+        needs_rollup = has_events and db.query(ActivityMinute.minute).first() is None
+    if needs_rollup:
+        from rollup import rebuild
+        rebuild()
+    if search_index_created and has_events:
+        from search import rebuild_index
+        rebuild_index()
+    warm_recent_events()
+
+# --- 全文检索索引（FTS5），不属于 SQLAlchemy 元数据，需要手动建表/删表 ---
+SEARCH_TABLE = "event_search"
+# 索引是否使用 trigram 分词器；在建库/清库时由 _ensure_search_index 确定，检索时不必再查询 sqlite_master
+search_uses_trigram = False
+
+def _ensure_search_index() -> bool:
+    """创建 FTS5 虚表；优先使用 trigram 分词器以支持中文子串检索。返回是否为新建"""
+    global search_uses_trigram
+    with engine.begin() as conn:
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = :name"), {"name": SEARCH_TABLE}).scalar()
+        if sql:
+            search_uses_trigram = "trigram" in sql
+            return False
+        try:
+            conn.execute(text(f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(body, event_type UNINDEXED, tokenize='trigram')"))
+            search_uses_trigram = True
+        except Exception:
+            # SQLite 3.34 之前没有 trigram 分词器
+            conn.execute(text(f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(body, event_type UNINDEXED)"))
+            search_uses_trigram = False
+    return True
+
+def _searchable_text(event_type: str, details: dict):
+    """提取一条事件中可供检索的文本：窗口标题、文件路径、截图文件名"""
+    if event_type == "app_session":
+        return " ".join(filter(None, [details.get("process_name"), details.get("app_title")])) or None
+    if event_type.startswith("file_"):
+        return " ".join(filter(None, [details.get("path"), details.get("from_path"), details.get("to_path")])) or None
+    if event_type.startswith("screenshot_"):
+        if "monitors" in details:
+            return " ".join(m["filename"] for m in details["monitors"] if m.get("filename")) or None
+        return details.get("filename")
+    return None
+
+_search_insert = text(f"INSERT INTO {SEARCH_TABLE} (rowid, body, event_type) VALUES (:id, :body, :event_type)")
+
+def _index_for_search(db, rows):
+    params = []
+    for event_id, timestamp, event_type, details in rows:
+        body = _searchable_text(event_type, details)
+        if body: params.append({"id": event_id, "body": body, "event_type": event_type})
+    if params: db.execute(_search_insert, params)
+
+def _migrate_schema():
+    """为旧版本创建的 events 表补齐冗余列与索引，并从 details 回填"""
+    existing = {c["name"] for c in inspect(engine).get_columns("events")}
+    missing = [name for name in ADDED_COLUMNS if name not in existing]
+    with engine.begin() as conn:
+        for name in missing:
+            conn.execute(text(f"ALTER TABLE events ADD COLUMN {name} {ADDED_COLUMNS[name]}"))
+        if any(name in SIDE_COLUMNS for name in missing):
+            types = ", ".join(f"'{t}'" for t in SIDE_COLUMN_EVENT_TYPES)
+            assignments = ", ".join(f"{name} = json_extract(details, '$.{name}')" for name in SIDE_COLUMNS)
+            result = conn.execute(text(f"UPDATE events SET {assignments} WHERE event_type IN ({types}) AND json_valid(details)"))
+            print(f"[DB] Added columns {missing} to events and backfilled {result.rowcount} rows.")
+        for index in Event.__table__.indexes:
+            index.create(bind=conn, checkfirst=True)
+
 def clear_db():
     """删除所有事件并重新创建表"""
     with db_lock:
         if engine:
             Base.metadata.drop_all(bind=engine)
+            _interner.reset()
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
             Base.metadata.create_all(bind=engine)
+            _ensure_search_index()
+            _recent_events.reset()
             print("[DB] Database cleared.")
 
 def get_last_hash():
@@ -60,57 +190,318 @@ def get_last_hash():
         last_event = db.query(Event).order_by(Event.id.desc()).first()
         return last_event.data_hash if last_event else "0" * 64
 
-def _format_event_for_frontend(event_obj):
-    details = {}
-    try:
-        if event_obj.details:
-            details = json.loads(event_obj.details)
-    except json.JSONDecodeError:
-        details = {"error": "invalid_json_data", "original_text": event_obj.details}
-    
-    if event_obj.event_type.startswith("screenshot_") and "filename" in details:
+class _StringInterner:
+    """字符串表的进程内缓存。写入方在持有 db_lock 时调用 intern，任何线程都可以 lookup"""
+    def __init__(self):
+        self._ids = {}; self._values = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._ids.clear(); self._values.clear()
+
+    def intern(self, db, value: str) -> int:
+        string_id = self._ids.get(value)
+        if string_id is not None: return string_id
+        string_id = db.query(InternedString.id).filter(InternedString.value == value).scalar()
+        if string_id is None:
+            row = InternedString(value=value); db.add(row); db.flush(); string_id = row.id
+        with self._lock:
+            self._ids[value] = string_id; self._values[string_id] = value
+        return string_id
+
+    def lookup(self, string_id: int, db=None) -> str:
+        value = self._values.get(string_id)
+        if value is not None: return value
+        def load(session): return session.query(InternedString.value).filter(InternedString.id == string_id).scalar()
+        if db is not None: value = load(db)
+        else:
+            with SessionLocal() as session: value = load(session)
+        if value is None: raise ValueError(f"Interned string {string_id} not found")
+        with self._lock:
+            self._values[string_id] = value; self._ids.setdefault(value, string_id)
+        return value
+
+_interner = _StringInterner()
+
+def _encode_details_columns(db, details: dict, details_json: str) -> dict:
+    """
+    按 config.DETAILS_ENCODING 选择存储形式，返回要写入 Event 的列。
+    紧凑编码会当场解码一次，只有还原出的规范 JSON 与 details_json 完全一致时才采用，
+    否则（例如超出 msgpack 范围的整数）该行退回 JSON 存储，保证哈希链始终可验证。
+    """
+    from config import DETAILS_ENCODING
+    if DETAILS_ENCODING == ENCODING_MSGPACK and HAS_MSGPACK:
+        try:
+            blob = encode_compact(details, lambda value: _interner.intern(db, value))
+            if canonical_json(decode_compact(blob, lambda i: _interner.lookup(i, db))) == details_json:
+                return {"details": None, "details_blob": blob, "details_encoding": ENCODING_MSGPACK}
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return {"details": details_json}
+
+def load_details(event_obj, db=None) -> dict:
+    """读取任意编码的 details；数据损坏时抛出 ValueError"""
+    if event_obj.details_encoding == ENCODING_MSGPACK:
+        if not HAS_MSGPACK: raise ValueError("msgpack is required to read compact details")
+        return decode_compact(event_obj.details_blob, lambda i: _interner.lookup(i, db))
+    return json.loads(event_obj.details) if event_obj.details else {}
+
+def canonical_details_json(event_obj, db=None) -> str:
+    """返回参与哈希计算的 details 文本"""
+    if event_obj.details_encoding in (None, ENCODING_JSON):
+        return event_obj.details or ""
+    return canonical_json(load_details(event_obj, db))
+
+def _frontend_event(event_id, timestamp, event_type, details, data_hash, previous_hash):
+    """details 会被就地补充 filepath，调用方需传入自己持有的 dict"""
+    if event_type.startswith("screenshot_") and "filename" in details:
         # 【修改】动态导入，因为 config 在运行时才被完全设置
         from config import SCREENSHOT_DIR
         if SCREENSHOT_DIR:
              details['filepath'] = str(SCREENSHOT_DIR / details['filename'])
+    elif event_type.startswith("screenshot_") and "monitors" in details:
+        # 分屏截图：每个写入了文件的显示器各自带上 filepath
+        from config import SCREENSHOT_DIR
+        if SCREENSHOT_DIR:
+            for monitor in details["monitors"]:
+                if monitor.get("filename"): monitor['filepath'] = str(SCREENSHOT_DIR / monitor['filename'])
 
     return {
-        "id": event_obj.id,
-        "timestamp": event_obj.timestamp.isoformat(),
-        "event_type": event_obj.event_type,
+        "id": event_id,
+        "timestamp": timestamp.isoformat(),
+        "event_type": event_type,
         "details": details,
-        "hash": event_obj.data_hash,
-        "prev_hash": event_obj.previous_hash
+        "hash": data_hash,
+        "prev_hash": previous_hash
     }
 
-def save_event(event_type: str, details: dict):
+# 无法解码的紧凑编码 details 在诊断信息中最多给出的字节数
+UNDECODABLE_BLOB_PREVIEW_BYTES = 64
+
+def undecodable_details(event_obj, error: Exception) -> dict:
+    """
+    details 无法解码时展示给前端与导出文件的诊断信息。
+    紧凑编码的行 details 列为空、数据在 details_blob 中，此时给出编码、长度与开头部分的十六进制。
+    """
+    reason = str(error) or type(error).__name__
+    if event_obj.details or event_obj.details_blob is None:
+        return {"error": "invalid_json_data", "original_text": event_obj.details, "reason": reason}
+    blob = bytes(event_obj.details_blob)
+    return {"error": "invalid_compact_data", "details_encoding": event_obj.details_encoding,
+            "blob_length": len(blob), "blob_hex": blob[:UNDECODABLE_BLOB_PREVIEW_BYTES].hex(),
+            "blob_truncated": len(blob) > UNDECODABLE_BLOB_PREVIEW_BYTES, "reason": reason}
+
+def _format_event_for_frontend(event_obj):
+    try:
+        details = load_details(event_obj)
+    except ValueError as e:
+        details = undecodable_details(event_obj, e)
+    return _frontend_event(event_obj.id, event_obj.timestamp, event_obj.event_type, details,
+                           event_obj.data_hash, event_obj.previous_hash)
+
+class _RecentEvents:
+    """
+    最近事件的环形缓冲区，保存已格式化好的前端事件。
+    save_event 在提交成功后压入，/api/events 直接读取，稳定状态下不需要查库和解码。
+    返回的 dict 由所有读者共享，不得修改。
+    """
+    def __init__(self, capacity: int):
+        self._events = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.warm = False
+
+    @property
+    def capacity(self) -> int:
+        return self._events.maxlen
+
+    def push(self, event: dict):
+        with self._lock:
+            self._events.append(event)
+
+    def reset(self, events=()):
+        """events 按 id 升序给出"""
+        with self._lock:
+            self._events.clear()
+            self._events.extend(events)
+            self.warm = True
+
+    def newest(self, limit: int) -> list:
+        with self._lock:
+            return list(islice(reversed(self._events), limit))
+
+_recent_events = _RecentEvents(RECENT_EVENTS_BUFFER_SIZE)
+
+def warm_recent_events():
+    """从库中重新载入最近的事件；绕过 save_event 的批量写入之后也需要调用"""
+    if not engine: return
+    with SessionLocal() as db:
+        events = db.query(Event).order_by(Event.id.desc()).limit(_recent_events.capacity).all()
+        _recent_events.reset([_format_event_for_frontend(e) for e in reversed(events)])
+
+def _compute_hash(previous_hash: str, timestamp: datetime, event_type: str, details_json: str) -> str:
+    """哈希链的唯一定义：写入与校验都必须经过这里"""
+    data_to_hash_str = f"{previous_hash}{timestamp.isoformat()}{event_type}{details_json}"
+    return hashlib.sha256(data_to_hash_str.encode('utf-8')).hexdigest()
+
+# 不代表用户状态的事件类型，只计入事件数
+_NEUTRAL_EVENT_TYPES = {"environment_snapshot", "governor_throttle", "retention_downsample"}
+
+def _minute_of(ts: datetime) -> datetime:
+    return ts.replace(second=0, microsecond=0)
+
+def _rollup_contributions(timestamp: datetime, event_type: str, details: dict):
+    """把一条事件拆解为若干分钟桶上的增量"""
+    minute = _minute_of(timestamp)
+    # state_is_fill 为真的状态只在该分钟还没有状态时补位，不覆盖已有的状态（见 _flush_rollup）
+    contribution = {"minute": minute, "event_count": 1, "keystrokes": 0, "screenshots": 0,
+                    "state": None if event_type in _NEUTRAL_EVENT_TYPES else "active", "state_is_fill": False,
+                    "process_name": None}
+    if event_type == "status_change":
+        contribution["state"] = "idle" if details.get("status") == "idle" else "active"
+    elif event_type == "keyboard_press":
+        contribution["keystrokes"] = details.get("count", 1)
+    elif event_type.startswith("screenshot_"):
+        contribution["screenshots"] = 1
+    contributions = [contribution]
+
+    if event_type == "app_session":
+        # 应用会话在结束时才写入，需要回填它覆盖的每一分钟的前台进程。
+        # 进入空闲时 status_change idle 先写入，下一次窗口轮询才结束会话，因此会话对状态只做补位，
+        # 否则空闲的那一分钟会被改回 active
+        contribution["state_is_fill"] = True
+        try:
+            current = _minute_of(datetime.fromisoformat(details["start_time"]))
+            end = _minute_of(datetime.fromisoformat(details["end_time"]))
+        except (KeyError, TypeError, ValueError):
+            current = end = minute
+        while current <= end:
+            if current == minute:
+                contribution["process_name"] = details.get("process_name")
+            else:
+                contributions.append({"minute": current, "event_count": 0, "keystrokes": 0, "screenshots": 0,
+                                      "state": "active", "state_is_fill": True, "process_name": details.get("process_name")})
+            current += timedelta(minutes=1)
+    return contributions
+
+def _merge_rollup(acc: dict, timestamp: datetime, event_type: str, details: dict):
+    """把一条事件的增量合并进按分钟索引的累加器，结果与逐条 upsert 完全一致"""
+    for c in _rollup_contributions(timestamp, event_type, details):
+        existing = acc.get(c["minute"])
+        if existing is None:
+            acc[c["minute"]] = c
+            continue
+        existing["event_count"] += c["event_count"]
+        existing["keystrokes"] += c["keystrokes"]
+        existing["screenshots"] += c["screenshots"]
+        if c["state"] is not None and (not c["state_is_fill"] or existing["state"] is None):
+            existing["state"], existing["state_is_fill"] = c["state"], c["state_is_fill"]
+        if c["process_name"] is not None: existing["process_name"] = c["process_name"]
+
+_rollup_upserts = None
+
+def _flush_rollup(db, acc: dict):
+    """写入累加器；只有补位状态的分钟用另一条语句，保留表中已有的状态"""
+    global _rollup_upserts
+    if not acc: return
+    if _rollup_upserts is None:
+        table = ActivityMinute.__table__
+        stmt = sqlite_insert(table)
+        def upsert(state):
+            return stmt.on_conflict_do_update(index_elements=[table.c.minute], set_={
+                "event_count": table.c.event_count + stmt.excluded.event_count,
+                "keystrokes": table.c.keystrokes + stmt.excluded.keystrokes,
+                "screenshots": table.c.screenshots + stmt.excluded.screenshots,
+                "state": state,
+                "process_name": func.coalesce(stmt.excluded.process_name, table.c.process_name),
+            })
+        _rollup_upserts = (upsert(func.coalesce(stmt.excluded.state, table.c.state)),
+                           upsert(func.coalesce(table.c.state, stmt.excluded.state)))
+    rows = ([], [])
+    for c in acc.values():
+        rows[c["state_is_fill"]].append({k: v for k, v in c.items() if k != "state_is_fill"})
+    for upsert, params in zip(_rollup_upserts, rows):
+        if params: db.execute(upsert, params)
+
+def _update_derived_tables_bulk(db, rows):
+    """
+    在与事件相同的事务中维护所有派生表；任何一步失败都会随事件一起回滚。
+    rows 为按 id 递增的 (event_id, timestamp, event_type, details) 序列。
+    """
+    rollup = {}
+    for event_id, timestamp, event_type, details in rows:
+        _merge_rollup(rollup, timestamp, event_type, details)
+    _flush_rollup(db, rollup)
+    _index_for_search(db, rows)
+
+def _update_derived_tables(db, event_id: int, timestamp: datetime, event_type: str, details: dict):
+    _update_derived_tables_bulk(db, [(event_id, timestamp, event_type, details)])
+
+def save_event(event_type: str, details: dict, timestamp: datetime = None):
+    """
+    timestamp 为事件发生的时间，由采集端在事件源处记录；省略时取写入时刻。
+    返回新事件的 data_hash；数据库未初始化或写入失败（已回滚）时返回 None。
+    """
+    return save_events([(event_type, details)], timestamp)
+
+def save_events(items, timestamp: datetime = None):
+    """
+    在同一事务中按顺序写入多条事件 [(event_type, details), ...]，要么全部进入哈希链，要么全部回滚。
+    返回最后一条事件的 data_hash，失败时返回 None。
+    """
     if not engine:
         print("[DB WARNING] save_event called before DB initialization. Ignoring.")
-        return
+        return None
+    started = time.perf_counter()
+    data_hash = None
     with db_lock:
+        locked = time.perf_counter()
+        _SAVE_LOCK_WAIT.observe(locked - started)
         with SessionLocal() as db:
             try:
-                details_json = json.dumps(details, sort_keys=True, ensure_ascii=False)
-                timestamp = datetime.now()
+                timestamp = timestamp or datetime.now()
                 # 【修改】调用 get_last_hash 前，db 必须已经配置好
                 previous_hash = get_last_hash()
-                
-                data_to_hash_str = f"{previous_hash}{timestamp.isoformat()}{event_type}{details_json}"
-                data_hash = hashlib.sha256(data_to_hash_str.encode('utf-8')).hexdigest()
-                
-                new_event = Event(
-                    timestamp=timestamp, event_type=event_type, details=details_json,
-                    data_hash=data_hash, previous_hash=previous_hash
-                )
-                db.add(new_event)
+                saved = []
+                for event_type, details in items:
+                    details_json = canonical_json(details)
+                    hash_started = time.perf_counter()
+                    event_hash = _compute_hash(previous_hash, timestamp, event_type, details_json)
+                    _SAVE_HASH.observe(time.perf_counter() - hash_started)
+
+                    new_event = Event(
+                        timestamp=timestamp, event_type=event_type,
+                        data_hash=event_hash, previous_hash=previous_hash,
+                        **_encode_details_columns(db, details, details_json), **_side_columns(event_type, details)
+                    )
+                    db.add(new_event)
+                    db.flush()
+                    _update_derived_tables(db, new_event.id, timestamp, event_type, details)
+                    saved.append((new_event.id, event_type, details_json, event_hash, previous_hash))
+                    previous_hash = event_hash
+                commit_started = time.perf_counter()
                 db.commit()
+                _SAVE_COMMIT.observe(time.perf_counter() - commit_started)
+                for event_id, event_type, details_json, event_hash, event_previous_hash in saved:
+                    DB_EVENTS_SAVED.labels(event_type).inc()
+                    # 仍在 db_lock 内压入，保证缓冲区顺序与 id 顺序一致；details 取自规范 JSON，与从库中读出的完全相同
+                    _recent_events.push(_frontend_event(event_id, timestamp, event_type, json.loads(details_json),
+                                                        event_hash, event_previous_hash))
+                data_hash = previous_hash
             except Exception as e:
                 print(f"[DATABASE CRITICAL ERROR] in save_event: {e}")
                 traceback.print_exc()
                 db.rollback()
+                # 回滚可能撤销了刚写入字符串表的行，清空缓存让后续按库中实际内容重新加载
+                _interner.reset()
+                DB_SAVE_ERRORS.inc()
+    _SAVE_TOTAL.observe(time.perf_counter() - started)
+    return data_hash
 
 def get_recent_events(limit=50):
     if not engine: return []
+    if _recent_events.warm and limit <= _recent_events.capacity:
+        return _recent_events.newest(limit)
     with SessionLocal() as db:
         try:
             events = db.query(Event).order_by(Event.id.desc()).limit(limit).all()
@@ -118,4 +509,181 @@ def get_recent_events(limit=50):
         except Exception as e:
             print(f"[DATABASE CRITICAL ERROR] in get_recent_events: {e}")
             traceback.print_exc()
-            return []
\ No newline at end of file
+            return []
+
+def verify_chain(start: datetime = None, end: datetime = None, batch_size: int = 5000):
+    """
+    重新计算并校验哈希链。可选地只校验 [start, end] 范围内的事件；
+    此时范围内第一条事件的 previous_hash 不与库中前序事件比对（由调用方提供上下文）。
+    返回 {"ok": bool, "checked": int, "first_bad_id": int | None, "reason": str | None}
+    """
+    result = {"ok": True, "checked": 0, "first_bad_id": None, "reason": None}
+    if not engine: return result
+    with SessionLocal() as db:
+        query = db.query(Event.id, Event.timestamp, Event.event_type, Event.details,
+                         Event.details_blob, Event.details_encoding, Event.data_hash, Event.previous_hash)
+        if start is not None: query = query.filter(Event.timestamp >= start)
+        if end is not None: query = query.filter(Event.timestamp <= end)
+        expected_prev = "0" * 64 if start is None and end is None else None
+        for row in query.order_by(Event.id.asc()).yield_per(batch_size):
+            if expected_prev is not None and row.previous_hash != expected_prev:
+                result.update(ok=False, first_bad_id=row.id, reason="previous_hash_mismatch")
+                break
+            try:
+                details_json = canonical_details_json(row)
+            except ValueError:
+                result.update(ok=False, first_bad_id=row.id, reason="undecodable_details")
+                break
+            if _compute_hash(row.previous_hash, row.timestamp, row.event_type, details_json) != row.data_hash:
+                result.update(ok=False, first_bad_id=row.id, reason="data_hash_mismatch")
+                break
+            expected_prev = row.data_hash
+            result["checked"] += 1
+    return result
+
+def get_app_usage(start: datetime = None, end: datetime = None, limit: int = 20, by_title: bool = False):
+    """按应用（或应用+窗口标题）汇总聚焦时长，聚合完全在 SQLite 中完成"""
+    if not engine: return []
+    group_columns = [Event.process_name, Event.app_title] if by_title else [Event.process_name]
+    total = func.sum(Event.duration_seconds).label("total_seconds")
+    with SessionLocal() as db:
+        query = db.query(*group_columns, total, func.count(Event.id).label("sessions")).filter(Event.event_type == "app_session")
+        if start is not None: query = query.filter(Event.timestamp >= start)
+        if end is not None: query = query.filter(Event.timestamp <= end)
+        rows = query.group_by(*group_columns).order_by(total.desc()).limit(limit).all()
+    return [dict(row._mapping) for row in rows]
+
+def iter_events(start: datetime = None, end: datetime = None, batch_size: int = 1000, db=None):
+    """
+    按 id 顺序逐批产出事件，内存占用与范围大小无关。
+    每一批都是一次独立的短查询（按 id 键集分页），不会长时间占用读事务而阻塞追踪器写入；
+    迭代开始时固定 id 上界，之后新写入的事件不会混入。
+    调用方若已在某个会话中持有写事务（如重建派生表），必须传入该会话，否则另开的连接会被自己的写锁挡住。
+    """
+    if not engine: return
+    def run(fn):
+        if db is not None: return fn(db)
+        with SessionLocal() as session: return fn(session)
+    upper_id = run(lambda session: session.query(func.max(Event.id)).scalar())
+    if upper_id is None: return
+    last_id = 0
+    while True:
+        def fetch(session):
+            query = session.query(Event).filter(Event.id > last_id, Event.id <= upper_id)
+            if start is not None: query = query.filter(Event.timestamp >= start)
+            if end is not None: query = query.filter(Event.timestamp <= end)
+            return query.order_by(Event.id.asc()).limit(batch_size).all()
+        batch = run(fetch)
+        if not batch: return
+        yield from batch
+        last_id = batch[-1].id
+
+def _sqlite_timestamp(dt: datetime) -> str:
+    """与 SQLAlchemy 在 SQLite 中存储 DateTime 的文本格式保持一致，便于原生 SQL 做范围比较"""
+    return dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def backup_db(dest_path):
+    """
+    通过 SQLite 在线备份 API 生成数据库的一致性快照。
+    备份按页分步进行，每一步都持有 db_lock，步与步之间释放锁让追踪器写入，
+    因此写入方最多只会被阻塞一个步长。若并发写入导致备份反复重启，
+    超过 ARCHIVE_BACKUP_MAX_RESTARTS 次后持锁一次性完成剩余部分，保证一定能结束。
+    """
+    from config import (DATABASE_PATH, ARCHIVE_BACKUP_PAGES_PER_STEP,
+                        ARCHIVE_BACKUP_STEP_PAUSE_SECONDS, ARCHIVE_BACKUP_MAX_RESTARTS)
+    if DATABASE_PATH is None:
+        raise ValueError("DATABASE_PATH is not set. Please call config.set_data_paths() first.")
+
+    dest_path = Path(dest_path)
+    if dest_path.exists(): dest_path.unlink()
+
+    state = {"last_remaining": None, "restarts": 0, "holding_to_end": False}
+
+    def _progress(status, remaining, total):
+        if state["last_remaining"] is not None and remaining > state["last_remaining"]:
+            state["restarts"] += 1
+        state["last_remaining"] = remaining
+        if state["holding_to_end"] or remaining == 0:
+            return
+        if state["restarts"] >= ARCHIVE_BACKUP_MAX_RESTARTS:
+            # 写入过于频繁，放弃让步，持锁直到备份完成
+            state["holding_to_end"] = True
+            return
+        db_lock.release()
+        try:
+            time.sleep(ARCHIVE_BACKUP_STEP_PAUSE_SECONDS)
+        finally:
+            db_lock.acquire()
+
+    src = sqlite3.connect(str(DATABASE_PATH), check_same_thread=False)
+    dst = sqlite3.connect(str(dest_path))
+    try:
+        with db_lock:
+            src.backup(dst, pages=ARCHIVE_BACKUP_PAGES_PER_STEP, progress=_progress)
+    finally:
+        dst.close()
+        src.close()
+    print(f"[DB] Online backup written to {dest_path} (restarts: {state['restarts']}).")
+    return str(dest_path)
+
+def export_event_range(dest_path, start: datetime, end: datetime):
+    """
+    只导出 [start, end] 范围内的事件到一个新的 SQLite 文件，并额外带上范围之前的一条事件，
+    使得范围内第一条事件的 previous_hash 可以在归档中得到验证。
+    与 backup_db 一样按 id 分批复制，每批持有 db_lock，批与批之间释放锁让追踪器写入，
+    写入方最多只会被阻塞一批。事件只追加、不修改，开始时确定的 id 范围就是一致的快照。
+    返回导出的事件条数（含链上下文）。
+    """
+    from config import DATABASE_PATH, ARCHIVE_EXPORT_ROWS_PER_CHUNK, ARCHIVE_BACKUP_STEP_PAUSE_SECONDS
+    if DATABASE_PATH is None:
+        raise ValueError("DATABASE_PATH is not set. Please call config.set_data_paths() first.")
+
+    dest_path = Path(dest_path)
+    if dest_path.exists(): dest_path.unlink()
+
+    # 先在目标文件中建立与主库相同的表结构
+    dest_engine = create_engine(f"sqlite:///{dest_path}")
+    try:
+        Base.metadata.create_all(bind=dest_engine)
+    finally:
+        dest_engine.dispose()
+
+    conn = sqlite3.connect(str(DATABASE_PATH), isolation_level=None, check_same_thread=False)
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (str(dest_path),))
+        with db_lock:
+            first_id, last_id = conn.execute(
+                "SELECT MIN(id), MAX(id) FROM main.events WHERE timestamp >= ? AND timestamp <= ?",
+                (_sqlite_timestamp(start), _sqlite_timestamp(end))
+            ).fetchone()
+            if first_id is not None:
+                context_row = conn.execute("SELECT MAX(id) FROM main.events WHERE id < ?", (first_id,)).fetchone()
+                first_id = context_row[0] if context_row[0] is not None else first_id
+        copied = 0
+        if first_id is not None:
+            columns = ", ".join(c.name for c in Event.__table__.columns)
+            after_id = first_id - 1
+            while after_id < last_id:
+                with db_lock:
+                    conn.execute("BEGIN")
+                    try:
+                        cursor = conn.execute(
+                            f"INSERT INTO archive.events ({columns}) SELECT {columns} FROM main.events "
+                            "WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                            (after_id, last_id, ARCHIVE_EXPORT_ROWS_PER_CHUNK)
+                        )
+                        copied += cursor.rowcount
+                        after_id = conn.execute("SELECT MAX(id) FROM archive.events").fetchone()[0] or last_id
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+                time.sleep(ARCHIVE_BACKUP_STEP_PAUSE_SECONDS)
+            # 紧凑编码的行依赖字符串表，整表带上（体量很小，只增不改，最后复制即可覆盖已导出行用到的字符串）
+            with db_lock:
+                conn.execute("INSERT INTO archive.interned_strings SELECT * FROM main.interned_strings")
+        conn.execute("DETACH DATABASE archive")
+    finally:
+        conn.close()
+    print(f"[DB] Exported {copied} events (with chain context) to {dest_path}.")
+    return copied
@@ -0,0 +1,52 @@
+# core_py/details_codec.py
+"""
+事件 details 的编码。
+
+哈希链的规范形式始终是 canonical_json()：按键排序、不转义非 ASCII 字符、默认分隔符的 JSON 文本。
+紧凑编码（msgpack）只是一种存储形式：高频重复的字符串（进程名、窗口标题、路径）被替换为
+字符串表中的编号，读取时还原为同一个 dict，再由 canonical_json() 得到与写入时完全相同的哈希输入。
+"""
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError as e:
+    msgpack = None
+    HAS_MSGPACK = False
+    print(f"[DETAILS_CODEC_WARN] msgpack is not available: {e}. Compact details encoding is disabled.")
+
+import json
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+# 需要进入字符串表的字段：取值高度重复，且通常较长
+INTERNED_KEYS = frozenset({"process_name", "app_title", "exe_path", "path", "from_path", "to_path"})
+_EXT_INTERNED = 1
+
+
+def canonical_json(details: dict) -> str:
+    """哈希链的规范形式，写入与校验都必须使用它"""
+    return json.dumps(details, sort_keys=True, ensure_ascii=False)
+
+
+def _pack_value(key, value, intern):
+    if key in INTERNED_KEYS and isinstance(value, str):
+        return msgpack.ExtType(_EXT_INTERNED, intern(value).to_bytes(4, "big"))
+    if isinstance(value, dict):
+        return {k: _pack_value(k, value[k], intern) for k in sorted(value)}
+    return value
+
+
+def encode_compact(details: dict, intern) -> bytes:
+    """intern(str) -> int 负责把字符串放入字符串表并返回编号"""
+    return msgpack.packb({k: _pack_value(k, details[k], intern) for k in sorted(details)}, use_bin_type=True)
+
+
+def decode_compact(blob: bytes, lookup) -> dict:
+    """lookup(int) -> str 负责从字符串表取回字符串"""
+    def ext_hook(code, data):
+        if code == _EXT_INTERNED:
+            return lookup(int.from_bytes(data, "big"))
+        return msgpack.ExtType(code, data)
+    return msgpack.unpackb(blob, ext_hook=ext_hook, raw=False, strict_map_key=False)
@@ -0,0 +1,120 @@
+# core_py/exporter.py
+"""
+流式导出证据事件（NDJSON / CSV），可选 gzip 压缩。
+
+事件从数据库逐批读出后立即编码并产出，内存占用恒定；导出过程中同步校验哈希链，
+并在末尾附加一份校验清单（manifest），包含条数、首尾哈希、链校验结果和导出内容本身的 SHA-256。
+"""
+
+import csv
+import hashlib
+import io
+import json
+import zlib
+from datetime import datetime
+
+from database import iter_events, load_details, canonical_details_json, undecodable_details, _compute_hash
+from details_codec import canonical_json
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CSV_COLUMNS = ["id", "timestamp", "event_type", "details", "data_hash", "previous_hash"]
+HASH_INPUT_DESCRIPTION = ("sha256(previous_hash + timestamp.isoformat() + event_type + "
+                          "json.dumps(details, sort_keys=True, ensure_ascii=False))")
+
+
+class _ChainChecker:
+    """在流式导出中逐条校验哈希链，只保留上一条的哈希"""
+    def __init__(self):
+        self.count = 0
+        self.first_id = self.last_id = None
+        self.first_previous_hash = self.last_hash = None
+        self.ok = True
+        self.first_bad_id = None
+
+    def check(self, event):
+        if self.count == 0:
+            self.first_id, self.first_previous_hash = event.id, event.previous_hash
+        elif self.ok and event.previous_hash != self.last_hash:
+            self.ok, self.first_bad_id = False, event.id
+        if self.ok:
+            try:
+                details_json = canonical_details_json(event)
+            except ValueError:
+                details_json = None
+            if details_json is None or _compute_hash(event.previous_hash, event.timestamp, event.event_type, details_json) != event.data_hash:
+                self.ok, self.first_bad_id = False, event.id
+        self.count += 1
+        self.last_id, self.last_hash = event.id, event.data_hash
+
+
+def _event_fields(event):
+    try:
+        details = load_details(event)
+    except ValueError as e:
+        details = undecodable_details(event, e)
+    return event.id, event.timestamp.isoformat(), event.event_type, details, event.data_hash, event.previous_hash
+
+
+def _encode_ndjson(rows):
+    return "".join(json.dumps({
+        "id": id_, "timestamp": ts, "event_type": et, "details": details,
+        "data_hash": data_hash, "previous_hash": previous_hash,
+    }, ensure_ascii=False) + "\n" for id_, ts, et, details, data_hash, previous_hash in rows)
+
+
+def _encode_csv(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header: writer.writerow(CSV_COLUMNS)
+    for id_, ts, et, details, data_hash, previous_hash in rows:
+        writer.writerow([id_, ts, et, canonical_json(details), data_hash, previous_hash])
+    return buffer.getvalue()
+
+
+def stream_export(fmt: str, start: datetime = None, end: datetime = None, compress: bool = False, batch_size: int = 1000):
+    """产出导出内容的字节块；compress=True 时产出的是一个完整的 gzip 流"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    content_hash = hashlib.sha256()
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    checker = _ChainChecker()
+
+    def emit(text):
+        data = text.encode("utf-8")
+        content_hash.update(data)
+        return compressor.compress(data) if compressor else data
+
+    if fmt == "csv":
+        chunk = emit(_encode_csv([], header=True))
+        if chunk: yield chunk
+
+    rows = []
+    for event in iter_events(start, end, batch_size):
+        checker.check(event)
+        rows.append(_event_fields(event))
+        if len(rows) >= batch_size:
+            chunk = emit(_encode_ndjson(rows) if fmt == "ndjson" else _encode_csv(rows))
+            rows = []
+            if chunk: yield chunk
+    if rows:
+        chunk = emit(_encode_ndjson(rows) if fmt == "ndjson" else _encode_csv(rows))
+        if chunk: yield chunk
+
+    manifest = {
+        "format": fmt, "exported_at": datetime.now().isoformat(),
+        "range": {"start": start.isoformat() if start else None, "end": end.isoformat() if end else None},
+        "event_count": checker.count, "first_id": checker.first_id, "last_id": checker.last_id,
+        "first_previous_hash": checker.first_previous_hash, "last_hash": checker.last_hash,
+        "chain_verified": checker.ok, "first_bad_id": checker.first_bad_id,
+        "hash_algorithm": "sha256", "hash_input": HASH_INPUT_DESCRIPTION,
+        # 清单之前全部导出内容（未压缩）的摘要
+        "content_sha256": content_hash.hexdigest(),
+    }
+    if fmt == "ndjson":
+        tail = json.dumps({"manifest": manifest}, ensure_ascii=False) + "\n"
+    else:
+        tail = _encode_csv([("", "", "export_manifest", manifest, "", "")])
+    chunk = emit(tail)
+    if chunk: yield chunk
+    if compressor: yield compressor.flush()
@@ -0,0 +1,158 @@
+# core_py/governor.py
+"""
+追踪器自身开销的调节器。
+
+追踪器的各个线程定期上报自己的 CPU 时间，写盘量（事件与截图）也在写入处累计。
+只有追踪器登记过的线程计入 CPU 开销：HTTP 工作线程等外部线程也会调用追踪器的方法，
+它们的上报被忽略；已退出线程的记录在采样时清除。
+调节器按固定周期采样，若平滑后的 CPU 占用或写入速率超出预算，就逐级降低截图频率与分辨率、
+放宽键盘事件的聚合窗口、延长窗口轮询间隔；负载回落并持续一段时间后再逐级恢复。
+每一次升降级都会作为 governor_throttle 事件写入哈希链，保证证据记录的诚实性。
+"""
+
+import threading
+import time
+import logging
+
+import psutil
+
+log = logging.getLogger(__name__)
+
+# 每一级的设置；第 0 级即正常运行，与未启用调节器时的行为完全一致
+THROTTLE_LEVELS = [
+    {"screenshot_interval_factor": 1, "screenshot_scale": 1.0, "keyboard_window_seconds": 0, "window_poll_factor": 1},
+    {"screenshot_interval_factor": 2, "screenshot_scale": 0.75, "keyboard_window_seconds": 1, "window_poll_factor": 2},
+    {"screenshot_interval_factor": 4, "screenshot_scale": 0.5, "keyboard_window_seconds": 5, "window_poll_factor": 4},
+    {"screenshot_interval_factor": 8, "screenshot_scale": 0.5, "keyboard_window_seconds": 15, "window_poll_factor": 8},
+]
+
+# 一条事件行除 details 之外大致的固定开销（两段哈希、时间戳、类型、索引）
+EVENT_ROW_OVERHEAD_BYTES = 160
+# 估算 details 大小时，数字、布尔值与嵌套结构各按固定字节数计
+DETAILS_SCALAR_BYTES = 8
+DETAILS_NESTED_BYTES = 64
+
+
+def estimate_event_bytes(details: dict) -> int:
+    """
+    一条事件写盘量的粗略估计，只看 details 的第一层，不做序列化。
+    事件写入在热路径上（每次按键一条），为了计量开销再把 details 编码一遍，本身就是一笔开销；
+    采集在另一进程中运行时实际写库发生在对端，这里也拿不到真实的字节数。
+    """
+    size = EVENT_ROW_OVERHEAD_BYTES
+    for key, value in details.items():
+        size += len(key)
+        if isinstance(value, str): size += len(value.encode("utf-8"))
+        elif isinstance(value, (dict, list, tuple)): size += DETAILS_NESTED_BYTES
+        else: size += DETAILS_SCALAR_BYTES
+    return size
+
+
+class OverheadGovernor:
+    def __init__(self, record_event, cpu_budget_percent: float, write_budget_bytes_per_second: float,
+                 restore_ratio: float = 0.5, restore_samples: int = 3, smoothing: float = 0.3):
+        self.record_event = record_event
+        self.cpu_budget_percent = cpu_budget_percent
+        self.write_budget_bytes_per_second = write_budget_bytes_per_second
+        self.restore_ratio = restore_ratio
+        self.restore_samples = restore_samples
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._process = psutil.Process()
+        self.reset()
+
+    def reset(self):
+        """每次开始追踪时调用，清空上一会话的统计并回到第 0 级"""
+        with self._lock:
+            self.level = 0
+            self._native_ids = set()
+            self._self_reported = {}
+            self._last_cpu = {}
+            self._written_bytes = 0
+            self._last_sample_time = time.monotonic()
+            self._below_count = 0
+            self.cpu_percent = 0.0
+            self.write_bytes_per_second = 0.0
+
+    @property
+    def settings(self) -> dict:
+        return THROTTLE_LEVELS[self.level]
+
+    # --- 上报接口（在追踪器各线程中调用，开销极低） ---
+    def register_threads(self, threads):
+        with self._lock:
+            self._native_ids.update(t.native_id for t in threads if getattr(t, "native_id", None))
+
+    def register_thread(self):
+        """登记调用线程；追踪器的各个循环线程开始时调用"""
+        self.register_threads([threading.current_thread()])
+
+    def report_thread_cpu(self):
+        """由登记过的线程上报自己的累计 CPU 时间，在 psutil 无法按线程取值的平台上作为后备；其他线程调用时忽略"""
+        native_id = threading.get_native_id()
+        if native_id in self._native_ids:
+            self._self_reported[native_id] = time.thread_time()
+
+    def charge_write(self, nbytes: int):
+        with self._lock:
+            self._written_bytes += nbytes
+
+    # --- 采样与决策 ---
+    def _thread_cpu_seconds(self) -> dict:
+        live = {t.native_id for t in threading.enumerate()}
+        with self._lock:
+            # 线程号可能被新线程复用，已退出的线程不再计入
+            self._native_ids &= live
+            for native_id in [i for i in self._self_reported if i not in live]:
+                del self._self_reported[native_id]
+            registered = set(self._native_ids)
+            cpu = dict(self._self_reported)
+        try:
+            for t in self._process.threads():
+                if t.id in registered:
+                    cpu[t.id] = t.user_time + t.system_time
+        except (psutil.AccessDenied, psutil.NoSuchProcess, NotImplementedError):
+            pass
+        return cpu
+
+    def sample(self):
+        now = time.monotonic()
+        cpu = self._thread_cpu_seconds()
+        with self._lock:
+            elapsed = max(now - self._last_sample_time, 1e-6)
+            # 首次出现的线程只建立基线，不计入本次增量
+            cpu_delta = sum(max(0.0, value - self._last_cpu.get(tid, value)) for tid, value in cpu.items())
+            self._last_cpu = cpu
+            written, self._written_bytes = self._written_bytes, 0
+            self._last_sample_time = now
+
+            a = self.smoothing
+            self.cpu_percent = (1 - a) * self.cpu_percent + a * (cpu_delta / elapsed * 100)
+            self.write_bytes_per_second = (1 - a) * self.write_bytes_per_second + a * (written / elapsed)
+
+            over_budget = (self.cpu_percent > self.cpu_budget_percent or
+                           self.write_bytes_per_second > self.write_budget_bytes_per_second)
+            well_below = (self.cpu_percent < self.cpu_budget_percent * self.restore_ratio and
+                          self.write_bytes_per_second < self.write_budget_bytes_per_second * self.restore_ratio)
+
+            previous_level = self.level
+            if over_budget:
+                self._below_count = 0
+                if self.level < len(THROTTLE_LEVELS) - 1: self.level += 1
+            elif well_below:
+                self._below_count += 1
+                if self.level > 0 and self._below_count >= self.restore_samples:
+                    self.level -= 1; self._below_count = 0
+            else:
+                self._below_count = 0
+
+        if self.level != previous_level:
+            action = "throttle" if self.level > previous_level else "restore"
+            log.info(f"GOVERNOR: {action} to level {self.level} (cpu={self.cpu_percent:.2f}%, write={self.write_bytes_per_second:.0f} B/s)")
+            self.record_event("governor_throttle", {
+                "action": action, "level": self.level, "previous_level": previous_level,
+                "cpu_percent": round(self.cpu_percent, 3), "cpu_budget_percent": self.cpu_budget_percent,
+                "write_bytes_per_second": round(self.write_bytes_per_second),
+                "write_budget_bytes_per_second": self.write_budget_bytes_per_second,
+                "settings": dict(self.settings),
+            })
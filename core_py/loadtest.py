@@ -0,0 +1,255 @@
+# core_py/loadtest.py
+"""
+模拟桌面客户端的负载测试。在临时数据目录上以子进程启动完整的 main.py（采集后端为 stub，无需显示器与输入设备），
+初始化并开始会话，然后让 N 个模拟客户端同时访问 HTTP 接口：
+
+- 轮询：与前端相同，每 1.5 秒请求一次 /api/status，追踪中时再请求 /api/events；
+- 动作：按指数分布的间隔随机发起区域截图、快捷键截图或报告生成，比例由 --mix 指定。
+
+结束后按接口输出 p50/p95/p99 延迟、错误率与 503 拒绝数。
+
+用法:
+    python loadtest.py --clients 4 --duration 60
+    python loadtest.py --clients 8 --duration 120 --mix take_screenshot=1,shortcut_screenshot=3,generate_report=1
+    python loadtest.py --server-mode dev --capture-mode process --output loadtest.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmark import _percentiles, _environment
+
+ACTIONS = ("take_screenshot", "shortcut_screenshot", "generate_report")
+DEFAULT_MIX = "take_screenshot=1,shortcut_screenshot=2,generate_report=1"
+SERVER_START_TIMEOUT_SECONDS = 30
+
+
+def _parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ACTIONS:
+            raise ValueError(f"Unknown action {name!r} in --mix, expected one of {ACTIONS}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Recorder:
+    """线程安全地按接口收集 (延迟, 状态码)；状态码为 None 表示连接失败或超时"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, route: str, seconds: float, status):
+        with self._lock:
+            self.samples.setdefault(route, []).append((seconds, status))
+
+    def summary(self) -> dict:
+        result = {}
+        for route, samples in sorted(self.samples.items()):
+            statuses = [status for _, status in samples]
+            rejected = statuses.count(503)
+            errors = sum(1 for status in statuses if status is None or (status >= 400 and status != 503))
+            result[route] = {
+                "latency": _percentiles([seconds for seconds, _ in samples]),
+                "requests": len(samples), "errors": errors, "rejected": rejected,
+                "error_rate": errors / len(samples), "rejected_rate": rejected / len(samples),
+            }
+        return result
+
+
+class Client:
+    def __init__(self, port: int, recorder: Recorder, timeout: float):
+        self.port, self.recorder, self.timeout = port, recorder, timeout
+
+    def request(self, method: str, path: str, body=None):
+        """返回 (状态码, 解析后的 JSON)；失败时状态码为 None"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+        started = time.perf_counter()
+        status, data = None, None
+        try:
+            payload = json.dumps(body).encode("utf-8") if body is not None else None
+            conn.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            raw = response.read()
+            status = response.status
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                pass
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            conn.close()
+            self.recorder.add(path, time.perf_counter() - started, status)
+        return status, data
+
+
+class SimulatedClient:
+    def __init__(self, index: int, client: Client, args, mix: dict, session_start: datetime, report_dir: Path):
+        self.index = index
+        self.client = client
+        self.args = args
+        self.actions, self.weights = list(mix), list(mix.values())
+        self.session_start = session_start
+        self.report_dir = report_dir
+        # 每个客户端使用独立且固定的随机序列，同样的参数得到同样的动作序列
+        self.rng = random.Random(args.seed + index)
+        self.reports = 0
+
+    def poll(self, stop_event):
+        while not stop_event.is_set():
+            status, data = self.client.request("GET", "/api/status")
+            if status == 200 and data and data.get("is_tracking"):
+                self.client.request("GET", "/api/events")
+            stop_event.wait(self.args.poll_interval)
+
+    def act(self, stop_event):
+        while not stop_event.wait(self.rng.expovariate(1.0 / self.args.action_interval)):
+            action = self.rng.choices(self.actions, self.weights)[0]
+            if action == "take_screenshot":
+                self.client.request("POST", "/api/take_screenshot", {"bbox": [0, 0, 800, 600]})
+            elif action == "shortcut_screenshot":
+                self.client.request("POST", "/api/shortcut_screenshot")
+            else:
+                self.reports += 1
+                self.client.request("POST", "/api/generate_report", {
+                    "userInfo": {"name": f"loadtest-{self.index}"},
+                    "savePath": str(self.report_dir / f"client{self.index}_{self.reports}.pdf"),
+                    "startDate": self.session_start.isoformat(),
+                    "endDate": (datetime.now() + timedelta(minutes=1)).isoformat(),
+                    "embedThumbnails": self.args.embed_thumbnails,
+                })
+
+
+def _start_server(workdir: Path, port: int, args):
+    env = dict(os.environ, LEX_CAPTURE_BACKEND="stub", LEX_SERVER_PORT=str(port),
+               LEX_SERVER_MODE=args.server_mode, LEX_CAPTURE_MODE=args.capture_mode,
+               LEX_STUB_KEYS_PER_SECOND=str(args.stub_keys_per_second))
+    log_file = open(workdir / "server.log", "wb")
+    process = subprocess.Popen([sys.executable, str(Path(__file__).parent / "main.py")], env=env,
+                               stdout=log_file, stderr=subprocess.STDOUT, cwd=str(Path(__file__).parent))
+    log_file.close()
+    probe = Client(port, Recorder(), timeout=2)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"main.py exited with code {process.returncode}, see {workdir / 'server.log'}")
+        if probe.request("GET", "/api/status")[0] == 200:
+            return process
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"main.py did not start within {SERVER_START_TIMEOUT_SECONDS}s, see {workdir / 'server.log'}")
+
+
+def _stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill(); process.wait()
+
+
+def run(args):
+    mix = _parse_mix(args.mix)
+    workdir = Path(tempfile.mkdtemp(prefix="lex_loadtest_"))
+    (workdir / "reports").mkdir()
+    port = _free_port()
+    process = _start_server(workdir, port, args)
+    recorder = Recorder()
+    try:
+        setup = Client(port, Recorder(), timeout=args.timeout)
+        status, data = setup.request("POST", "/api/init", {"userDataPath": str(workdir / "data"), "logsPath": str(workdir / "logs")})
+        if status != 200:
+            raise RuntimeError(f"/api/init failed: {status} {data}")
+        session_start = datetime.now() - timedelta(seconds=1)
+        status, data = setup.request("POST", "/api/start_tracking")
+        if status != 200:
+            raise RuntimeError(f"/api/start_tracking failed: {status} {data}")
+
+        stop_event = threading.Event()
+        clients = [SimulatedClient(i, Client(port, recorder, args.timeout), args, mix, session_start, workdir / "reports")
+                   for i in range(args.clients)]
+        threads = [threading.Thread(target=fn, args=(stop_event,), daemon=True)
+                   for c in clients for fn in (c.poll, c.act)]
+        print(f"[LOADTEST] {args.clients} clients for {args.duration}s against 127.0.0.1:{port} "
+              f"({args.server_mode} server, {args.capture_mode} capture, stub backend)")
+        started = time.perf_counter()
+        for t in threads: t.start()
+        time.sleep(args.duration)
+        stop_event.set()
+        # 正在进行的请求（例如报告生成）完成后才计入结果
+        for t in threads: t.join(timeout=args.timeout)
+        elapsed = time.perf_counter() - started
+        setup.request("POST", "/api/stop_tracking")
+    finally:
+        _stop_server(process)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"[LOADTEST] Work directory kept at {workdir}")
+
+    return {
+        "environment": _environment(),
+        "config": {"clients": args.clients, "duration_seconds": args.duration, "mix": mix,
+                   "poll_interval": args.poll_interval, "action_interval": args.action_interval,
+                   "server_mode": args.server_mode, "capture_mode": args.capture_mode,
+                   "stub_keys_per_second": args.stub_keys_per_second, "seed": args.seed},
+        "elapsed_seconds": elapsed,
+        "routes": recorder.summary(),
+    }
+
+
+def _print_summary(results):
+    print(f"[LOADTEST] {'route':<28} {'requests':>8} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'errors':>7} {'503':>5}")
+    for route, entry in results["routes"].items():
+        latency = entry["latency"]
+        print(f"[LOADTEST] {route:<28} {entry['requests']:>8} {latency['p50_ms']:>9.1f} {latency['p95_ms']:>9.1f} "
+              f"{latency['p99_ms']:>9.1f} {entry['error_rate']:>6.1%} {entry['rejected']:>5}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lex Laboris HTTP load test with simulated desktop clients")
+    parser.add_argument("--clients", type=int, default=4, help="模拟客户端数")
+    parser.add_argument("--duration", type=float, default=60, help="持续秒数")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"动作权重，可选动作: {','.join(ACTIONS)}")
+    parser.add_argument("--poll-interval", type=float, default=1.5, help="状态轮询间隔秒数（与前端相同）")
+    parser.add_argument("--action-interval", type=float, default=10, help="每个客户端两次动作之间的平均秒数")
+    parser.add_argument("--server-mode", default="production", choices=("dev", "production"))
+    parser.add_argument("--capture-mode", default="thread", choices=("thread", "process"))
+    parser.add_argument("--stub-keys-per-second", type=float, default=20, help="stub 后端模拟的按键速率，决定报告的规模")
+    parser.add_argument("--embed-thumbnails", action="store_true", help="报告中嵌入截图缩略图")
+    parser.add_argument("--timeout", type=float, default=600, help="单个请求的超时秒数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="保留临时数据目录与服务端日志")
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    _print_summary(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"[LOADTEST] Results written to {args.output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# core_py/log_renderer.py
+"""
+详细活动日志的画布渲染引擎。
+
+默认的 flowable 引擎为每条事件构造一个 Table 和若干 Paragraph，排版时逐个求解，事件数一多，
+PDF 构建的大部分时间都花在这里。本引擎把整段日志做成一个可拆分的 Flowable：
+事件在构造时一次性转换为固定版式的行（文本按缓存的字符宽度折行），排版时只做按页累加高度，
+绘制时直接在 canvas 上输出文字、网格线与底色。内容与 flowable 引擎相同（时间、类型、详情、两段哈希），
+只是不再解析 Paragraph 标记。
+
+分页规则：一条事件能放进当前页就整条放入；放不下但不超过一整页时移到下一页；
+超过一整页的事件在行之间断开，单行超过一整页时按文本行预先拆成续行。
+
+各类事件的详情写什么由 event_detail_groups 决定，两种引擎共用，只各自负责样式。
+"""
+
+import json
+
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Flowable
+
+LABEL_WIDTH = 1.2 * inch
+VALUE_WIDTH = 5.8 * inch
+# 与 reportlab Table 的默认单元格内边距一致
+PAD_X = 6
+PAD_Y = 3
+EVENT_GAP = 0.2 * inch
+CODE_INDENT = 36  # getSampleStyleSheet()['Code'] 的 leftIndent
+# SimpleDocTemplate 的框架上下各有 6pt 内边距
+FRAME_PADDING = 6
+
+# 详情条目的类型，见 event_detail_groups
+DETAIL_TEXT = "text"            # 正文，内容为 [(文字, 是否加粗)]
+DETAIL_NOTE = "note"            # 程序给出的说明（flowable 引擎中为斜体）
+DETAIL_PATH = "path"            # 截图文件信息，可含换行
+DETAIL_CODE = "code"            # 原始数据
+DETAIL_THUMBNAIL = "thumbnail"  # 内容为截图文件名
+
+
+def usable_frame_height(doc) -> float:
+    """一页正文实际可用的高度：doc.height 减去框架上下的内边距"""
+    return doc.height - 2 * FRAME_PADDING
+
+
+def event_detail_groups(event, load_details, screenshot_dir) -> list:
+    """
+    事件详情的内容，与排版无关：[[(条目类型, 内容), ...], ...]。
+    通常只有一组；分屏截图每个显示器一组，flowable 引擎把第二组起各放一行，使表格能在显示器之间断开。
+    """
+    try:
+        details = load_details(event)
+        event_type = event.event_type
+        if event_type == "app_session":
+            title = details.get("app_title", "")
+            title_text = f" - {title}" if title else ""
+            return [[(DETAIL_TEXT, [("应用 ", False), (f"[{details.get('process_name', '未知')}{title_text}]", True),
+                                    (f" 持续聚焦 {details.get('duration_seconds')} 秒。", False)])]]
+        if event_type == "heartbeat":
+            return [[(DETAIL_NOTE, "程序确认用户活跃。")]]
+        if event_type == "keyboard_press":
+            count_text = f"（聚合 {details['count']} 次）" if details.get("count") else ""
+            return [[(DETAIL_NOTE, f"检测到键盘输入{count_text}。")]]
+        if event_type.startswith("screenshot_") and "monitors" in details:
+            from monitor_capture import describe_monitor
+            groups = []
+            for monitor in details["monitors"]:
+                filename = monitor.get("filename")
+                if filename:
+                    groups.append([(DETAIL_PATH, f"{describe_monitor(monitor)}\n截图文件名: {filename}\n本机绝对路径: {screenshot_dir / filename}"),
+                                   (DETAIL_THUMBNAIL, filename)])
+                else:
+                    groups.append([(DETAIL_PATH, f"{describe_monitor(monitor)}\n画面未变化，同截图文件: {monitor.get('same_as')}")])
+            return groups or [[]]
+        if event_type.startswith("screenshot_"):
+            filename = details.get("filename")
+            if not filename:
+                return [[(DETAIL_TEXT, [("截图事件，但未记录文件名。", False)])]]
+            return [[(DETAIL_PATH, f"截图文件名: {filename}\n本机绝对路径: {screenshot_dir / filename}"),
+                     (DETAIL_THUMBNAIL, filename)]]
+        # Paragraph 会把 JSON 的缩进与换行折叠成空格，两种引擎都直接输出紧凑形式
+        return [[(DETAIL_CODE, json.dumps(details, ensure_ascii=False, sort_keys=True, separators=(", ", ": ")))]]
+    except Exception:
+        return [[(DETAIL_CODE, f"无效数据: {event.details}")]]
+
+
+class TextMeasurer:
+    """按 (字体, 字号) 缓存单个字符的宽度；折行只需查表累加，不必对每个候选子串调用 stringWidth"""
+    def __init__(self):
+        self._widths = {}
+
+    def char_width(self, ch: str, font: str, size: float) -> float:
+        key = (ch, font, size)
+        width = self._widths.get(key)
+        if width is None:
+            width = self._widths[key] = stringWidth(ch, font, size)
+        return width
+
+    def wrap(self, text: str, font: str, size: float, max_width: float):
+        """贪心折行：能在空格处断开时在空格处断开，否则（如中文）按字符断开；保留原有换行"""
+        lines = []
+        for paragraph in text.split("\n"):
+            line_start, width, last_space = 0, 0.0, -1
+            i = 0
+            while i < len(paragraph):
+                ch = paragraph[i]
+                w = self.char_width(ch, font, size)
+                if width + w > max_width and i > line_start:
+                    if last_space > line_start:
+                        lines.append(paragraph[line_start:last_space])
+                        i = line_start = last_space + 1
+                    else:
+                        lines.append(paragraph[line_start:i])
+                        line_start = i
+                    width, last_space = 0.0, -1
+                    continue
+                if ch == " ": last_space = i
+                width += w
+                i += 1
+            lines.append(paragraph[line_start:])
+        return lines
+
+
+class _Text:
+    __slots__ = ("lines", "font", "size", "leading", "indent", "color")
+
+    def __init__(self, lines, font, size, leading, indent=0, color=colors.black):
+        self.lines, self.font, self.size, self.leading, self.indent, self.color = lines, font, size, leading, indent, color
+
+    @property
+    def height(self):
+        return len(self.lines) * self.leading
+
+
+class _Picture:
+    __slots__ = ("path", "width", "height")
+
+    def __init__(self, path, width, height):
+        self.path, self.width, self.height = path, width, height
+
+
+class _Row:
+    __slots__ = ("label", "parts", "height", "first", "last")
+
+    def __init__(self, label, parts, label_height):
+        self.label, self.parts = label, parts
+        self.height = max(label_height, sum(part.height for part in parts)) + 2 * PAD_Y
+        self.first = self.last = False
+
+
+class LogRowBuilder:
+    """把事件转换成固定版式的行；样式参数在构造时确定，之后所有事件共用"""
+    def __init__(self, font_name: str, event_type_labels: dict, screenshot_dir, max_row_height: float, thumbnails=None):
+        self.font = font_name
+        self.labels = event_type_labels
+        self.screenshot_dir = screenshot_dir
+        self.max_row_height = max_row_height
+        self.thumbnails = thumbnails or {}
+        self.measure = TextMeasurer()
+        self.text_width = VALUE_WIDTH - 2 * PAD_X
+        self.normal = (self.font, 10.5, 14)
+        self.small = (self.font, 8, 12)
+        self.code = (self.font, 8, 10)
+        self.label_height = 14
+
+    def _text(self, text: str, style, indent=0, color=colors.black) -> _Text:
+        font, size, leading = style
+        return _Text(self.measure.wrap(text, font, size, self.text_width - indent), font, size, leading, indent, color)
+
+    def _details(self, event, load_details) -> list:
+        parts = []
+        for group in event_detail_groups(event, load_details, self.screenshot_dir):
+            for kind, content in group:
+                if kind == DETAIL_TEXT:
+                    parts.append(self._text("".join(text for text, _ in content), self.normal))
+                elif kind == DETAIL_NOTE:
+                    parts.append(self._text(content, self.normal))
+                elif kind == DETAIL_PATH:
+                    parts.append(self._text(content, self.small, CODE_INDENT, colors.darkslategray))
+                elif kind == DETAIL_CODE:
+                    parts.append(self._text(content, self.code, CODE_INDENT))
+                elif kind == DETAIL_THUMBNAIL:
+                    parts.extend(self._thumbnail(content))
+        return parts
+
+    def _thumbnail(self, filename: str) -> list:
+        from thumbnails import THUMB_OK, THUMB_MISMATCH
+        entry = self.thumbnails.get(filename)
+        if entry is None: return []
+        status, path, width, height = entry
+        if status == THUMB_MISMATCH:
+            return [self._text("截图文件内容与哈希链记录不符，未嵌入缩略图。", self.normal)]
+        if status != THUMB_OK: return []
+        scale = min(1.0, (self.text_width - 0.2 * inch) / width)
+        return [_Picture(str(path), width * scale, height * scale + 4)]
+
+    def _split_row(self, label: str, parts: list) -> list:
+        """单行超过一整页时按文本行拆成多行，续行不重复标签"""
+        rows, current, current_height = [], [], 0.0
+        limit = self.max_row_height - 2 * PAD_Y
+        for part in parts:
+            if current and current_height + part.height > limit and isinstance(part, _Picture):
+                rows.append(current); current, current_height = [], 0.0
+            if isinstance(part, _Picture) or current_height + part.height <= limit:
+                current.append(part); current_height += part.height
+                continue
+            lines = part.lines
+            while lines:
+                room = max(1, int((limit - current_height) // part.leading))
+                chunk, lines = lines[:room], lines[room:]
+                current.append(_Text(chunk, part.font, part.size, part.leading, part.indent, part.color))
+                current_height += len(chunk) * part.leading
+                if lines:
+                    rows.append(current); current, current_height = [], 0.0
+        if current: rows.append(current)
+        return [_Row(label if i == 0 else "", chunk, self.label_height) for i, chunk in enumerate(rows)]
+
+    def rows(self, event, load_details) -> list:
+        hash_text = _Text([f"数据: {event.data_hash[:16]}...", f"前序: {event.previous_hash[:16]}..."],
+                          self.font, 8, 8.8, CODE_INDENT)
+        rows = [
+            _Row("时间:", [_Text([event.timestamp.strftime("%Y-%m-%d %H:%M:%S")], *self.normal)], self.label_height),
+            _Row("类型:", [self._text(self.labels.get(event.event_type, event.event_type), self.normal)], self.label_height),
+        ]
+        details = self._details(event, load_details)
+        if sum(part.height for part in details) + 2 * PAD_Y > self.max_row_height:
+            rows.extend(self._split_row("详情:", details))
+        else:
+            rows.append(_Row("详情:", details, self.label_height))
+        rows.append(_Row("哈希值:", [hash_text], self.label_height))
+        rows[0].first = True; rows[-1].last = True
+        return rows
+
+
+class CanvasLogSection(Flowable):
+    """
+    整段日志对应的可拆分 Flowable。所有行保存在共享列表中，拆分只产生新的 [start, end) 区间，
+    每次 wrap 只计算到当前页放满为止，总耗时与事件数成线性关系。
+    """
+    def __init__(self, rows: list, font_name: str, max_height: float, start: int = 0, end: int = None):
+        super().__init__()
+        self.rows = rows
+        self.font = font_name
+        self.max_height = max_height
+        self.start = start
+        self.end = len(rows) if end is None else end
+        self._fit = None
+
+    def _layout(self, avail_height: float):
+        """返回 (能放下的行数, 这些行的高度)；规则见模块说明"""
+        rows, i, used = self.rows, self.start, 0.0
+        while i < self.end:
+            if rows[i].first:
+                gap = EVENT_GAP if i > self.start else 0.0
+                # 整条事件的高度
+                j, event_height = i, 0.0
+                while True:
+                    event_height += rows[j].height
+                    if rows[j].last or j + 1 >= self.end: break
+                    j += 1
+                if used + gap + event_height <= avail_height:
+                    used += gap + event_height; i = j + 1
+                    continue
+                if event_height <= self.max_height or used + gap + rows[i].height > avail_height:
+                    break
+                used += gap
+            if used + rows[i].height > avail_height: break
+            used += rows[i].height; i += 1
+        return i - self.start, used
+
+    def wrap(self, avail_width, avail_height):
+        count, height = self._layout(avail_height)
+        self._fit = count
+        if self.start + count < self.end:
+            # 放不下全部内容：返回比可用高度更大的值，让框架调用 split
+            return avail_width, avail_height + 1
+        self.width, self.height = avail_width, height
+        return avail_width, height
+
+    def split(self, avail_width, avail_height):
+        count, _ = self._layout(avail_height)
+        if count == 0:
+            return []
+        middle = self.start + count
+        return [CanvasLogSection(self.rows, self.font, self.max_height, self.start, middle),
+                CanvasLogSection(self.rows, self.font, self.max_height, middle, self.end)]
+
+    def draw(self):
+        canv = self.canv
+        top = self.height
+        grid, label_backgrounds = [], []
+        text = canv.beginText()
+        images = []
+        # 字体与颜色只在变化时输出，避免每行重复写入文本状态
+        state = [None, None]
+
+        def use(font, size, color):
+            if state[0] != (font, size):
+                text.setFont(font, size); state[0] = (font, size)
+            if state[1] != color:
+                text.setFillColor(color); state[1] = color
+
+        y = top
+        for index in range(self.start, self.end):
+            row = self.rows[index]
+            if row.first and index > self.start: y -= EVENT_GAP
+            bottom = y - row.height
+            label_backgrounds.append((0, bottom, LABEL_WIDTH, row.height))
+            if row.first or index == self.start:
+                grid.append((0, y, LABEL_WIDTH + VALUE_WIDTH, y))
+            # 上一行的下边线就是本行的上边线
+            grid.extend([(0, bottom, LABEL_WIDTH + VALUE_WIDTH, bottom), (0, y, 0, bottom), (LABEL_WIDTH, y, LABEL_WIDTH, bottom),
+                         (LABEL_WIDTH + VALUE_WIDTH, y, LABEL_WIDTH + VALUE_WIDTH, bottom)])
+            if row.label:
+                use(self.font, 10.5, colors.black)
+                text.setTextOrigin(PAD_X, y - PAD_Y - 10.5)
+                text.textOut(row.label)
+            line_top = y - PAD_Y
+            for part in row.parts:
+                if isinstance(part, _Picture):
+                    images.append((part.path, LABEL_WIDTH + PAD_X, line_top - part.height, part.width, part.height - 4))
+                    line_top -= part.height
+                    continue
+                use(part.font, part.size, part.color)
+                for line in part.lines:
+                    text.setTextOrigin(LABEL_WIDTH + PAD_X + part.indent, line_top - part.size)
+                    text.textOut(line)
+                    line_top -= part.leading
+            y = bottom
+
+        canv.saveState()
+        canv.setFillColor(colors.whitesmoke)
+        for x, y0, w, h in label_backgrounds:
+            canv.rect(x, y0, w, h, stroke=0, fill=1)
+        canv.setStrokeColor(colors.lightgrey)
+        canv.setLineWidth(0.5)
+        canv.lines(grid)
+        canv.drawText(text)
+        for path, x, y0, w, h in images:
+            # 同一路径的图像在 PDF 中只存一份
+            canv.drawImage(path, x, y0, width=w, height=h)
+        canv.restoreState()
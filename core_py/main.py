@@ -1,9 +1,12 @@
 import os
 import sys
+import time
 import logging
 from datetime import datetime
 import glob
-from flask import Flask, jsonify, send_from_directory, request
+import gzip
+import multiprocessing
+from flask import Flask, jsonify, send_from_directory, request, g, Response, stream_with_context
 from flask_cors import CORS
 import shutil
 from pathlib import Path
@@ -22,11 +25,44 @@ sys.excepthook = handle_exception
 log.info("Logger backend partially initialized. Waiting for paths...")
 # ---
 
-from config import set_data_paths
+from config import set_data_paths, SERVER_GZIP_MIN_BYTES
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_REQUEST_SECONDS, HTTP_REQUESTS
 
 app = Flask(__name__)
 CORS(app)
 
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # 以路由模板而不是具体 URL 作为标签，避免截图路径等造成标签爆炸
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(route, request.method).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+    return response
+
+@app.after_request
+def _gzip_json_response(response):
+    # 流式响应（导出、截图文件）保持原样；已压缩或过小的响应不值得再压缩
+    if (response.mimetype != 'application/json' or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+    data = response.get_data()
+    if len(data) < SERVER_GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
 DB_FILE_PATH = None
 
 @app.route('/api/init', methods=['POST'])
@@ -70,12 +106,14 @@ def initialize_app():
 
 @app.route('/api/status', methods=['GET'])
 def get_status():
-    from tracker import activity_tracker
+    from capture import get_tracker
+    activity_tracker = get_tracker()
     return jsonify({"status": "success", "is_tracking": activity_tracker.is_running, "is_idle": activity_tracker.is_idle})
 
 @app.route('/api/start_tracking', methods=['POST'])
 def start():
-    from tracker import activity_tracker
+    from capture import get_tracker
+    activity_tracker = get_tracker()
     from system_info import save_snapshot_event
     from database import clear_db
     from config import SCREENSHOT_DIR
@@ -84,6 +122,10 @@ def start():
     try:
         if SCREENSHOT_DIR and os.path.exists(SCREENSHOT_DIR):
             for f in glob.glob(str(SCREENSHOT_DIR / "*.png")): os.remove(f)
+            from screenshot_store import get_store
+            get_store().clear()
+            from thumbnails import clear_cache
+            clear_cache(SCREENSHOT_DIR)
             log.info("Cleared old screenshots before starting new session.")
         clear_db()
         log.info("Cleared database before starting new session.")
@@ -96,7 +138,8 @@ def start():
 
 @app.route('/api/stop_tracking', methods=['POST'])
 def stop():
-    from tracker import activity_tracker
+    from capture import get_tracker
+    activity_tracker = get_tracker()
     if not activity_tracker.is_running: return jsonify({"status": "error", "message": "追踪未在运行。"}), 400
     session_data = activity_tracker.stop()
     if session_data:
@@ -120,15 +163,90 @@ def get_events():
     try: return jsonify({"status": "success", "events": get_recent_events()})
     except Exception as e: return jsonify({"status": "error", "message": f"获取历史事件时出错: {e}"}), 500
 
+@app.route('/api/summary', methods=['GET'])
+def get_summary():
+    from rollup import summarize, PERIODS
+    period = request.args.get('period', 'day')
+    if period not in PERIODS:
+        return jsonify({"status": "error", "message": f"不支持的统计周期: {period}"}), 400
+    try:
+        day = datetime.fromisoformat(request.args['date']).date() if request.args.get('date') else datetime.now().date()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"日期格式错误: {e}"}), 400
+    return jsonify({"status": "success", "summary": summarize(period, day)})
+
+@app.route('/api/summary/rebuild', methods=['POST'])
+def rebuild_summary():
+    from rollup import rebuild
+    try: return jsonify({"status": "success", "events": rebuild()})
+    except Exception as e:
+        log.error(f"Failed to rebuild rollups: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": f"重建汇总数据时出错: {e}"}), 500
+
+@app.route('/api/apps', methods=['GET'])
+def get_apps():
+    from database import get_app_usage
+    try:
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+        limit = min(max(int(request.args.get('limit', 20)), 1), 500)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"参数格式错误: {e}"}), 400
+    by_title = request.args.get('group_by') == 'title'
+    return jsonify({"status": "success", "apps": get_app_usage(start, end, limit, by_title)})
+
+@app.route('/api/search', methods=['GET'])
+def search_events():
+    from search import search
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({"status": "error", "message": "缺少检索关键词。"}), 400
+    try:
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+        page = max(int(request.args.get('page', 1)), 1)
+        page_size = min(max(int(request.args.get('page_size', 20)), 1), 100)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"参数格式错误: {e}"}), 400
+    return jsonify({"status": "success", **search(q, start, end, page, page_size)})
+
+@app.route('/api/export', methods=['GET'])
+def export_events():
+    from exporter import stream_export, EXPORT_FORMATS
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"status": "error", "message": f"不支持的导出格式: {fmt}"}), 400
+    try:
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"时间参数格式错误: {e}"}), 400
+    compress = request.args.get('compress') == 'gzip'
+
+    filename = f"lex_laboris_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}" + (".gz" if compress else "")
+    response = Response(stream_with_context(stream_export(fmt, start, end, compress)),
+                        mimetype="application/gzip" if compress else EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @app.route('/api/screenshots/<path:filename>')
 def get_screenshot(filename):
     file_dir = os.path.dirname(filename)
     file_name = os.path.basename(filename)
-    return send_from_directory(file_dir, file_name)
+    if os.path.exists(filename):
+        return send_from_directory(file_dir, file_name)
+    # 自动截图保存在关键帧/差分存储中，按需还原（带缓存）
+    from screenshot_store import get_store, ScreenshotStoreError
+    try:
+        return Response(get_store().read_png(file_name), mimetype='image/png')
+    except ScreenshotStoreError as e:
+        log.warning(f"Screenshot {file_name} unavailable: {e}")
+        return jsonify({"status": "error", "message": "截图不存在或已损坏。"}), 404
 
 @app.route('/api/take_screenshot', methods=['POST'])
 def take_screenshot_endpoint():
-    from tracker import activity_tracker
+    from capture import get_tracker
+    activity_tracker = get_tracker()
     data = request.json; bbox = tuple(data.get('bbox')) if data.get('bbox') else None
     filepath = activity_tracker.take_manual_screenshot(bbox=bbox)
     if filepath: return jsonify({"status": "success", "message": "截图成功。"})
@@ -136,7 +254,8 @@ def take_screenshot_endpoint():
 
 @app.route('/api/shortcut_screenshot', methods=['POST'])
 def shortcut_screenshot():
-    from tracker import activity_tracker
+    from capture import get_tracker
+    activity_tracker = get_tracker()
     filepath = activity_tracker.take_fullscreen_screenshot()
     if filepath: return jsonify({"status": "success"})
     else: return jsonify({"status": "ignored"})
@@ -144,7 +263,7 @@ def shortcut_screenshot():
 @app.route('/api/generate_report', methods=['POST'])
 def generate_report_endpoint():
     from report_generator import ReportGenerator
-    from config import SCREENSHOT_DIR as sdir, BASE_DATA_DIR as bdd
+    from config import SCREENSHOT_DIR as sdir, REPORT_EMBED_THUMBNAILS
     
     data = request.json
     report_screenshots_dir = None
@@ -164,6 +283,9 @@ def generate_report_endpoint():
             dest_path = os.path.join(report_screenshots_dir, filename)
             shutil.copy(src_path, dest_path)
         log.info(f"Copied {len(source_screenshots)} screenshots to {report_screenshots_dir}")
+        from screenshot_store import get_store
+        restored = get_store().export(report_screenshots_dir)
+        log.info(f"Restored {restored} stored screenshots to {report_screenshots_dir}")
 
         start_date = datetime.fromisoformat(data['startDate'])
         end_date = datetime.fromisoformat(data['endDate'])
@@ -172,13 +294,19 @@ def generate_report_endpoint():
             end_date=end_date,
             user_info=data['userInfo'],
             save_path=pdf_save_path,
-            final_screenshot_dir_for_report=os.path.abspath(report_screenshots_dir)
+            final_screenshot_dir_for_report=os.path.abspath(report_screenshots_dir),
+            embed_thumbnails=bool(data.get('embedThumbnails', REPORT_EMBED_THUMBNAILS))
         )
         filepath = generator.generate()
         
         if filepath:
+            from database import backup_db, export_event_range
             db_archive_path = os.path.join(pdf_dir, f"db_{pdf_name_without_ext}.sqlite")
-            shutil.copy(Path(bdd) / 'work_log.db', db_archive_path)
+            # archiveScope: "full" 为整库在线快照，"range" 仅导出报告时段内的事件及验证所需的链上下文
+            if data.get('archiveScope', 'full') == 'range':
+                export_event_range(db_archive_path, start_date, end_date)
+            else:
+                backup_db(db_archive_path)
             log.info(f"Database archived to {db_archive_path}")
             
             return jsonify({"status": "success", "filepath": os.path.abspath(filepath)})
@@ -194,9 +322,21 @@ def generate_report_endpoint():
         return jsonify({"status": "error", "message": f"生成报告时发生错误: {e}"}), 500
 
 if __name__ == '__main__':
+    # 打包后的程序以 spawn 方式启动采集进程时需要
+    multiprocessing.freeze_support()
     try:
-        log.info(f"PYTHON CORE: Starting Flask server on http://127.0.0.1:5001")
-        app.run(host='127.0.0.1', port=5001, debug=False)
+        from server import resolve_server_mode, serve
+        server_mode = resolve_server_mode()
+        from capture import resolve_capture_mode
+        from capture_backends import resolve_capture_backend
+        from config import SERVER_PORT
+        port = int(os.environ.get("LEX_SERVER_PORT") or SERVER_PORT)
+        log.info(f"PYTHON CORE: Starting {server_mode} server on http://127.0.0.1:{port} "
+                 f"(capture mode: {resolve_capture_mode()}, backend: {resolve_capture_backend()})")
+        if server_mode == "production":
+            serve(app, host='127.0.0.1', port=port)
+        else:
+            app.run(host='127.0.0.1', port=port, debug=False)
     except Exception as e:
         log.critical(f"Failed to start the server: {e}", exc_info=True)
         sys.exit(1)
\ No newline at end of file
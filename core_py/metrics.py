@@ -0,0 +1,183 @@
+# core_py/metrics.py
+"""
+轻量级进程内指标（计数器与直方图），以 Prometheus 文本格式导出。
+记录一次观测只需要一次 bisect 和一次加锁自增，可以在生产环境常开。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 覆盖 100us 到 30s，适合从一次提交到一次完整报告构建的各种耗时
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra: pairs.append(extra)
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    metric_type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # 无标签指标从一开始就以 0 导出
+            self._children[()] = self._new_child()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *labelvalues):
+        """返回指定标签值的子指标；子指标会被缓存，热路径上可以预先取好"""
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labelvalues}")
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labelvalues, self._new_child())
+        return child
+
+    def _default_child(self):
+        return self.labels()
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for labelvalues, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, labelvalues))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def render(self, name, labelnames, labelvalues):
+        return [f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(self._value)}"]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._upper_bounds = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labelnames, labelvalues):
+        with self._lock:
+            counts = list(self._counts); total = self._sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self._upper_bounds + (float("inf"),), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labelnames, labelvalues, ('le', _format_value(float(bound))))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, labelvalues)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, labelvalues)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default_child().observe(value)
+
+    def time(self):
+        return self._default_child().time()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- 全部热路径指标集中定义在这里，调用方只导入所需对象 ---
+DB_SAVE_EVENT_SECONDS = Histogram(
+    "lex_db_save_event_seconds", "save_event latency by phase (lock_wait, hash, commit, total).", ["phase"])
+DB_EVENTS_SAVED = Counter("lex_db_events_saved_total", "Events committed to the hash chain.", ["event_type"])
+DB_SAVE_ERRORS = Counter("lex_db_save_errors_total", "save_event calls that failed and were rolled back.")
+WINDOW_POLL_SECONDS = Histogram("lex_tracker_window_poll_seconds", "Time spent querying the active window.")
+INPUT_CALLBACK_SECONDS = Histogram(
+    "lex_tracker_input_callback_seconds", "Time spent inside the keyboard hook callback, in the process that runs the tracker.")
+SCREENSHOT_PHASE_SECONDS = Histogram(
+    "lex_screenshot_phase_seconds", "Screenshot pipeline latency by phase (grab, write: streaming encode + hash + write).", ["phase"])
+SCREENSHOTS_TAKEN = Counter("lex_screenshots_total", "Screenshots captured.", ["kind", "result"])
+SCREENSHOT_MONITORS = Counter(
+    "lex_screenshot_monitors_total", "Monitors handled by per-monitor capture (written, or skipped as unchanged).", ["result"])
+REPORT_PHASE_SECONDS = Histogram(
+    "lex_report_phase_seconds", "Report generation latency by phase.", ["phase"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "lex_http_request_seconds", "HTTP request latency by route.", ["route", "method"])
+HTTP_REQUESTS = Counter("lex_http_requests_total", "HTTP requests by route and status.", ["route", "method", "status"])
+HTTP_QUEUE_WAIT_SECONDS = Histogram(
+    "lex_http_queue_wait_seconds", "Time a connection waited for a worker, by server tier.", ["tier"])
+HTTP_REJECTED = Counter("lex_http_rejected_total", "Connections answered with 503 because the tier queue was full.", ["tier"])
@@ -0,0 +1,112 @@
+# core_py/monitor_capture.py
+"""
+分屏截图：逐个显示器截取，并行编码为各自的 PNG，一次截图仍只产生一条截图事件。
+
+ImageGrab.grab(all_screens=True) 把所有显示器拼成一张覆盖整个虚拟桌面的位图，显示器大小不一时大部分是黑边，
+编码又慢又占内存。这里按采集后端报告的显示器几何逐个截取，截取与编码流水线进行：
+同时存在的显示器图像不超过编码线程数，峰值内存约为 workers 张单屏图像，而不是整个虚拟桌面。
+
+每个显示器先按分块计算内容摘要，与该显示器上一次保存的画面相同则不再编码与写盘，
+事件中记为 {"unchanged": true, "same_as": 上一次的文件名}。事件格式：
+    {"monitors": [{"index", "left", "top", "width", "height", "filename", "sha256", "size_bytes"}
+                  | {"index", "left", "top", "width", "height", "unchanged": true, "same_as"}, ...],
+     "scale": 仅在调节器缩小画面时出现}
+分屏截图写为独立的 PNG 文件，不进入关键帧/差分存储（后者按单一画面序列维护关键帧）。
+"""
+
+import os
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from metrics import SCREENSHOT_PHASE_SECONDS, SCREENSHOT_MONITORS
+from screenshot_integrity import HashingWriter
+
+log = logging.getLogger(__name__)
+
+# 计算画面摘要时每次取出的行数，避免为整屏再复制一份像素
+DIGEST_ROWS = 256
+
+
+def image_digest(image: Image.Image) -> bytes:
+    digest = hashlib.blake2b(f"{image.mode}{image.size}".encode(), digest_size=20)
+    for top in range(0, image.height, DIGEST_ROWS):
+        digest.update(image.crop((0, top, image.width, min(image.height, top + DIGEST_ROWS))).tobytes())
+    return digest.digest()
+
+
+def describe_monitor(monitor: dict) -> str:
+    return f"显示器 {monitor['index']}（{monitor['width']}×{monitor['height']}，位置 {monitor['left']},{monitor['top']}）"
+
+
+class MonitorCapture:
+    def __init__(self, backend, workers: int = None):
+        self.backend = backend
+        self.workers = workers
+        # (显示器几何, 缩放比例) -> (画面摘要, 文件名)，新会话开始时清空（旧截图文件随之删除）。
+        # 比例不同的截图互不引用，全分辨率的手动截图不会指向调节器缩小过的文件
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._last.clear()
+
+    def _encode(self, image, key, directory, filename, scale):
+        """在编码线程中运行：比较摘要，变化时缩放、编码并写盘，返回 (摘要, 文件信息或 None)"""
+        digest = image_digest(image)
+        previous = self._last.get(key)
+        if previous is not None and previous[0] == digest:
+            return digest, None
+        if scale < 1.0:
+            image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+        with SCREENSHOT_PHASE_SECONDS.labels("write").time():
+            with open(directory / filename, "wb") as f:
+                writer = HashingWriter(f)
+                image.save(writer, "PNG")
+        return digest, {"filename": filename, "sha256": writer.hexdigest(), "size_bytes": writer.size}
+
+    def capture(self, directory, name_prefix: str, scale: float = 1.0):
+        """
+        截取全部显示器，返回 (事件详情中的 monitors 列表, 写盘字节数)。
+        文件名为 {name_prefix}_m{序号}.png；没有检测到显示器时返回 (None, 0)。
+        """
+        with self._lock:
+            monitors = self.backend.monitors()
+            if not monitors: return None, 0
+            workers = self.workers or min(len(monitors), os.cpu_count() or 1)
+            # 截取在本线程按顺序进行，编码并行；信号量限制同时存在的显示器图像数
+            slots = threading.BoundedSemaphore(workers)
+            futures = []
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="monitor-encode") as pool:
+                for index, geometry in enumerate(monitors):
+                    slots.acquire()
+                    try:
+                        with SCREENSHOT_PHASE_SECONDS.labels("grab").time():
+                            image = self.backend.grab_monitor(geometry)
+                    except Exception:
+                        slots.release()
+                        raise
+                    future = pool.submit(self._encode, image, (geometry, scale), directory, f"{name_prefix}_m{index}.png", scale)
+                    future.add_done_callback(lambda _: slots.release())
+                    del image
+                    futures.append((index, geometry, future))
+
+            entries, written = [], 0
+            for index, geometry, future in futures:
+                digest, stored = future.result()
+                left, top, width, height = geometry
+                entry = {"index": index, "left": left, "top": top, "width": width, "height": height}
+                if stored is None:
+                    entry.update(unchanged=True, same_as=self._last[(geometry, scale)][1])
+                    SCREENSHOT_MONITORS.labels("unchanged").inc()
+                else:
+                    entry.update(stored)
+                    written += stored["size_bytes"]
+                    self._last[(geometry, scale)] = (digest, stored["filename"])
+                    SCREENSHOT_MONITORS.labels("written").inc()
+                entries.append(entry)
+            return entries, written
@@ -0,0 +1,271 @@
+# core_py/replay.py
+"""
+确定性回放：把一条输入轨迹（按键、窗口切换、文件事件、手动截图）按虚拟时间喂给 ActivityTracker。
+
+驱动器是单线程的离散事件循环：轨迹中的输入与追踪器的各个 tick（空闲判定与心跳、窗口轮询、自动截图）
+按虚拟时间合并执行，同一时刻输入先于 tick；虚拟时钟直接跳到下一个时刻，不真正等待。
+同一条轨迹每次回放产生相同的事件序列与哈希链，一周的追踪可以在几十秒内跑完，用于基准与回归测试。
+调节器（依赖真实的 CPU 时间）与截图保留策略不参与回放。
+
+轨迹为 JSON Lines，每行一个输入，时间不减：
+    {"t": "2024-01-01T09:00:00.250000", "type": "key"}
+    {"t": "...", "type": "window", "process_name": "code.exe", "title": "main.py"}   # process_name 为 null 表示没有前台窗口
+    {"t": "...", "type": "file", "event": "modified", "path": "C:\\\\src\\\\a.py"}       # event: created/modified/deleted/moved
+    {"t": "...", "type": "screenshot", "bbox": [0, 0, 800, 600]}                     # bbox 可省略
+
+用法:
+    python replay.py --synthetic-days 7 --sink memory --repeat 2
+    python replay.py --synthetic-days 7 --write-trace week.jsonl
+    python replay.py --trace week.jsonl --data-dir ./replay_data --verify
+"""
+
+import argparse
+import heapq
+import json
+import random
+import shutil
+import tempfile
+import time
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from capture_backends import StubBackend
+from clock import VirtualClock
+
+log = logging.getLogger(__name__)
+
+INPUT_TYPES = ("key", "window", "file", "screenshot")
+FILE_EVENTS = ("created", "modified", "deleted", "moved")
+# 同一时刻输入先于 tick 执行
+_INPUT_PRIORITY, _TICK_PRIORITY = 0, 1
+
+
+def load_trace(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip(): continue
+            item = json.loads(line)
+            if item.get("type") not in INPUT_TYPES:
+                raise ValueError(f"{path}:{line_number}: unknown input type {item.get('type')!r}")
+            item["t"] = datetime.fromisoformat(item["t"])
+            yield item
+
+
+def write_trace(trace, path) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for item in trace:
+            f.write(json.dumps({**item, "t": item["t"].isoformat()}, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def synthetic_trace(days: int, seed: int = 42, start: datetime = None):
+    """
+    生成 days 天的合成轨迹：工作日 9:00–18:00 工作，午休一小时，周末不工作；
+    工作时段内交替出现应用切换、连续输入、思考停顿、文件保存与偶尔的离开。相同参数总是生成相同的轨迹。
+    """
+    from workload import PROCESSES, WATCHED_FILES, DEFAULT_START
+    rng = random.Random(seed)
+    start = start or DEFAULT_START
+    day0 = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    for day in range(days):
+        date = day0 + timedelta(days=day)
+        if date.weekday() >= 5: continue
+        for begin, end in ((9, 12), (13, 18)):
+            now = date + timedelta(hours=begin, seconds=rng.uniform(0, 600))
+            stop = date + timedelta(hours=end, seconds=rng.uniform(-300, 300))
+            while now < stop:
+                process_name, titles = rng.choice(PROCESSES)
+                yield {"t": now, "type": "window", "process_name": process_name, "title": rng.choice(titles)}
+                block_end = now + timedelta(seconds=rng.uniform(60, 1500))
+                while now < min(block_end, stop):
+                    for _ in range(rng.randint(5, 80)):
+                        now += timedelta(seconds=rng.uniform(0.08, 0.5))
+                        yield {"t": now, "type": "key"}
+                    if process_name == "code.exe" and rng.random() < 0.3:
+                        now += timedelta(seconds=rng.uniform(0.2, 2))
+                        yield {"t": now, "type": "file", "event": "modified", "path": rng.choice(WATCHED_FILES)}
+                    if rng.random() < 0.01:
+                        now += timedelta(seconds=1)
+                        yield {"t": now, "type": "screenshot"}
+                    now += timedelta(seconds=rng.expovariate(1 / 20))
+                if rng.random() < 0.15:
+                    # 离开座位，足以触发空闲
+                    now += timedelta(seconds=rng.uniform(360, 1800))
+                    yield {"t": now, "type": "window", "process_name": None}
+            yield {"t": now, "type": "window", "process_name": None}
+
+
+class ReplayBackend(StubBackend):
+    """前台窗口由轨迹设置；截屏沿用 stub 的确定性合成画面"""
+    name = "replay"
+
+    def __init__(self, screen_size=(480, 270)):
+        super().__init__(monitors=[(0, 0, *screen_size)], keys_per_second=0)
+        self.window = None
+
+    def active_window(self):
+        return self.window
+
+    def set_window(self, process_name, title):
+        self.window = None if process_name is None else {
+            "title": title or "", "process_name": process_name, "exe_path": f"C:\\Program Files\\replay\\{process_name}"}
+
+
+class ChainSink:
+    """
+    在内存中按与 database.save_event 相同的定义计算哈希链，不写库；
+    同一轨迹用 memory 与 database 两种 sink 回放得到相同的链头哈希。
+    """
+    def __init__(self):
+        from database import _compute_hash
+        from details_codec import canonical_json
+        self._compute_hash, self._canonical_json = _compute_hash, canonical_json
+        self.head = "0" * 64
+        self.count = 0
+        self.counts = {}
+
+    def __call__(self, event_type: str, details: dict, timestamp: datetime):
+        self.head = self._compute_hash(self.head, timestamp, event_type, self._canonical_json(details))
+        self.count += 1
+        self.counts[event_type] = self.counts.get(event_type, 0) + 1
+
+
+class ReplayDriver:
+    def __init__(self, tracker, clock: VirtualClock, backend: ReplayBackend):
+        self.tracker, self.clock, self.backend = tracker, clock, backend
+        self.inputs = 0
+
+    def _apply(self, item):
+        kind = item["type"]
+        if kind == "key":
+            self.tracker._on_press(None)
+        elif kind == "window":
+            self.backend.set_window(item.get("process_name"), item.get("title"))
+        elif kind == "file":
+            event = item["event"]
+            if event not in FILE_EVENTS:
+                raise ValueError(f"Unknown file event {event!r}, expected one of {FILE_EVENTS}")
+            details = {"from_path": item["from_path"], "to_path": item["to_path"]} if event == "moved" else {"path": item["path"]}
+            self.tracker._update_activity(f"file_{event}", details)
+        elif kind == "screenshot":
+            bbox = item.get("bbox")
+            self.tracker.take_manual_screenshot(bbox=tuple(bbox) if bbox else None)
+        self.inputs += 1
+
+    def run(self, trace, end: datetime = None) -> dict:
+        """回放整条轨迹，之后继续运行 tick 直到 end（默认为最后一个输入的时刻），最后停止会话"""
+        trace = iter(trace)
+        first = next(trace, None)
+        if first is None:
+            raise ValueError("Trace is empty")
+        self.clock.advance_to(first["t"])
+        tracker = self.tracker
+        tracker.start(run_threads=False)
+        start = self.clock.now()
+        # 与线程版一致：空闲与窗口监控立即执行一次，自动截图在一个间隔之后
+        ticks = [(start, _TICK_PRIORITY, 0, tracker._idle_tick), (start, _TICK_PRIORITY, 1, tracker._window_tick),
+                 (start + timedelta(seconds=tracker._screenshot_interval()), _TICK_PRIORITY, 2, tracker._screenshot_tick)]
+        heapq.heapify(ticks)
+        pending, last_input = first, first["t"]
+        while True:
+            if pending is not None and pending["t"] <= ticks[0][0]:
+                self.clock.advance_to(pending["t"])
+                self._apply(pending)
+                last_input = pending["t"]
+                pending = next(trace, None)
+                continue
+            moment, priority, order, tick = ticks[0]
+            if pending is None and moment > (end or last_input):
+                break
+            self.clock.advance_to(moment)
+            delay = tick()
+            heapq.heapreplace(ticks, (moment + timedelta(seconds=delay), priority, order, tick))
+        self.clock.advance_to(max(self.clock.now(), end or last_input))
+        session = tracker.stop()
+        return {"inputs": self.inputs, "start_time": session["start_time"], "end_time": session["end_time"]}
+
+
+def replay(trace, data_dir, sink: str = "memory", screen_size=(480, 270)) -> dict:
+    """在 data_dir 上回放一条轨迹（列表或可重复迭代的对象），返回事件数、各类型计数与链头哈希"""
+    import config
+    import database
+    config.set_data_paths(str(data_dir))
+    database.init_db()
+    database.clear_db()
+    from screenshot_store import get_store
+    get_store().clear()
+    from tracker import ActivityTracker
+
+    trace = list(trace)
+    clock = VirtualClock(trace[0]["t"] if trace else datetime.now())
+    backend = ReplayBackend(screen_size)
+    chain = ChainSink() if sink == "memory" else None
+    tracker = ActivityTracker(event_sink=chain or database.save_event, run_retention=False, backend=backend, clock=clock)
+    started = time.perf_counter()
+    session = ReplayDriver(tracker, clock, backend).run(trace)
+    elapsed = time.perf_counter() - started
+    simulated = (session["end_time"] - session["start_time"]).total_seconds()
+    result = {"inputs": session["inputs"], "simulated_seconds": simulated, "wall_seconds": elapsed,
+              "speedup": simulated / elapsed if elapsed else None}
+    if chain is not None:
+        result.update(events=chain.count, event_counts=chain.counts, head_hash=chain.head)
+    else:
+        counts = {}
+        for event in database.iter_events():
+            counts[event.event_type] = counts.get(event.event_type, 0) + 1
+        result.update(events=sum(counts.values()), event_counts=counts, head_hash=database.get_last_hash())
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deterministic replay of an input trace through ActivityTracker")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="JSON Lines 轨迹文件")
+    source.add_argument("--synthetic-days", type=int, help="生成指定天数的合成轨迹")
+    parser.add_argument("--seed", type=int, default=42, help="合成轨迹的随机种子")
+    parser.add_argument("--write-trace", default=None, help="把轨迹写入文件后退出")
+    parser.add_argument("--data-dir", default=None, help="回放使用的数据目录（会被清空），默认使用临时目录")
+    parser.add_argument("--sink", default="memory", choices=("memory", "database"), help="memory 只在内存中计算哈希链")
+    parser.add_argument("--repeat", type=int, default=1, help="回放次数；多次回放时检查链头哈希是否一致")
+    parser.add_argument("--verify", action="store_true", help="database sink 下回放后校验哈希链")
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    trace = list(load_trace(args.trace) if args.trace else synthetic_trace(args.synthetic_days, args.seed))
+    if args.write_trace:
+        print(f"[REPLAY] {write_trace(trace, args.write_trace)} inputs written to {args.write_trace}")
+        return None
+
+    data_dir = Path(args.data_dir) if args.data_dir else Path(tempfile.mkdtemp(prefix="lex_replay_"))
+    results = []
+    try:
+        for run in range(args.repeat):
+            result = replay(trace, data_dir, args.sink)
+            if args.verify and args.sink == "database":
+                import database
+                result["verify"] = database.verify_chain()
+            results.append(result)
+            print(f"[REPLAY] run {run + 1}: {result['inputs']} inputs -> {result['events']} events, "
+                  f"{result['simulated_seconds'] / 3600:.1f} h simulated in {result['wall_seconds']:.2f} s "
+                  f"({result['speedup']:.0f}x), head {result['head_hash'][:16]}"
+                  + (f", verify ok={result['verify']['ok']}" if "verify" in result else ""))
+    finally:
+        import database
+        if database.engine is not None: database.engine.dispose()
+        if not args.data_dir: shutil.rmtree(data_dir, ignore_errors=True)
+
+    deterministic = len({r["head_hash"] for r in results}) == 1
+    if args.repeat > 1:
+        print(f"[REPLAY] deterministic: {deterministic}")
+    if args.output:
+        Path(args.output).write_text(json.dumps({"runs": results, "deterministic": deterministic}, indent=2,
+                                                ensure_ascii=False, default=str), encoding="utf-8")
+    return results
+
+
+if __name__ == "__main__":
+    main()
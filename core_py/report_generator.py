@@ -8,7 +8,7 @@ import shutil
 from pathlib import Path
 
 from reportlab.pdfgen import canvas
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Image as PdfImage
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
 from reportlab.lib import colors
@@ -17,8 +17,11 @@ from reportlab.lib.pagesizes import letter
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
-from database import SessionLocal, Event
-from config import SCREENSHOT_DIR
+from database import SessionLocal, Event, load_details
+from screenshot_integrity import screenshot_files
+from config import (REPORT_EMBED_THUMBNAILS, REPORT_THUMBNAIL_MAX_SIZE,
+                    REPORT_THUMBNAIL_JPEG_QUALITY, REPORT_THUMBNAIL_WORKERS, REPORT_LOG_RENDERER)
+from metrics import REPORT_PHASE_SECONDS
 
 log = logging.getLogger(__name__)
 
@@ -51,10 +54,29 @@ except Exception as e:
     except Exception as fallback_e:
         log.error(f"FATAL: All font loading attempts failed. Fallback error: {fallback_e}")
 
+EVENT_TYPE_ZH = {
+    "environment_snapshot": "环境快照", "status_change": "状态变更", "keyboard_press": "键盘输入",
+    "heartbeat": "活跃心跳", "app_session": "应用聚焦", "screenshot_manual": "手动截屏",
+    "screenshot_auto": "自动截屏", "file_created": "文件创建", "file_modified": "文件修改",
+    "file_deleted": "文件删除", "file_moved": "文件移动", "governor_throttle": "资源调节", "retention_downsample": "截图降采样"
+}
+
+# 所有事件表格共用一个样式对象
+LOG_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0,0), (-1,-1), 'TOP'),
+    ('GRID', (0,0), (-1,-1), 0.5, colors.lightgrey),
+    ('BACKGROUND', (0,0), (0,-1), colors.whitesmoke),
+])
+
+LOG_RENDERERS = ("flowable", "canvas")
+
 class ReportGenerator:
     # (此类的其余部分与之前修复后的版本完全相同，为简洁此处省略)
     # ...
-    def __init__(self, start_date: datetime, end_date: datetime, user_info: dict, save_path: str, final_screenshot_dir_for_report: str):
+    def __init__(self, start_date: datetime, end_date: datetime, user_info: dict, save_path: str, final_screenshot_dir_for_report: str,
+                 embed_thumbnails: bool = REPORT_EMBED_THUMBNAILS, log_renderer: str = REPORT_LOG_RENDERER):
+        if log_renderer not in LOG_RENDERERS:
+            raise ValueError(f"Unknown log renderer {log_renderer!r}, expected one of {LOG_RENDERERS}")
         self.start_date = start_date
         self.end_date = end_date
         self.user_info = user_info
@@ -62,6 +84,9 @@ class ReportGenerator:
         self.story = []
         self.filepath = save_path
         self.final_screenshot_dir = Path(final_screenshot_dir_for_report)
+        self.embed_thumbnails = embed_thumbnails
+        self.log_renderer = log_renderer
+        self.thumbnails = {}
         
         self.doc = SimpleDocTemplate(self.filepath, pagesize=letter, rightMargin=0.75*inch, leftMargin=0.75*inch, topMargin=1*inch, bottomMargin=1*inch)
         
@@ -79,6 +104,37 @@ class ReportGenerator:
             query = db.query(Event).filter(Event.timestamp >= self.start_date, Event.timestamp <= self.end_date)
             return query.order_by(Event.id.asc()).all()
 
+    def _prepare_thumbnails(self, events):
+        """排版前并行生成本报告用到的全部缩略图：{文件名: (status, 路径, 宽, 高)}"""
+        from config import SCREENSHOT_DIR
+        from thumbnails import build_thumbnails
+        sources = {}
+        for event in events:
+            if not event.event_type.startswith("screenshot_"): continue
+            try:
+                details = load_details(event)
+            except Exception:
+                continue
+            for filename, sha256, _, pixels in screenshot_files(details):
+                sources[filename] = (self.final_screenshot_dir / filename, sha256, pixels)
+        if not sources: return {}
+        # 缓存放在数据目录的截图文件夹中，跨报告复用；未初始化时（如离线生成）放在报告截图文件夹中
+        cache_root = SCREENSHOT_DIR or self.final_screenshot_dir
+        return build_thumbnails(sources, cache_root, REPORT_THUMBNAIL_MAX_SIZE, REPORT_THUMBNAIL_JPEG_QUALITY,
+                                REPORT_THUMBNAIL_WORKERS)
+
+    def _thumbnail_flowables(self, filename: str):
+        from thumbnails import THUMB_OK, THUMB_MISMATCH
+        entry = self.thumbnails.get(filename)
+        if entry is None: return []
+        status, path, width, height = entry
+        if status == THUMB_MISMATCH:
+            return [Paragraph("<i>截图文件内容与哈希链记录不符，未嵌入缩略图。</i>", self.styles['ChineseNormal'])]
+        if status != THUMB_OK: return []
+        # 同一路径的图像在 PDF 中只存一份
+        scale = min(1.0, 5.4 * inch / width)
+        return [Spacer(1, 4), PdfImage(str(path), width=width * scale, height=height * scale, hAlign='LEFT')]
+
     def _add_header_footer(self, canvas: canvas.Canvas, doc):
         canvas.saveState()
         canvas.setFont(FONT_NAME, 9)
@@ -121,78 +177,89 @@ class ReportGenerator:
         self.story.append(Paragraph("以下信息为本次记录开始时，程序自动获取的计算机系统环境，用以佐证证据来源的同一性。", self.styles['ChineseNormal']))
         snapshot_event = next((e for e in events if e.event_type == 'environment_snapshot'), None)
         snapshot_details = {}
-        if snapshot_event and snapshot_event.details:
-             try: snapshot_details = json.loads(snapshot_event.details)
+        if snapshot_event:
+             try: snapshot_details = load_details(snapshot_event)
              except Exception: snapshot_details = {"error": "无法解析快照数据"}
         self.story.append(Paragraph(f"<pre>{json.dumps(snapshot_details, indent=4, ensure_ascii=False)}</pre>", self.styles['JsonCode']))
         self.story.append(PageBreak())
 
+    def _add_detailed_log_canvas(self, events):
+        from log_renderer import LogRowBuilder, CanvasLogSection, usable_frame_height
+        self.story.append(Paragraph("第二部分：详细活动日志", self.styles['ChineseH1']))
+        frame_height = usable_frame_height(self.doc)
+        builder = LogRowBuilder(FONT_NAME, EVENT_TYPE_ZH, self.final_screenshot_dir, frame_height, self.thumbnails)
+        rows = []
+        for event in events:
+            rows.extend(builder.rows(event, load_details))
+        self.story.append(CanvasLogSection(rows, FONT_NAME, frame_height))
+
+    def _detail_flowables(self, group) -> list:
+        """把 event_detail_groups 的一组条目转换为 flowable 引擎的段落与缩略图"""
+        from log_renderer import DETAIL_TEXT, DETAIL_NOTE, DETAIL_PATH, DETAIL_CODE, DETAIL_THUMBNAIL
+        flowables = []
+        for kind, content in group:
+            if kind == DETAIL_TEXT:
+                text = "".join(f"<b>{html.escape(part)}</b>" if bold else html.escape(part) for part, bold in content)
+                flowables.append(Paragraph(text, self.styles['ChineseNormal']))
+            elif kind == DETAIL_NOTE:
+                flowables.append(Paragraph(f"<i>{html.escape(content)}</i>", self.styles['ChineseNormal']))
+            elif kind == DETAIL_PATH:
+                flowables.append(Paragraph(html.escape(content).replace("\n", "<br/>"), self.styles['PathStyle']))
+            elif kind == DETAIL_CODE:
+                flowables.append(Paragraph(html.escape(content), self.styles['JsonCode']))
+            elif kind == DETAIL_THUMBNAIL:
+                flowables.extend(self._thumbnail_flowables(content))
+        return flowables
+
     def _add_detailed_log(self, events):
+        if self.log_renderer == "canvas":
+            return self._add_detailed_log_canvas(events)
+        from log_renderer import event_detail_groups
         self.story.append(Paragraph("第二部分：详细活动日志", self.styles['ChineseH1']))
         
         for event in events:
             event_time_local = event.timestamp
             
-            event_type_zh = {
-                "environment_snapshot": "环境快照", "status_change": "状态变更", "keyboard_press": "键盘输入",
-                "heartbeat": "活跃心跳", "app_session": "应用聚焦", "screenshot_manual": "手动截屏", 
-                "screenshot_auto": "自动截屏", "file_created": "文件创建", "file_modified": "文件修改", 
-                "file_deleted": "文件删除", "file_moved": "文件移动"
-            }.get(event.event_type, event.event_type)
-
-            details_content_list = []
-            try:
-                details_obj = json.loads(event.details) if event.details else {}
-                if event.event_type == 'app_session':
-                    app_title_safe = html.escape(details_obj.get('app_title', ''))
-                    title_text = f" - {app_title_safe}" if app_title_safe else ""
-                    details_content_list.append(Paragraph(f"应用 <b>[{details_obj.get('process_name', '未知')}{title_text}]</b> 持续聚焦 {details_obj.get('duration_seconds')} 秒。", self.styles['ChineseNormal']))
-                elif event.event_type == 'heartbeat':
-                     details_content_list.append(Paragraph("<i>程序确认用户活跃。</i>", self.styles['ChineseNormal']))
-                elif event.event_type == 'keyboard_press':
-                     details_content_list.append(Paragraph("<i>检测到键盘输入。</i>", self.styles['ChineseNormal']))
-                elif event.event_type.startswith("screenshot_"):
-                    filename = details_obj.get("filename")
-                    if filename:
-                        final_image_path = self.final_screenshot_dir / filename
-                        safe_path = html.escape(str(final_image_path))
-                        path_text = f"截图文件名: {filename}<br/>本机绝对路径: {safe_path}"
-                        details_content_list.append(Paragraph(path_text, self.styles['PathStyle']))
-                    else:
-                        details_content_list.append(Paragraph("截图事件，但未记录文件名。", self.styles['ChineseNormal']))
-                else:
-                    details_content_list.append(Paragraph(json.dumps(details_obj, ensure_ascii=False, sort_keys=True, indent=2), self.styles['JsonCode']))
-            except Exception:
-                details_content_list.append(Paragraph(f"无效数据: {event.details}", self.styles['JsonCode']))
+            event_type_zh = EVENT_TYPE_ZH.get(event.event_type, event.event_type)
+
+            # 分屏截图每个显示器单独占一行，多张缩略图超过一页时表格可在显示器之间断开
+            groups = [self._detail_flowables(group) for group in event_detail_groups(event, load_details, self.final_screenshot_dir)]
+            details_content_list, monitor_rows = groups[0], [["", cell] for cell in groups[1:]]
 
             log_data = [
                 [Paragraph("<b>时间:</b>", self.styles['ChineseBold']), Paragraph(event_time_local.strftime("%Y-%m-%d %H:%M:%S"), self.styles['ChineseNormal'])],
                 [Paragraph("<b>类型:</b>", self.styles['ChineseBold']), Paragraph(event_type_zh, self.styles['ChineseNormal'])],
                 [Paragraph("<b>详情:</b>", self.styles['ChineseBold']), details_content_list],
+                *monitor_rows,
                 [Paragraph("<b>哈希值:</b>", self.styles['ChineseBold']), Paragraph(f"数据: {event.data_hash[:16]}...<br/>前序: {event.previous_hash[:16]}...", self.styles['Code'])]
             ]
             
             log_table = Table(log_data, colWidths=[1.2 * inch, 5.8 * inch])
-            log_table.setStyle(TableStyle([
-                ('VALIGN', (0,0), (-1,-1), 'TOP'),
-                ('GRID', (0,0), (-1,-1), 0.5, colors.lightgrey),
-                ('BACKGROUND', (0,0), (0,-1), colors.whitesmoke),
-            ]))
+            log_table.setStyle(LOG_TABLE_STYLE)
             self.story.append(log_table)
             self.story.append(Spacer(1, 0.2 * inch))
 
     def generate(self) -> str | None:
-        events = self._get_events()
+        with REPORT_PHASE_SECONDS.labels("query").time():
+            events = self._get_events()
         if not events:
             log.warning("No events found to generate report.")
             return None
             
-        self._add_cover_page()
-        self._add_summary_and_snapshot(events)
-        self._add_detailed_log(events)
+        if self.embed_thumbnails:
+            with REPORT_PHASE_SECONDS.labels("thumbnails").time():
+                self.thumbnails = self._prepare_thumbnails(events)
+
+        with REPORT_PHASE_SECONDS.labels("cover").time():
+            self._add_cover_page()
+        with REPORT_PHASE_SECONDS.labels("summary").time():
+            self._add_summary_and_snapshot(events)
+        with REPORT_PHASE_SECONDS.labels("detailed_log").time():
+            self._add_detailed_log(events)
         
         try:
-            self.doc.build(self.story, onFirstPage=self._add_header_footer, onLaterPages=self._add_header_footer)
+            with REPORT_PHASE_SECONDS.labels("build").time():
+                self.doc.build(self.story, onFirstPage=self._add_header_footer, onLaterPages=self._add_header_footer)
             log.info(f"Report generated successfully at {self.filepath}")
             return self.filepath
         except Exception as e:
@@ -0,0 +1,265 @@
+# core_py/retention.py
+"""
+截图的分级保留策略。
+
+最近 SCREENSHOT_FULL_RESOLUTION_HOURS 小时内的截图始终保持原始分辨率；更早的截图按
+SCREENSHOT_RETENTION_TIERS 的年龄阈值逐级降采样。若截图占用仍超过 SCREENSHOT_DISK_BUDGET_BYTES，
+再从最旧的截图开始提前降到下一级，直到回到预算以内。截图永远不会被删除。
+
+每次降采样前先确认文件内容与哈希链中记录的摘要一致（不会把被篡改的文件“洗白”），
+之后写入一条 retention_downsample 事件，链接原始摘要与降采样后的摘要，
+使任何时刻磁盘上的截图都能由哈希链验证。帧存储中的关键帧与其差分帧整组重写：
+按新画面重新计算差分，新帧暂存后先记链、再替换。
+
+事件写入失败时放弃替换并删除暂存的新文件，磁盘上始终是哈希链能验证的版本。
+
+工作线程以低优先级运行：文件之间主动休眠，调节器处于节流状态时暂停处理。
+"""
+
+import io
+import os
+import time
+import logging
+from datetime import datetime
+from hashlib import sha256
+from pathlib import Path
+
+from PIL import Image
+
+from config import (SCREENSHOT_DISK_BUDGET_BYTES, SCREENSHOT_FULL_RESOLUTION_HOURS, SCREENSHOT_RETENTION_TIERS,
+                    RETENTION_CHECK_INTERVAL_SECONDS, RETENTION_PAUSE_SECONDS)
+from screenshot_integrity import (HashingWriter, SCREENSHOT_EVENT_TYPES, screenshot_files, png_pixels_match,
+                                  DOWNSAMPLE_EVENT_TYPE as RETENTION_EVENT_TYPE)
+from screenshot_store import get_store, ScreenshotStoreError
+
+log = logging.getLogger(__name__)
+
+
+def screenshot_catalog(db=None) -> dict:
+    """
+    按哈希链重建每张截图的当前状态：{filename: {"timestamp", "sha256", "size_bytes", "pixel_sha256", "scale"}}。
+    scale 是相对原始分辨率的比例：初始为截图事件记录的 scale（调节器缩小过的截图小于 1），
+    降采样事件会更新 sha256/size_bytes/pixel_sha256/scale。
+    """
+    from database import SessionLocal, Event, load_details
+    catalog = {}
+    owns_session = db is None
+    db = db or SessionLocal()
+    try:
+        query = (db.query(Event).filter(Event.event_type.in_(SCREENSHOT_EVENT_TYPES + (RETENTION_EVENT_TYPE,)))
+                 .order_by(Event.id.asc()))
+        for event in query.yield_per(1000):
+            try:
+                details = load_details(event, db)
+            except ValueError:
+                continue
+            if event.event_type == RETENTION_EVENT_TYPE:
+                entry = catalog.get(details.get("filename"))
+                if entry is not None and entry["sha256"] == details.get("original_sha256"):
+                    entry.update(sha256=details["sha256"], size_bytes=details["size_bytes"],
+                                 pixel_sha256=details.get("pixel_sha256"), scale=details["scale"])
+                continue
+            # 分屏截图的每个显示器文件各自降采样
+            for filename, digest, size_bytes, pixels in screenshot_files(details):
+                if digest:
+                    catalog[filename] = {"timestamp": event.timestamp, "sha256": digest, "size_bytes": size_bytes,
+                                         "pixel_sha256": pixels, "scale": details.get("scale", 1.0)}
+        return catalog
+    finally:
+        if owns_session: db.close()
+
+
+def target_scale(age_hours: float, tiers=SCREENSHOT_RETENTION_TIERS) -> float:
+    """按年龄应当达到的比例；tiers 为 ((最小小时数, 比例), ...)，比例逐级递减"""
+    scale = 1.0
+    for min_age_hours, tier_scale in tiers:
+        if age_hours >= min_age_hours: scale = min(scale, tier_scale)
+    return scale
+
+
+def next_scale(current: float, tiers=SCREENSHOT_RETENTION_TIERS):
+    """比 current 更低的下一级比例；已是最低一级时返回 None"""
+    lower = [tier_scale for _, tier_scale in tiers if tier_scale < current]
+    return max(lower) if lower else None
+
+
+class RetentionWorker:
+    def __init__(self, record_events=None, budget_bytes: int = SCREENSHOT_DISK_BUDGET_BYTES,
+                 full_resolution_hours: float = SCREENSHOT_FULL_RESOLUTION_HOURS, tiers=SCREENSHOT_RETENTION_TIERS,
+                 pause_seconds: float = RETENTION_PAUSE_SECONDS, should_yield=None):
+        # record_events([(event_type, details), ...]) 在同一事务中写入多条事件，成功时返回真值；
+        # None 表示 database.save_events（用到时才导入）。保留策略读写的都是本进程的数据库
+        self.record_events = record_events
+        self.budget_bytes = budget_bytes
+        self.full_resolution_hours = full_resolution_hours
+        self.tiers = tuple(sorted(tiers))
+        self.pause_seconds = pause_seconds
+        # 返回 True 时暂停处理（例如调节器正在节流）
+        self.should_yield = should_yield or (lambda: False)
+
+    def disk_usage(self) -> int:
+        from config import SCREENSHOT_DIR
+        files = sum(p.stat().st_size for p in Path(SCREENSHOT_DIR).glob("*.png"))
+        return files + get_store().disk_usage()
+
+    def run(self, stop_event, interval: float = RETENTION_CHECK_INTERVAL_SECONDS):
+        while not stop_event.wait(interval):
+            try:
+                self.run_pass(stop_event)
+            except Exception as e:
+                log.error(f"RETENTION: pass failed: {e}", exc_info=True)
+
+    def _units(self, catalog: dict):
+        """
+        保留策略的处理单位：普通 PNG 文件各自成一组；帧存储中的关键帧与引用它的差分帧必须一起重写，
+        组的年龄按最新的一帧计算。返回按时间排序的 [(时间, [文件名, ...], 是否在帧存储中)]。
+        """
+        store = get_store()
+        grouped, units = set(), []
+        for keyframe, deltas in store.groups().items():
+            names = [keyframe] + deltas
+            grouped.update(names)
+            if not all(name in catalog for name in names):
+                log.warning(f"RETENTION: frame group {keyframe} has frames without chained hashes, leaving it untouched")
+                continue
+            units.append((max(catalog[name]["timestamp"] for name in names), names, True))
+        for filename, entry in catalog.items():
+            if filename not in grouped:
+                units.append((entry["timestamp"], [filename], False))
+        units.sort(key=lambda unit: unit[0])
+        return units
+
+    def run_pass(self, stop_event=None, now: datetime = None) -> dict:
+        """执行一轮保留策略，返回本轮统计"""
+        now = now or datetime.now()
+        usage = self.disk_usage()
+        catalog = screenshot_catalog()
+        stats = {"usage_before": usage, "downsampled": 0, "skipped": 0, "over_budget": False}
+        for timestamp, names, in_store in self._units(catalog):
+            if stop_event is not None and stop_event.is_set(): break
+            age_hours = (now - timestamp).total_seconds() / 3600
+            if age_hours < self.full_resolution_hours: break  # 按时间排序，之后的都更新
+
+            current = catalog[names[0]]["scale"]
+            scale, reason = target_scale(age_hours, self.tiers), "age"
+            if scale >= current and usage > self.budget_bytes:
+                scale, reason = next_scale(current, self.tiers), "disk_budget"
+            if scale is None or scale >= current: continue
+
+            while self.should_yield() and not (stop_event is not None and stop_event.is_set()):
+                time.sleep(self.pause_seconds or 1)
+            if in_store:
+                freed = self._downsample_group(names, catalog, scale, reason)
+            else:
+                freed = self._downsample_file(names[0], catalog[names[0]], scale, reason)
+            if freed is None:
+                stats["skipped"] += len(names)
+            else:
+                usage -= freed; stats["downsampled"] += len(names)
+            if self.pause_seconds: time.sleep(self.pause_seconds)
+
+        stats["usage_after"] = self.disk_usage()
+        stats["over_budget"] = stats["usage_after"] > self.budget_bytes
+        if stats["over_budget"]:
+            log.warning(f"RETENTION: screenshots use {stats['usage_after']} bytes, still over the "
+                        f"{self.budget_bytes} byte budget after downsampling everything eligible")
+        return stats
+
+    def _resize(self, data: bytes, entry: dict, scale: float):
+        image = Image.open(io.BytesIO(data))
+        factor = scale / entry["scale"]
+        return image.resize((max(1, round(image.width * factor)), max(1, round(image.height * factor))), Image.LANCZOS)
+
+    def _record(self, events) -> bool:
+        record_events = self.record_events
+        if record_events is None:
+            from database import save_events as record_events
+        return bool(record_events(events))
+
+    def _event(self, filename: str, entry: dict, original_size: int, scale: float, reason: str,
+               digest: str, size_bytes: int, image, pixels: str = None):
+        details = {
+            "filename": filename, "reason": reason, "scale": scale, "previous_scale": entry["scale"],
+            "original_sha256": entry["sha256"], "original_size_bytes": original_size,
+            "sha256": digest, "size_bytes": size_bytes, "width": image.width, "height": image.height,
+        }
+        if pixels: details["pixel_sha256"] = pixels
+        return RETENTION_EVENT_TYPE, details
+
+    def _downsample_file(self, filename: str, entry: dict, scale: float, reason: str):
+        """返回释放的字节数；文件缺失、内容与哈希链不符或降采样不能省出空间时返回 None"""
+        from config import SCREENSHOT_DIR
+        path = Path(SCREENSHOT_DIR) / filename
+        try:
+            data = path.read_bytes()
+        except OSError as e:
+            log.warning(f"RETENTION: cannot read {filename}: {e}")
+            return None
+        if sha256(data).hexdigest() != entry["sha256"]:
+            log.warning(f"RETENTION: {filename} does not match its chained sha256, leaving it untouched")
+            return None
+
+        resized = self._resize(data, entry, scale)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            writer = HashingWriter(f)
+            resized.save(writer, "PNG")
+        if writer.size >= len(data):
+            tmp_path.unlink()
+            return None
+        # 先把替换记入哈希链再落盘；写入失败时保留原文件，不留下链上没有记录的版本
+        if not self._record([self._event(filename, entry, len(data), scale, reason, writer.hexdigest(), writer.size, resized)]):
+            log.error(f"RETENTION: could not chain the downsample of {filename}, keeping the original")
+            tmp_path.unlink()
+            return None
+        os.replace(tmp_path, path)
+        entry.update(sha256=writer.hexdigest(), size_bytes=writer.size, scale=scale)
+        log.info(f"RETENTION: {filename} downsampled to {scale:g}x ({reason}), {len(data)} -> {writer.size} bytes")
+        return len(data) - writer.size
+
+    def _downsample_group(self, names, catalog: dict, scale: float, reason: str):
+        """整组重写帧存储中的一个关键帧及其差分帧，返回释放的字节数；任何一帧无法通过校验时整组跳过并返回 None"""
+        store = get_store()
+        try:
+            originals = [store.read_png(name) for name in names]
+            old_bytes = sum(store.stored_size(name) for name in names)
+        except (OSError, ScreenshotStoreError) as e:
+            log.warning(f"RETENTION: cannot read frame group {names[0]}: {e}")
+            return None
+        for name, data in zip(names, originals):
+            entry = catalog[name]
+            # 编码器升级后差分帧重新编码的字节可能不同，此时按链上记录的像素摘要校验
+            if sha256(data).hexdigest() != entry["sha256"] and not (
+                    entry.get("pixel_sha256") and png_pixels_match(data, entry["pixel_sha256"])):
+                log.warning(f"RETENTION: {name} does not match its chained sha256, leaving group {names[0]} untouched")
+                return None
+
+        images = [self._resize(data, catalog[name], scale) for name, data in zip(names, originals)]
+        try:
+            staged = store.stage_group(names, images)
+        except ScreenshotStoreError as e:
+            log.info(f"RETENTION: skipping frame group {names[0]}: {e}")
+            return None
+        if staged.stored_bytes >= old_bytes:
+            staged.discard()
+            return None
+        # 整组的降采样记录在同一事务中写入，与整组替换对应
+        events = [self._event(name, catalog[name], len(data), scale, reason, header["sha256"], header["size_bytes"], image,
+                              header.get("pixel_sha256"))
+                  for (name, header), data, image in zip(staged.frames, originals, images)]
+        try:
+            committed = staged.commit(lambda: self._record(events))
+        except ScreenshotStoreError as e:
+            log.info(f"RETENTION: skipping frame group {names[0]}: {e}")
+            staged.discard()
+            return None
+        if not committed:
+            log.error(f"RETENTION: could not chain the downsample of frame group {names[0]}, keeping the originals")
+            staged.discard()
+            return None
+        for name, header in staged.frames:
+            catalog[name].update(sha256=header["sha256"], size_bytes=header["size_bytes"],
+                                 pixel_sha256=header.get("pixel_sha256"), scale=scale)
+        log.info(f"RETENTION: frame group {names[0]} ({len(names)} frames) downsampled to {scale:g}x ({reason}), "
+                 f"{old_bytes} -> {staged.stored_bytes} bytes")
+        return old_bytes - staged.stored_bytes
@@ -0,0 +1,123 @@
+# core_py/rollup.py
+"""
+按分钟汇总表（activity_minutes）的查询与重建。
+
+汇总表由 database.save_event 在写入事件的同一事务中增量维护，
+这里的查询只扫描分钟桶，耗时与时间范围内的分钟数成正比，与原始事件条数无关。
+
+重建命令:
+    python rollup.py rebuild <数据目录>
+"""
+
+import sys
+from collections import Counter
+from datetime import datetime, timedelta, date
+
+from config import WORKDAY_START_HOUR, OVERTIME_START_HOUR
+
+PERIODS = ("day", "week", "month")
+
+
+def period_bounds(period: str, day: date):
+    """返回 [start, end) 区间"""
+    if period == "day":
+        start = datetime.combine(day, datetime.min.time())
+        return start, start + timedelta(days=1)
+    if period == "week":
+        start = datetime.combine(day - timedelta(days=day.weekday()), datetime.min.time())
+        return start, start + timedelta(days=7)
+    if period == "month":
+        start = datetime(day.year, day.month, 1)
+        end = datetime(day.year + (day.month == 12), day.month % 12 + 1, 1)
+        return start, end
+    raise ValueError(f"Unsupported period: {period}")
+
+
+def is_overtime(minute: datetime) -> bool:
+    return minute.weekday() >= 5 or minute.hour < WORKDAY_START_HOUR or minute.hour >= OVERTIME_START_HOUR
+
+
+def summarize(period: str, day: date):
+    from database import SessionLocal, ActivityMinute, engine
+    start, end = period_bounds(period, day)
+    summary = {
+        "period": period, "start": start.isoformat(), "end": end.isoformat(),
+        "active_minutes": 0, "idle_minutes": 0, "overtime_minutes": 0, "keystrokes": 0, "screenshots": 0,
+        "days": [], "heatmap": [[0] * 24 for _ in range(7)], "top_processes": [],
+    }
+    if not engine: return summary
+
+    days = {}
+    processes = Counter()
+    with SessionLocal() as db:
+        rows = (db.query(ActivityMinute.minute, ActivityMinute.state, ActivityMinute.keystrokes,
+                         ActivityMinute.screenshots, ActivityMinute.process_name)
+                .filter(ActivityMinute.minute >= start, ActivityMinute.minute < end)
+                .order_by(ActivityMinute.minute.asc()).all())
+    for minute, state, keystrokes, screenshots, process_name in rows:
+        summary["keystrokes"] += keystrokes
+        summary["screenshots"] += screenshots
+        day_key = minute.date().isoformat()
+        day_entry = days.setdefault(day_key, {"date": day_key, "active_minutes": 0, "overtime_minutes": 0,
+                                              "keystrokes": 0, "first_active": None, "last_active": None})
+        day_entry["keystrokes"] += keystrokes
+        if state == "idle":
+            summary["idle_minutes"] += 1
+            continue
+        if state != "active":
+            continue
+        summary["active_minutes"] += 1
+        day_entry["active_minutes"] += 1
+        day_entry["first_active"] = day_entry["first_active"] or minute.isoformat()
+        day_entry["last_active"] = minute.isoformat()
+        summary["heatmap"][minute.weekday()][minute.hour] += 1
+        if is_overtime(minute):
+            summary["overtime_minutes"] += 1
+            day_entry["overtime_minutes"] += 1
+        if process_name:
+            processes[process_name] += 1
+
+    summary["days"] = list(days.values())
+    summary["top_processes"] = [{"process_name": name, "minutes": minutes} for name, minutes in processes.most_common(10)]
+    return summary
+
+
+def rebuild(batch_size: int = 5000):
+    """
+    丢弃全部分钟汇总，并按 id 顺序重放哈希链中的事件重新生成。
+    整个过程在一个事务内完成并持有写锁，期间追踪器的写入会等待。
+    """
+    from database import SessionLocal, ActivityMinute, db_lock, iter_events, load_details, _merge_rollup, _flush_rollup, engine
+    if not engine: return 0
+    count = 0
+    with db_lock, SessionLocal() as db:
+        try:
+            db.query(ActivityMinute).delete()
+            acc = {}
+            for event in iter_events(batch_size=batch_size, db=db):
+                try:
+                    details = load_details(event, db)
+                except ValueError:
+                    details = {}
+                _merge_rollup(acc, event.timestamp, event.event_type, details)
+                count += 1
+                if count % batch_size == 0:
+                    _flush_rollup(db, acc); acc = {}
+            _flush_rollup(db, acc)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    print(f"[ROLLUP] Rebuilt activity rollups from {count} events.")
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "rebuild":
+        print("Usage: python rollup.py rebuild <data_dir>")
+        sys.exit(1)
+    from config import set_data_paths
+    from database import init_db
+    set_data_paths(sys.argv[2])
+    init_db()
+    rebuild()
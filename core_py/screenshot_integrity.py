@@ -0,0 +1,207 @@
+# core_py/screenshot_integrity.py
+"""
+截图内容的完整性：写入时的流式哈希，以及导出截图目录的并行校验。
+
+截图事件的 details 中记录 sha256 与 size_bytes，二者随事件一起进入哈希链。
+写入时 HashingWriter 在 PIL 逐块编码输出的同时计算摘要，不需要再读一遍文件；
+校验时以内存映射读取文件，多个线程并行计算（hashlib 在大块数据上会释放 GIL）。
+
+帧存储中的差分帧在读取时重新编码为 PNG，Pillow/zlib 升级后编码结果可能与拍摄时逐字节不同，
+因此这些截图额外记录 pixel_sha256（解码后像素的摘要）。字节摘要不符、但记录了像素摘要的文件，
+解码后像素一致即视为通过，在结果中单独列出。
+
+命令行用法：
+    python screenshot_integrity.py <截图目录> [--db <数据库或归档文件>] [--workers N]
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from details_codec import ENCODING_MSGPACK, HAS_MSGPACK, decode_compact
+
+SCREENSHOT_EVENT_TYPES = ("screenshot_auto", "screenshot_manual")
+# 保留策略降采样截图时写入的事件，见 retention.py
+DOWNSAMPLE_EVENT_TYPE = "retention_downsample"
+
+
+# 计算像素摘要时每次取出的行数，避免为整屏再复制一份像素
+PIXEL_DIGEST_ROWS = 256
+
+
+def screenshot_files(details: dict) -> list:
+    """
+    截图事件本次写入的文件 [(文件名, sha256, size_bytes, pixel_sha256)]：普通截图为 filename；
+    分屏截图（见 monitor_capture.py）为 monitors 中各显示器的文件，未变化而跳过的显示器不计入。
+    pixel_sha256 只有进入帧存储的截图才有，其余为 None。
+    """
+    monitors = details.get("monitors")
+    if monitors is None:
+        filename = details.get("filename")
+        return [(filename, details.get("sha256"), details.get("size_bytes"), details.get("pixel_sha256"))] if filename else []
+    return [(m["filename"], m.get("sha256"), m.get("size_bytes"), None) for m in monitors if m.get("filename")]
+
+
+def pixel_sha256(image) -> str:
+    """解码后像素（连同模式与尺寸）的 SHA-256，与 PNG 编码器的版本和参数无关"""
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode())
+    for top in range(0, image.height, PIXEL_DIGEST_ROWS):
+        digest.update(image.crop((0, top, image.width, min(image.height, top + PIXEL_DIGEST_ROWS))).tobytes())
+    return digest.hexdigest()
+
+
+def png_pixels_match(source, expected_pixel_sha256: str) -> bool:
+    """source 为 PNG 文件路径或字节；解码失败或像素摘要不同时返回 False"""
+    import io
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as image:
+            image.load()
+            return pixel_sha256(image) == expected_pixel_sha256
+    except (OSError, ValueError):
+        return False
+
+
+class HashingWriter:
+    """
+    包装一个已打开的二进制文件，写入的同时更新 SHA-256。
+    故意不提供 fileno()：否则 PIL 会绕过 write() 直接写文件描述符，摘要就漏掉了这部分数据。
+    """
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self._hash.update(data)
+        written = self._file.write(data)
+        self.size += len(data) if written is None else written
+        return written
+
+    def flush(self):
+        self._file.flush()
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def hash_file(path) -> tuple:
+    """以内存映射读取文件，返回 (sha256, 字节数)"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:  # 空文件不能被映射
+            return hashlib.sha256().hexdigest(), 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest(), size
+
+
+def expected_hashes(db_path) -> dict:
+    """
+    从数据库（在用库或报告归档）读取截图事件记录的摘要：{filename: (sha256, size_bytes, pixel_sha256)}。
+    降采样过的截图取最后一次降采样后的摘要。直接用 sqlite3 打开，不影响应用当前的数据库连接与字符串表缓存；
+    早于本功能的截图没有摘要，会被跳过。
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+        compact = "details_blob" in columns
+        strings = {}
+        if compact and HAS_MSGPACK:
+            strings = dict(conn.execute("SELECT id, value FROM interned_strings"))
+        select = "SELECT event_type, details, details_blob, details_encoding FROM events" if compact else \
+                 "SELECT event_type, details, NULL, NULL FROM events"
+        event_types = SCREENSHOT_EVENT_TYPES + (DOWNSAMPLE_EVENT_TYPE,)
+        placeholders = ",".join("?" * len(event_types))
+        result = {}
+        for event_type, details_json, blob, encoding in conn.execute(
+                f"{select} WHERE event_type IN ({placeholders}) ORDER BY id", event_types):
+            try:
+                if encoding == ENCODING_MSGPACK:
+                    details = decode_compact(blob, strings.__getitem__)
+                else:
+                    details = json.loads(details_json) if details_json else {}
+            except (ValueError, KeyError, TypeError):
+                continue
+            if event_type == DOWNSAMPLE_EVENT_TYPE:
+                filename = details.get("filename")
+                # 只接受接在当前摘要之后的降采样记录
+                if filename in result and details.get("sha256") and result[filename][0] == details.get("original_sha256"):
+                    result[filename] = (details["sha256"], details.get("size_bytes"), details.get("pixel_sha256"))
+                continue
+            for filename, sha256, size_bytes, pixels in screenshot_files(details):
+                if sha256: result[filename] = (sha256, size_bytes, pixels)
+        return result
+    finally:
+        conn.close()
+
+
+def verify_directory(directory, expected: dict, workers: int = None) -> dict:
+    """
+    并行校验目录中的 PNG 截图。结果中的每个文件归入以下之一：
+    ok、mismatch（内容或大小与记录不符）、missing（有记录但文件不存在）、unrecorded（文件没有对应记录）。
+    ok 中字节不同、按像素摘要通过的文件（重新编码的差分帧）同时列在 reencoded 中。
+    """
+    directory = Path(directory)
+    files = sorted(directory.glob("*.png"))
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashed = list(pool.map(hash_file, files))
+    elapsed = time.perf_counter() - t0
+
+    ok, mismatch, unrecorded, reencoded = [], [], [], []
+    for path, (digest, size) in zip(files, hashed):
+        record = expected.get(path.name)
+        if record is None:
+            unrecorded.append(path.name)
+        elif digest == record[0] and (record[1] is None or size == record[1]):
+            ok.append(path.name)
+        elif len(record) > 2 and record[2] and png_pixels_match(path, record[2]):
+            ok.append(path.name); reencoded.append(path.name)
+        else:
+            mismatch.append({"filename": path.name, "expected_sha256": record[0], "actual_sha256": digest,
+                             "expected_size": record[1], "actual_size": size})
+    present = {path.name for path in files}
+    total_bytes = sum(size for _, size in hashed)
+    return {
+        "ok": not mismatch and all(name in present for name in expected),
+        "checked": len(files), "verified": len(ok), "reencoded": reencoded, "mismatch": mismatch,
+        "missing": sorted(name for name in expected if name not in present),
+        "unrecorded": unrecorded,
+        "bytes": total_bytes, "seconds": elapsed, "workers": workers,
+        "mb_per_second": total_bytes / 1e6 / elapsed if elapsed > 0 else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify screenshot files against the hashes recorded in the evidence chain.")
+    parser.add_argument("directory", help="Screenshot folder (e.g. a report's screenshot folder)")
+    parser.add_argument("--db", help="Database or report archive (.sqlite) holding the screenshot events; "
+                                     "defaults to db_<report>.sqlite next to a report folder")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    db_path = args.db
+    if db_path is None:
+        # 报告目录形如 <报告名>_截图，归档库为同目录下的 db_<报告名>.sqlite
+        folder = Path(args.directory).resolve()
+        candidate = folder.parent / f"db_{folder.name.rsplit('_', 1)[0]}.sqlite"
+        if not candidate.exists():
+            parser.error("--db is required when the folder is not a report screenshot folder")
+        db_path = candidate
+
+    result = verify_directory(args.directory, expected_hashes(db_path), args.workers)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
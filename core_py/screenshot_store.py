@@ -0,0 +1,400 @@
+# core_py/screenshot_store.py
+"""
+自动截图的关键帧/差分存储。
+
+相邻两次自动截图通常只有一小块区域不同（时钟、终端窗口）。把画面切成固定大小的图块，
+关键帧整张保存为 PNG，之后的帧只保存相对于最近一个关键帧发生变化的图块；
+每隔固定帧数、画面尺寸变化或变化图块过多时重新取关键帧。
+
+每一帧在哈希链中记录的 sha256 是整张画面标准 PNG 编码（PIL 默认参数）的摘要，与直接存成 PNG 文件时完全一致。
+关键帧文件中保存的就是这份 PNG 本身；差分帧还原时把变化的图块贴回关键帧再按同样参数编码。
+PNG 编码结果取决于 Pillow/zlib 的版本（例如换用 zlib-ng 的新版本），因此每一帧同时记录解码后像素的
+pixel_sha256（也写入截图事件）：重新编码的字节与 sha256 相同最好，不同时以像素摘要校验，
+像素也不符才视为损坏。还原结果放在 LRU 缓存中。
+
+判断图块是否变化只需要比较内容，当前关键帧只保留各图块的 16 字节摘要，不在内存中保留整屏像素。
+
+保留策略重写一组帧时，仍在接收新差分帧的关键帧（live_keyframe）不能重写。采集在另一进程中运行时，
+本进程的存储不写帧，由采集进程经管道告知当前关键帧（keyframe_listener / set_live_keyframe，见 capture.py）。
+
+帧文件格式（<截图文件名>.frame）：
+    MAGIC | 4 字节头部长度 | JSON 头部 | 负载
+关键帧的负载是整张 PNG；差分帧的负载是各变化图块的 PNG 依次拼接，偏移与长度记录在头部。
+"""
+
+import bisect
+import io
+import json
+import logging
+import os
+import struct
+import threading
+from collections import OrderedDict
+from hashlib import sha256, blake2b
+from pathlib import Path
+
+from PIL import Image
+
+from screenshot_integrity import HashingWriter, pixel_sha256
+
+MAGIC = b"LEXFRAME1\n"
+FRAME_SUFFIX = ".frame"
+STAGED_SUFFIX = ".staged"
+STORE_DIRNAME = "frames"
+
+log = logging.getLogger(__name__)
+
+
+class ScreenshotStoreError(Exception):
+    pass
+
+
+class _DiscardSink:
+    """只为计算标准 PNG 编码的摘要与大小，不保留数据"""
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def _encode_png(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _tile_digest(image, box) -> bytes:
+    return blake2b(image.crop(box).tobytes(), digest_size=16).digest()
+
+
+def _tile_boxes(size, tile_size):
+    width, height = size
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            yield left, top, min(left + tile_size, width), min(top + tile_size, height)
+
+
+class _LRU:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None: self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.capacity <= 0: return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class ScreenshotStore:
+    def __init__(self, root, tile_size: int = 128, keyframe_interval: int = 12,
+                 max_changed_ratio: float = 0.5, cache_entries: int = 16):
+        self.root = Path(root)
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.max_changed_ratio = max_changed_ratio
+        self._lock = threading.Lock()
+        # 最近一个关键帧：(文件名, 尺寸, 模式, 各图块的摘要)
+        self._keyframe = None
+        self._frames_since_keyframe = 0
+        # 当前关键帧的文件名；取新关键帧时通知 keyframe_listener(文件名)
+        self.live_keyframe = None
+        self.keyframe_listener = None
+        self._png_cache = _LRU(cache_entries)
+        self._keyframe_cache = _LRU(2)
+
+    def _frame_path(self, filename: str) -> Path:
+        return self.root / (Path(filename).name + FRAME_SUFFIX)
+
+    # --- 编码 ---
+    def _encode_keyframe(self, image):
+        """返回 (头部, 负载, 各图块的摘要)"""
+        png = _encode_png(image)
+        header = {"kind": "keyframe", "size": list(image.size), "mode": image.mode,
+                  "sha256": sha256(png).hexdigest(), "size_bytes": len(png), "pixel_sha256": pixel_sha256(image)}
+        tiles = [_tile_digest(image, box) for box in _tile_boxes(image.size, self.tile_size)]
+        return header, [png], tiles
+
+    def _encode_delta(self, image, keyframe_name: str, keyframe_size, keyframe_mode, key_tiles):
+        """返回相对于给定关键帧的 (头部, 负载)；尺寸不符或变化图块过多、应改存关键帧时返回 None"""
+        if keyframe_size != image.size or keyframe_mode != image.mode:
+            return None
+        changed = [box for box, key_digest in zip(_tile_boxes(image.size, self.tile_size), key_tiles)
+                   if _tile_digest(image, box) != key_digest]
+        if len(changed) > len(key_tiles) * self.max_changed_ratio:
+            return None
+        writer = HashingWriter(_DiscardSink())
+        image.save(writer, "PNG")
+        tiles, parts, offset = [], [], 0
+        for box in changed:
+            tile_png = _encode_png(image.crop(box))
+            tiles.append([box[0], box[1], offset, len(tile_png)])
+            parts.append(tile_png)
+            offset += len(tile_png)
+        header = {"kind": "delta", "keyframe": keyframe_name, "size": list(image.size), "mode": image.mode,
+                  "tile_size": self.tile_size, "tiles": tiles,
+                  "sha256": writer.hexdigest(), "size_bytes": writer.size, "pixel_sha256": pixel_sha256(image)}
+        return header, parts
+
+    def _write(self, filename: str, header: dict, payload_parts, suffix: str = "") -> Path:
+        """写入 <文件名>.frame<suffix>；suffix 非空时用于暂存，由调用方决定何时替换"""
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        path = self._frame_path(filename)
+        path = path.with_name(path.name + suffix)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack(">I", len(header_bytes)))
+            f.write(header_bytes)
+            for part in payload_parts:
+                f.write(part)
+        os.replace(tmp_path, path)
+        return path
+
+    # --- 写入 ---
+    def put(self, filename: str, image) -> dict:
+        """
+        存入一帧，返回 {"sha256", "size_bytes", "pixel_sha256", "stored_bytes", "kind"}。
+        sha256/size_bytes 描述的是整张画面的标准 PNG 编码，与 pixel_sha256 一起写入截图事件。
+        """
+        name = Path(filename).name
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            encoded = None
+            if self._keyframe is not None and self._frames_since_keyframe + 1 < self.keyframe_interval:
+                encoded = self._encode_delta(image, *self._keyframe)
+            if encoded is None:
+                header, parts, tiles = self._encode_keyframe(image)
+                self._keyframe = (name, image.size, image.mode, tiles)
+                self._frames_since_keyframe = 0
+                self.live_keyframe = name
+                if self.keyframe_listener is not None: self.keyframe_listener(name)
+                self._png_cache.put(name, parts[0])
+            else:
+                header, parts = encoded
+                self._frames_since_keyframe += 1
+            stored = self._write(name, header, parts).stat().st_size
+        return {"sha256": header["sha256"], "size_bytes": header["size_bytes"], "pixel_sha256": header["pixel_sha256"],
+                "stored_bytes": stored, "kind": header["kind"]}
+
+    # --- 读取 ---
+    def contains(self, filename: str) -> bool:
+        return self._frame_path(filename).exists()
+
+    def filenames(self):
+        if not self.root.exists(): return []
+        return sorted(p.name[:-len(FRAME_SUFFIX)] for p in self.root.glob("*" + FRAME_SUFFIX))
+
+    def _read_frame(self, filename: str):
+        path = self._frame_path(filename)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise ScreenshotStoreError(f"Screenshot {filename} is not in the store") from None
+        if not data.startswith(MAGIC):
+            raise ScreenshotStoreError(f"{path} is not a frame file")
+        start = len(MAGIC) + 4
+        (header_length,) = struct.unpack(">I", data[len(MAGIC):start])
+        header = json.loads(data[start:start + header_length])
+        return header, memoryview(data)[start + header_length:]
+
+    def _keyframe_image(self, name: str):
+        image = self._keyframe_cache.get(name)
+        if image is None:
+            image = Image.open(io.BytesIO(self.read_png(name)))
+            image.load()
+            self._keyframe_cache.put(name, image)
+        return image
+
+    def read_png(self, filename: str) -> bytes:
+        """
+        返回截图的 PNG。关键帧与编码器未变时与拍摄时逐字节相同；编码器变化后差分帧的字节可能不同，
+        此时按像素摘要校验。两种摘要都不符（或旧帧没有像素摘要）时抛出 ScreenshotStoreError。
+        """
+        name = Path(filename).name
+        cached = self._png_cache.get(name)
+        if cached is not None: return cached
+
+        header, payload = self._read_frame(name)
+        if header["kind"] == "keyframe":
+            png = bytes(payload)
+            if sha256(png).hexdigest() != header["sha256"]:
+                raise ScreenshotStoreError(f"Keyframe {name} does not match its recorded sha256")
+        else:
+            image = self._keyframe_image(header["keyframe"]).copy()
+            if list(image.size) != header["size"] or image.mode != header["mode"]:
+                raise ScreenshotStoreError(f"Keyframe {header['keyframe']} does not match delta {name}")
+            for left, top, offset, length in header["tiles"]:
+                image.paste(Image.open(io.BytesIO(payload[offset:offset + length])), (left, top))
+            png = _encode_png(image)
+            if sha256(png).hexdigest() != header["sha256"]:
+                if not header.get("pixel_sha256") or pixel_sha256(image) != header["pixel_sha256"]:
+                    raise ScreenshotStoreError(f"Reconstructed {name} does not match its recorded sha256")
+                log.warning(f"STORE: {name} re-encodes to different PNG bytes (encoder changed), pixels verified")
+        self._png_cache.put(name, png)
+        return png
+
+    def export(self, dest_dir, filenames=None) -> int:
+        """
+        把帧还原为 PNG 文件写入 dest_dir（报告导出使用），返回写出的文件数。
+        无法还原的帧记录错误后跳过，不影响其余截图与报告；校验时它们会显示为缺失。
+        """
+        dest_dir = Path(dest_dir)
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        count = 0
+        for name in (filenames if filenames is not None else self.filenames()):
+            try:
+                png = self.read_png(name)
+            except (ScreenshotStoreError, OSError, ValueError) as e:
+                log.error(f"STORE: cannot restore {name}, leaving it out of the export: {e}")
+                continue
+            (dest_dir / name).write_bytes(png)
+            count += 1
+        return count
+
+    # --- 按关键帧分组重写（保留策略使用） ---
+    def _read_header(self, path: Path) -> dict:
+        with open(path, "rb") as f:
+            prefix = f.read(len(MAGIC) + 4)
+            (header_length,) = struct.unpack(">I", prefix[len(MAGIC):])
+            return json.loads(f.read(header_length))
+
+    def groups(self) -> dict:
+        """{关键帧文件名: [引用它的差分帧文件名, ...]}"""
+        if not self.root.exists(): return {}
+        result = {}
+        for path in sorted(self.root.glob("*" + FRAME_SUFFIX)):
+            header = self._read_header(path)
+            name = path.name[:-len(FRAME_SUFFIX)]
+            if header["kind"] == "keyframe":
+                result.setdefault(name, [])
+            else:
+                result.setdefault(header["keyframe"], []).append(name)
+        return result
+
+    def stored_size(self, filename: str) -> int:
+        return self._frame_path(filename).stat().st_size
+
+    def set_live_keyframe(self, name):
+        """采集在另一进程中运行时，记录该进程当前的关键帧；None 表示没有"""
+        with self._lock:
+            self.live_keyframe = name
+
+    def _deltas_of(self, keyframe: str) -> list:
+        """
+        当前引用 keyframe 的差分帧。差分帧只引用拍摄时的当前关键帧，文件名按拍摄时间排序，
+        因此从关键帧往后扫描，遇到引用其他关键帧的差分帧即可停止（其间的关键帧跳过）。
+        """
+        names = self.filenames()
+        deltas = []
+        for name in names[bisect.bisect_right(names, keyframe):]:
+            header = self._read_header(self._frame_path(name))
+            if header["kind"] != "delta": continue
+            if header["keyframe"] != keyframe: break
+            deltas.append(name)
+        return deltas
+
+    def stage_group(self, names, images) -> "StagedGroup":
+        """
+        以 images 替换一组帧（names[0] 为关键帧，其余为它的差分帧），差分关系按新画面重新计算。
+        新帧先暂存，由 commit() 在存储锁内记链并替换。仍在接收新差分帧的当前关键帧不能重写。
+        """
+        if self.live_keyframe == names[0]:
+            raise ScreenshotStoreError(f"Keyframe {names[0]} is still in use")
+        key_header, key_parts, key_tiles = self._encode_keyframe(images[0])
+        encoded = [(names[0], key_header, key_parts)]
+        for name, image in zip(names[1:], images[1:]):
+            delta = self._encode_delta(image, names[0], images[0].size, images[0].mode, key_tiles)
+            if delta is None:
+                header, parts, _ = self._encode_keyframe(image)
+            else:
+                header, parts = delta
+            encoded.append((name, header, parts))
+        staged = [(name, header, self._write(name, header, parts, suffix=STAGED_SUFFIX)) for name, header, parts in encoded]
+        return StagedGroup(self, staged)
+
+    def _commit_group(self, staged, record=None) -> bool:
+        """
+        在存储锁内重新确认关键帧不在使用中、组成员没有变化（暂存期间可能写入了新的差分帧），
+        然后调用 record() 把替换记入哈希链，record 返回假值时不替换并返回 False。
+        持锁期间 put() 等待，新的差分帧不会在确认与替换之间插入。
+        """
+        keyframe = staged[0][0]
+        with self._lock:
+            if self.live_keyframe == keyframe:
+                raise ScreenshotStoreError(f"Keyframe {keyframe} is still in use")
+            if set(self._deltas_of(keyframe)) != {name for name, _, _ in staged[1:]}:
+                raise ScreenshotStoreError(f"Frame group {keyframe} changed while it was being rewritten")
+            if record is not None and not record():
+                return False
+            for name, _, staged_path in staged:
+                os.replace(staged_path, self._frame_path(name))
+                self._png_cache.pop(name); self._keyframe_cache.pop(name)
+            return True
+
+    def disk_usage(self) -> int:
+        if not self.root.exists(): return 0
+        return sum(p.stat().st_size for p in self.root.glob("*" + FRAME_SUFFIX))
+
+    def clear(self):
+        with self._lock:
+            if self.root.exists():
+                for path in self.root.glob("*" + FRAME_SUFFIX + "*"):
+                    path.unlink()
+            self._keyframe = None
+            self._frames_since_keyframe = 0
+            self.live_keyframe = None
+            self._png_cache.clear()
+            self._keyframe_cache.clear()
+
+
+class StagedGroup:
+    """stage_group 的结果：frames 为 [(文件名, 新头部)]，commit(record) 记链并替换旧帧，discard() 放弃"""
+    def __init__(self, store: ScreenshotStore, staged):
+        self._store = store
+        self._staged = staged
+        self.frames = [(name, header) for name, header, _ in staged]
+        self.stored_bytes = sum(path.stat().st_size for _, _, path in staged)
+
+    def commit(self, record=None) -> bool:
+        return self._store._commit_group(self._staged, record)
+
+    def discard(self):
+        for _, _, path in self._staged:
+            path.unlink(missing_ok=True)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store() -> ScreenshotStore:
+    """返回绑定到当前 SCREENSHOT_DIR 的存储；数据目录在运行时才确定，因此延迟创建"""
+    global _store
+    import config
+    if config.SCREENSHOT_DIR is None:
+        raise ScreenshotStoreError("SCREENSHOT_DIR is not initialized")
+    root = Path(config.SCREENSHOT_DIR) / STORE_DIRNAME
+    with _store_lock:
+        if _store is None or _store.root != root:
+            _store = ScreenshotStore(root, config.SCREENSHOT_TILE_SIZE, config.SCREENSHOT_KEYFRAME_INTERVAL,
+                                     config.SCREENSHOT_DELTA_MAX_CHANGED_RATIO, config.SCREENSHOT_CACHE_ENTRIES)
+        return _store
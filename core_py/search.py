@@ -0,0 +1,104 @@
+# core_py/search.py
+"""
+基于 SQLite FTS5 的全文检索：应用窗口标题、文件事件路径、截图文件名。
+
+索引由 database.save_event 在写入事件的同一事务中增量维护（FTS 行的 rowid 即事件 id），
+这里负责查询、分页与摘要高亮，以及从哈希链重建索引。
+"""
+
+import html
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+# snippet() 使用不可见的控制字符作为高亮标记，先整体转义再替换为 <mark>，避免窗口标题中的 HTML 被渲染
+_HL_OPEN, _HL_CLOSE = "\x02", "\x03"
+TRIGRAM_MIN_LENGTH = 3
+
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet).replace(_HL_OPEN, "<mark>").replace(_HL_CLOSE, "</mark>")
+
+
+def _like_highlight(body: str, terms) -> str:
+    """LIKE 回退路径下在 Python 中做高亮"""
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+    return _highlight(pattern.sub(lambda m: f"{_HL_OPEN}{m.group(0)}{_HL_CLOSE}", body))
+
+
+def search(q: str, start: datetime = None, end: datetime = None, page: int = 1, page_size: int = 20):
+    """
+    返回 {"total", "page", "page_size", "ranked", "results": [...]}。
+    ranked 为真时结果按相关度排序，每条的 rank 为 bm25 分数（越小越相关）；
+    trigram 索引下含少于 3 个字符的词时退回子串匹配，无法计算相关度，ranked 为假、rank 为 None，结果按时间倒序。
+    """
+    from database import engine, SEARCH_TABLE, search_uses_trigram, _sqlite_timestamp
+    terms = [t for t in q.split() if t]
+    result = {"total": 0, "page": page, "page_size": page_size, "ranked": True, "results": []}
+    if not engine or not terms: return result
+
+    filters, params = [], {"limit": page_size, "offset": (page - 1) * page_size}
+    if start is not None:
+        filters.append("e.timestamp >= :start"); params["start"] = _sqlite_timestamp(start)
+    if end is not None:
+        filters.append("e.timestamp <= :end"); params["end"] = _sqlite_timestamp(end)
+
+    # trigram 分词器无法匹配少于 3 个字符的词（例如两字中文词），此时退回到 LIKE 子串匹配
+    use_like = search_uses_trigram and any(len(t) < TRIGRAM_MIN_LENGTH for t in terms)
+    result["ranked"] = not use_like
+    with engine.connect() as conn:
+        if use_like:
+            for i, term in enumerate(terms):
+                filters.append(f"s.body LIKE :term{i} ESCAPE '\\'")
+                params[f"term{i}"] = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            select = "s.body AS body, NULL AS rank"
+            order = "e.timestamp DESC"
+        else:
+            filters.append(f"{SEARCH_TABLE} MATCH :query")
+            # 每个词都作为短语加引号，避免用户输入被解释为 FTS 查询语法
+            params["query"] = " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+            select = f"snippet({SEARCH_TABLE}, 0, '{_HL_OPEN}', '{_HL_CLOSE}', '…', 48) AS body, bm25({SEARCH_TABLE}) AS rank"
+            order = "rank"
+
+        where = " AND ".join(filters)
+        base = f"FROM {SEARCH_TABLE} AS s JOIN events AS e ON e.id = s.rowid WHERE {where}"
+        result["total"] = conn.execute(text(f"SELECT count(*) {base}"), params).scalar()
+        rows = conn.execute(text(
+            f"SELECT e.id, e.timestamp, e.event_type, {select} {base} ORDER BY {order} LIMIT :limit OFFSET :offset"
+        ), params).fetchall()
+
+    for row in rows:
+        result["results"].append({
+            "id": row.id, "timestamp": datetime.fromisoformat(row.timestamp).isoformat(),
+            "event_type": row.event_type, "rank": row.rank,
+            "snippet": _like_highlight(row.body, terms) if use_like else _highlight(row.body),
+        })
+    return result
+
+
+def rebuild_index(batch_size: int = 5000):
+    """清空并从哈希链重建全文索引"""
+    from database import SessionLocal, SEARCH_TABLE, db_lock, iter_events, load_details, _index_for_search, engine
+    if not engine: return 0
+    count = 0
+    with db_lock, SessionLocal() as db:
+        try:
+            db.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+            rows = []
+            for event in iter_events(batch_size=batch_size, db=db):
+                try:
+                    details = load_details(event, db)
+                except ValueError:
+                    details = {}
+                rows.append((event.id, event.timestamp, event.event_type, details))
+                count += 1
+                if len(rows) >= batch_size:
+                    _index_for_search(db, rows); rows = []
+            _index_for_search(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    print(f"[SEARCH] Rebuilt full-text index from {count} events.")
+    return count
@@ -0,0 +1,175 @@
+# core_py/server.py
+"""
+生产模式的 HTTP 服务器：按接口分级的有界线程池。
+
+Flask 自带服务器为每个连接开一个线程，数量不受限制；报告生成、截图等耗时请求一多，
+状态轮询就要和它们争抢资源，界面看起来像卡死。这里在接受连接后先窥视（MSG_PEEK）请求行，
+按路径把连接交给 heavy 或 light 线程池。两个池各自有固定的线程数和排队上限，
+排队已满时直接返回 503，耗时请求再多也挤不掉状态轮询的线程。
+
+每个连接只处理一个请求（HTTP/1.0），保证按连接分级等同于按请求分级。
+"""
+
+import json
+import os
+import select
+import socket
+import sys
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from config import (SERVER_MODE, SERVER_HEAVY_ROUTES, SERVER_HEAVY_WORKERS, SERVER_HEAVY_QUEUE_SIZE,
+                    SERVER_LIGHT_WORKERS, SERVER_LIGHT_QUEUE_SIZE, SERVER_SWITCH_INTERVAL_SECONDS)
+from metrics import HTTP_QUEUE_WAIT_SECONDS, HTTP_REJECTED
+
+log = logging.getLogger(__name__)
+
+SERVER_MODES = ("dev", "production")
+# 接受连接后等待请求行到达的最长时间；本机客户端几乎总是立即发送，超时的连接按轻量请求处理
+PEEK_TIMEOUT_SECONDS = 0.05
+PEEK_BYTES = 2048
+REJECT_DRAIN_SECONDS = 1.0
+
+_BUSY_BODY = json.dumps({"status": "error", "message": "服务器繁忙，请稍后重试。"}, ensure_ascii=False).encode("utf-8")
+_BUSY_RESPONSE = (
+    b"HTTP/1.0 503 Service Unavailable\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n"
+    b"Content-Length: " + str(len(_BUSY_BODY)).encode() + b"\r\n\r\n" + _BUSY_BODY
+)
+
+
+def resolve_server_mode() -> str:
+    """环境变量 LEX_SERVER_MODE 优先，其次是 config.SERVER_MODE；都未指定时打包程序用 production，源码运行用 dev"""
+    mode = os.environ.get("LEX_SERVER_MODE") or SERVER_MODE
+    if mode is None:
+        return "production" if getattr(sys, "frozen", False) else "dev"
+    if mode not in SERVER_MODES:
+        raise ValueError(f"Unknown server mode {mode!r}, expected one of {SERVER_MODES}")
+    return mode
+
+
+def is_heavy_path(path: str, heavy_routes=SERVER_HEAVY_ROUTES) -> bool:
+    path = path.split("?", 1)[0]
+    return any(path == route or path.startswith(route + "/") for route in heavy_routes)
+
+
+class _OneRequestHandler(WSGIRequestHandler):
+    # 显式指定后 werkzeug 不会升级到 HTTP/1.1，连接在一次请求后关闭
+    protocol_version = "HTTP/1.0"
+
+
+class _Tier:
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"http-{name}")
+        # 正在处理与排队中的连接总数上限
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        # 尚未完成的任务 {future: 连接}，关闭服务器时据此取消排队中的连接
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+    def submit(self, fn, request, *args):
+        future = self.pool.submit(fn, self, request, *args)
+        with self._pending_lock:
+            self._pending[future] = request
+        # 任务已经完成时回调会立即执行，不会留下残余条目
+        future.add_done_callback(self._forget)
+
+    def _forget(self, future):
+        with self._pending_lock:
+            self._pending.pop(future, None)
+
+    def pending(self) -> list:
+        with self._pending_lock:
+            return list(self._pending.items())
+
+
+class TieredWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host: str, port: int, app,
+                 heavy_workers: int = SERVER_HEAVY_WORKERS, heavy_queue_size: int = SERVER_HEAVY_QUEUE_SIZE,
+                 light_workers: int = SERVER_LIGHT_WORKERS, light_queue_size: int = SERVER_LIGHT_QUEUE_SIZE,
+                 heavy_routes=SERVER_HEAVY_ROUTES):
+        self.heavy = _Tier("heavy", heavy_workers, heavy_queue_size)
+        self.light = _Tier("light", light_workers, light_queue_size)
+        self.heavy_routes = tuple(heavy_routes)
+        super().__init__(host, port, app, handler=_OneRequestHandler)
+
+    def _peek_path(self, request) -> str:
+        try:
+            readable, _, _ = select.select([request], [], [], PEEK_TIMEOUT_SECONDS)
+            if not readable: return ""
+            head = request.recv(PEEK_BYTES, socket.MSG_PEEK)
+        except (OSError, ValueError):
+            return ""
+        parts = head.split(b"\r\n", 1)[0].split(b" ")
+        return parts[1].decode("latin-1") if len(parts) >= 2 else ""
+
+    def _classify(self, request) -> _Tier:
+        return self.heavy if is_heavy_path(self._peek_path(request), self.heavy_routes) else self.light
+
+    def process_request(self, request, client_address):
+        # 在接受连接的线程中调用，只做分级与入队，不读取请求内容
+        tier = self._classify(request)
+        if not tier.slots.acquire(blocking=False):
+            HTTP_REJECTED.labels(tier.name).inc()
+            log.warning(f"SERVER: {tier.name} queue full, rejecting connection from {client_address}")
+            threading.Thread(target=self._reject, args=(request,), daemon=True).start()
+            return
+        tier.submit(self._process_request_in_tier, request, client_address, time.perf_counter())
+
+    def _reject(self, request):
+        # 回复 503 后读掉客户端尚未发完的请求体再关闭，否则直接关闭会触发 RST，客户端可能读不到 503
+        try:
+            request.sendall(_BUSY_RESPONSE)
+            request.shutdown(socket.SHUT_WR)
+            request.settimeout(REJECT_DRAIN_SECONDS)
+            deadline = time.monotonic() + REJECT_DRAIN_SECONDS
+            while time.monotonic() < deadline and request.recv(65536):
+                pass
+        except OSError:
+            pass
+        finally:
+            self.close_request(request)
+
+    def _process_request_in_tier(self, tier: _Tier, request, client_address, enqueued_at: float):
+        HTTP_QUEUE_WAIT_SECONDS.labels(tier.name).observe(time.perf_counter() - enqueued_at)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            tier.slots.release()
+
+    def server_close(self):
+        super().server_close()
+        for tier in (self.heavy, self.light):
+            tier.pool.shutdown(wait=False)
+            # 排队中尚未开始的连接由这里关闭并归还名额；正在处理的请求照常完成
+            for future, request in tier.pending():
+                if future.cancel():
+                    self.shutdown_request(request)
+                    tier.slots.release()
+
+
+def serve(app, host: str, port: int):
+    """以生产模式阻塞运行，直到进程退出"""
+    # 缩短 GIL 切换间隔，耗时请求占着 GIL 时轻量请求的线程也能很快被调度。
+    # sys.setswitchinterval 作用于整个进程而不只是服务器线程，因此只在启动时设置一次、不再恢复
+    sys.setswitchinterval(SERVER_SWITCH_INTERVAL_SECONDS)
+    server = TieredWSGIServer(host, port, app)
+    log.info(f"SERVER: production mode on http://{host}:{port} "
+             f"(heavy {SERVER_HEAVY_WORKERS}+{SERVER_HEAVY_QUEUE_SIZE}, light {SERVER_LIGHT_WORKERS}+{SERVER_LIGHT_QUEUE_SIZE})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,59 @@
+# core_py/test_rollup.py
+"""分钟汇总表的增量维护与重建：事件写入顺序不同时结果应一致"""
+
+from datetime import datetime
+
+import pytest
+
+import config
+
+
+@pytest.fixture
+def db(tmp_path):
+    config.set_data_paths(str(tmp_path))
+    import database
+    database.init_db()
+    database.clear_db()
+    return database
+
+
+def _states(database):
+    with database.SessionLocal() as session:
+        rows = session.query(database.ActivityMinute.minute, database.ActivityMinute.state).all()
+    return {minute.strftime("%H:%M"): state for minute, state in rows}
+
+
+def _session(start: str, end: str) -> dict:
+    return {"process_name": "editor.exe", "app_title": "notes", "start_time": f"2026-01-05T{start}",
+            "end_time": f"2026-01-05T{end}", "duration_seconds": 1}
+
+
+def test_session_ending_after_idle_keeps_idle_minute(db):
+    # 追踪器先写 status_change idle，下一次窗口轮询才结束应用会话
+    db.save_event("keyboard_press", {}, datetime(2026, 1, 5, 10, 3, 0))
+    db.save_event("status_change", {"status": "idle", "duration_seconds": 300}, datetime(2026, 1, 5, 10, 5, 10))
+    db.save_event("app_session", _session("10:03:00", "10:05:12"), datetime(2026, 1, 5, 10, 5, 12))
+    assert _states(db) == {"10:03": "active", "10:04": "active", "10:05": "idle"}
+
+
+def test_session_backfill_does_not_override_idle_in_earlier_minute(db):
+    db.save_event("status_change", {"status": "idle", "duration_seconds": 300}, datetime(2026, 1, 5, 10, 5, 59))
+    db.save_event("app_session", _session("10:04:00", "10:06:01"), datetime(2026, 1, 5, 10, 6, 1))
+    assert _states(db) == {"10:04": "active", "10:05": "idle", "10:06": "active"}
+
+
+def test_activity_after_session_in_same_minute_still_wins(db):
+    db.save_event("app_session", _session("10:04:00", "10:05:02"), datetime(2026, 1, 5, 10, 5, 2))
+    db.save_event("status_change", {"status": "idle", "duration_seconds": 300}, datetime(2026, 1, 5, 10, 5, 30))
+    assert _states(db)["10:05"] == "idle"
+
+
+def test_rebuild_matches_incremental(db):
+    from rollup import rebuild
+    db.save_event("keyboard_press", {}, datetime(2026, 1, 5, 10, 3, 0))
+    db.save_event("status_change", {"status": "idle", "duration_seconds": 300}, datetime(2026, 1, 5, 10, 5, 10))
+    db.save_event("app_session", _session("10:03:00", "10:05:12"), datetime(2026, 1, 5, 10, 5, 12))
+    db.save_event("status_change", {"status": "active"}, datetime(2026, 1, 5, 10, 9, 0))
+    incremental = _states(db)
+    rebuild()
+    assert _states(db) == incremental
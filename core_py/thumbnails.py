@@ -0,0 +1,109 @@
+# core_py/thumbnails.py
+"""
+报告内嵌的截图缩略图。
+
+排版开始前用线程池并行完成校验、缩小与 JPEG 编码（hashlib 与 Pillow 在这些步骤中释放 GIL），
+结果按截图内容的 SHA-256 缓存在截图目录下的 .thumbs 中：同一张截图在多份报告之间只缩小一次；
+内容相同的多张截图共用一个缩略图文件，reportlab 按文件名复用图像对象，因此在 PDF 中也只嵌入一次。
+每份报告都会重新校验截图文件（只计算摘要），内容与哈希链记录不符的截图不嵌入缩略图；
+字节摘要不符但链上记录了像素摘要的截图（编码器升级后重新编码的差分帧）按像素校验。
+"""
+
+import os
+import shutil
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from screenshot_integrity import hash_file, png_pixels_match
+
+log = logging.getLogger(__name__)
+
+THUMBS_DIRNAME = ".thumbs"
+
+# build_thumbnails 结果中 status 的取值
+THUMB_OK = "ok"
+THUMB_MISSING = "missing"
+THUMB_MISMATCH = "mismatch"
+THUMB_FAILED = "failed"
+
+
+def cache_dir(screenshot_dir) -> Path:
+    return Path(screenshot_dir) / THUMBS_DIRNAME
+
+
+def clear_cache(screenshot_dir):
+    shutil.rmtree(cache_dir(screenshot_dir), ignore_errors=True)
+
+
+def _thumbnail_path(directory: Path, digest: str, max_size, quality: int) -> Path:
+    # 尺寸与质量写进文件名，修改配置后旧缓存自然失效
+    return directory / f"{digest}_{max_size[0]}x{max_size[1]}_q{quality}.jpg"
+
+
+def _build_group(sources, expected_sha256, expected_pixels, directory: Path, max_size, quality: int) -> dict:
+    """
+    sources 为 [(文件名, 截图路径)]，记录的摘要相同。每个文件都单独校验；缩略图只从第一个校验通过的文件生成一次。
+    返回 {文件名: (status, 缩略图路径, 宽, 高)}；在工作线程中运行。
+    """
+    results, verified = {}, []
+    for filename, path in sources:
+        try:
+            digest, _ = hash_file(path)
+        except FileNotFoundError:
+            results[filename] = (THUMB_MISSING, None, 0, 0)
+            continue
+        if expected_sha256 and digest != expected_sha256 and not (expected_pixels and png_pixels_match(path, expected_pixels)):
+            results[filename] = (THUMB_MISMATCH, None, 0, 0)
+        else:
+            verified.append((filename, path, digest))
+    if not verified: return results
+
+    _, path, digest = verified[0]
+    target = _thumbnail_path(directory, digest, max_size, quality)
+    try:
+        if target.exists():
+            with Image.open(target) as cached:
+                entry = (THUMB_OK, target, cached.width, cached.height)
+        else:
+            with Image.open(path) as image:
+                image.thumbnail(max_size, Image.LANCZOS)
+                thumbnail = image if image.mode == "RGB" else image.convert("RGB")
+                # 内容相同但没有记录摘要的截图可能同时生成同一个缩略图，临时文件各用各的
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    thumbnail.save(f, "JPEG", quality=quality, optimize=True)
+            os.replace(tmp_path, target)
+            entry = (THUMB_OK, target, thumbnail.width, thumbnail.height)
+    except (OSError, ValueError) as e:
+        log.warning(f"THUMBNAILS: cannot build a thumbnail for {path}: {e}")
+        entry = (THUMB_FAILED, None, 0, 0)
+    for filename, _, _ in verified:
+        results[filename] = entry
+    return results
+
+
+def build_thumbnails(sources: dict, screenshot_dir, max_size, quality: int, workers: int = None) -> dict:
+    """
+    sources 为 {文件名: (截图路径, 哈希链记录的 sha256 或 None, 记录的 pixel_sha256 或 None)}。
+    返回 {文件名: (status, 缩略图路径, 宽, 高)}；记录的摘要相同的截图只生成一个缩略图。
+    """
+    directory = cache_dir(screenshot_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    max_size = tuple(max_size)
+
+    groups = {}
+    for filename, (path, expected, pixels) in sources.items():
+        # 没有记录摘要的旧截图各自成组
+        groups.setdefault(expected or ("", filename), (expected, pixels, []))[2].append((filename, Path(path)))
+
+    results = {}
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail") as pool:
+        for group_results in pool.map(lambda group: _build_group(group[2], group[0], group[1], directory, max_size, quality),
+                                      groups.values()):
+            results.update(group_results)
+    return results
@@ -1,8 +1,6 @@
 import threading
-import time
 from datetime import datetime
-from pynput import keyboard
-from PIL import Image, ImageGrab
+from PIL import Image
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import logging
@@ -10,9 +8,18 @@ import logging
 # 【修改】移除顶层的 SCREENSHOT_DIR 导入，因为它在加载时会是 None
 from config import (IDLE_THRESHOLD_SECONDS, SCREENSHOT_INTERVAL_SECONDS, 
                     WINDOW_CHECK_INTERVAL_SECONDS, IDLE_CHECK_INTERVAL_SECONDS, 
-                    WATCHED_DIRECTORIES, HEARTBEAT_INTERVAL_SECONDS)
-from database import save_event
-from window_monitor import get_active_window_info
+                    WATCHED_DIRECTORIES, HEARTBEAT_INTERVAL_SECONDS,
+                    GOVERNOR_ENABLED, GOVERNOR_SAMPLE_INTERVAL_SECONDS,
+                    GOVERNOR_CPU_BUDGET_PERCENT, GOVERNOR_WRITE_BUDGET_BYTES_PER_SECOND,
+                    SCREENSHOT_DELTA_ENABLED, RETENTION_ENABLED,
+                    SCREENSHOT_PER_MONITOR, SCREENSHOT_ENCODE_WORKERS)
+from metrics import WINDOW_POLL_SECONDS, SCREENSHOT_PHASE_SECONDS, SCREENSHOTS_TAKEN, INPUT_CALLBACK_SECONDS
+from clock import SYSTEM_CLOCK
+from governor import OverheadGovernor, estimate_event_bytes
+from screenshot_integrity import HashingWriter
+from screenshot_store import get_store
+from monitor_capture import MonitorCapture
+from retention import RetentionWorker
 
 log = logging.getLogger(__name__)
 
@@ -28,33 +35,92 @@ class FileChangeEventHandler(FileSystemEventHandler):
         if not event.is_directory: self.tracker._update_activity("file_moved", {"from_path": event.src_path, "to_path": event.dest_path})
 
 class ActivityTracker:
-    def __init__(self):
+    """
+    event_sink(event_type, details, timestamp) 接收产生的事件：同进程运行时直接写库，
+    在采集进程中运行时把事件发回写库的进程（见 capture.py）。时间戳在事件源处记录，不受写入排队的影响。
+    run_retention 为 False 时不启动截图保留策略，由写库的进程负责。
+    backend 提供截屏、活动窗口与键盘钩子（见 capture_backends.py），默认按配置选择。
+    clock 提供当前时间（见 clock.py），默认为系统时钟；各监控循环的单步逻辑在 *_tick 方法中，
+    返回距下一次调用的秒数，回放时由 replay.py 按虚拟时间调度，不启动线程。
+    """
+    def __init__(self, event_sink=None, run_retention: bool = True, backend=None, clock=None):
+        if event_sink is None:
+            from database import save_event as event_sink
+        self.event_sink = event_sink
+        if backend is None:
+            from capture_backends import get_backend
+            backend = get_backend()
+        self.backend = backend
+        self.clock = clock or SYSTEM_CLOCK
+        self.monitor_capture = MonitorCapture(backend, SCREENSHOT_ENCODE_WORKERS)
+        self.run_retention = run_retention
         self.stop_event = threading.Event(); self.threads = []; self.listeners = []
-        self.last_activity_time = time.time(); self.is_idle = False; self.is_running = False
+        self.last_activity_time = self.clock.time(); self.is_idle = False; self.is_running = False
+        self.last_heartbeat_time = self.last_activity_time
         self.file_observer = None; self.current_app_session = None
         self.session_start_time = None
+        # 调节器的升降级事件不是用户活动，直接写入而不经过 _update_activity
+        self.governor = OverheadGovernor(self._emit, GOVERNOR_CPU_BUDGET_PERCENT, GOVERNOR_WRITE_BUDGET_BYTES_PER_SECOND)
+        self._key_lock = threading.Lock(); self._pending_keys = 0; self._pending_keys_since = None
+        # 保留策略直接读写本进程的数据库（降采样记录需与文件替换一起确认写入）；调节器节流时让出资源
+        self.retention = RetentionWorker(should_yield=lambda: self.governor.level > 0)
+
+    def _emit(self, event_type: str, details: dict):
+        self.event_sink(event_type, details, self.clock.now())
 
     def _update_activity(self, event_type: str, details: dict):
-        self.last_activity_time = time.time()
+        self.last_activity_time = self.clock.time()
         if self.is_idle:
-            self.is_idle = False; save_event("status_change", {"status": "active"})
-        save_event(event_type, details)
+            self.is_idle = False; self._emit("status_change", {"status": "active"})
+        self._emit(event_type, details)
+        self.governor.charge_write(estimate_event_bytes(details))
+        self.governor.report_thread_cpu()
     
-    def _on_press(self, key): self._update_activity("keyboard_press", details={});
+    def _on_press(self, key):
+        with INPUT_CALLBACK_SECONDS.time():
+            self._handle_press()
+
+    def _handle_press(self):
+        window = self.governor.settings["keyboard_window_seconds"]
+        if not window or self.is_idle:
+            # 正常情况下每次按键一条事件；从空闲恢复时也立即记录，保证状态变更的时间准确
+            self._flush_pending_keys(); self._update_activity("keyboard_press", details={}); return
+        now = self.clock.time()
+        self.last_activity_time = now
+        with self._key_lock:
+            self._pending_keys += 1
+            if self._pending_keys_since is None: self._pending_keys_since = now
+            due = now - self._pending_keys_since >= window
+        if due: self._flush_pending_keys()
+
+    def _flush_pending_keys(self, only_if_due=False):
+        """把聚合窗口内的按键合并成一条带计数的 keyboard_press 事件"""
+        window = self.governor.settings["keyboard_window_seconds"]
+        with self._key_lock:
+            if not self._pending_keys: return
+            if only_if_due and window and self.clock.time() - self._pending_keys_since < window: return
+            count, since = self._pending_keys, self._pending_keys_since
+            self._pending_keys = 0; self._pending_keys_since = None
+        self._update_activity("keyboard_press", {"count": count, "window_start": datetime.fromtimestamp(since).isoformat()})
+
+    def _idle_tick(self) -> float:
+        self._flush_pending_keys(only_if_due=True)
+        self.governor.report_thread_cpu()
+        idle_duration = self.clock.time() - self.last_activity_time
+        if not self.is_idle and idle_duration > IDLE_THRESHOLD_SECONDS:
+            self.is_idle = True; self._update_activity("status_change", {"status": "idle", "duration_seconds": int(idle_duration)})
+        if not self.is_idle and (self.clock.time() - self.last_heartbeat_time > HEARTBEAT_INTERVAL_SECONDS):
+            self._update_activity("heartbeat", {"message": "User is active."}); self.last_heartbeat_time = self.clock.time()
+        return IDLE_CHECK_INTERVAL_SECONDS
 
     def _monitor_idle_status(self):
-        last_heartbeat_time = time.time()
+        self.governor.register_thread()
         while not self.stop_event.is_set():
-            idle_duration = time.time() - self.last_activity_time
-            if not self.is_idle and idle_duration > IDLE_THRESHOLD_SECONDS:
-                self.is_idle = True; self._update_activity("status_change", {"status": "idle", "duration_seconds": int(idle_duration)})
-            if not self.is_idle and (time.time() - last_heartbeat_time > HEARTBEAT_INTERVAL_SECONDS):
-                self._update_activity("heartbeat", {"message": "User is active."}); last_heartbeat_time = time.time()
-            self.stop_event.wait(IDLE_CHECK_INTERVAL_SECONDS)
+            self.stop_event.wait(self._idle_tick())
             
     def _end_app_session(self):
         if self.current_app_session:
-            end_time = datetime.now()
+            end_time = self.clock.now()
             duration = (end_time - self.current_app_session['start_time_obj']).total_seconds()
             if duration > 1:
                 session_details = {
@@ -64,42 +130,63 @@ class ActivityTracker:
                     "end_time": end_time.isoformat(),
                     "duration_seconds": round(duration)
                 }
-                save_event("app_session", session_details)
+                self._emit("app_session", session_details)
             self.current_app_session = None
             
+    def _window_tick(self) -> float:
+        self.governor.report_thread_cpu()
+        poll_interval = WINDOW_CHECK_INTERVAL_SECONDS * self.governor.settings["window_poll_factor"]
+        if not self.is_running or self.is_idle:
+            self._end_app_session()
+            return poll_interval
+
+        with WINDOW_POLL_SECONDS.time():
+            active_info = self.backend.active_window()
+        if active_info:
+            current_process = active_info.get("process_name", "unknown")
+            current_title = active_info.get("title", "")
+
+            if not self.current_app_session:
+                self.current_app_session = {
+                    "process_name": current_process, "app_title": current_title, 
+                    "start_time_obj": self.clock.now()
+                }
+            elif (self.current_app_session['process_name'] != current_process or 
+                  self.current_app_session['app_title'] != current_title):
+                self._end_app_session()
+                self.current_app_session = {
+                    "process_name": current_process, "app_title": current_title,
+                    "start_time_obj": self.clock.now()
+                }
+        else:
+            self._end_app_session()
+        return poll_interval
+
     def _monitor_active_window(self):
+        self.governor.register_thread()
         while not self.stop_event.is_set():
-            if not self.is_running or self.is_idle:
-                self._end_app_session()
-                self.stop_event.wait(WINDOW_CHECK_INTERVAL_SECONDS)
-                continue
-            
-            active_info = get_active_window_info()
-            if active_info:
-                current_process = active_info.get("process_name", "unknown")
-                current_title = active_info.get("title", "")
-
-                if not self.current_app_session:
-                    self.current_app_session = {
-                        "process_name": current_process, "app_title": current_title, 
-                        "start_time_obj": datetime.now()
-                    }
-                elif (self.current_app_session['process_name'] != current_process or 
-                      self.current_app_session['app_title'] != current_title):
-                    self._end_app_session()
-                    self.current_app_session = {
-                        "process_name": current_process, "app_title": current_title,
-                        "start_time_obj": datetime.now()
-                    }
-            else:
-                self._end_app_session()
-            self.stop_event.wait(WINDOW_CHECK_INTERVAL_SECONDS)
-            
+            self.stop_event.wait(self._window_tick())
+
+    def _screenshot_interval(self) -> float:
+        return SCREENSHOT_INTERVAL_SECONDS * self.governor.settings["screenshot_interval_factor"]
+
+    def _screenshot_tick(self) -> float:
+        """到点时调用：非空闲则自动截图，返回到下一次截图的秒数"""
+        if not self.is_idle: self.take_manual_screenshot(is_auto=True)
+        self.governor.report_thread_cpu()
+        return self._screenshot_interval()
+
     def _auto_screenshot_taker(self):
-        while not self.stop_event.is_set():
-            self.stop_event.wait(SCREENSHOT_INTERVAL_SECONDS)
-            if self.stop_event.is_set(): break
-            if not self.is_idle: self.take_manual_screenshot(is_auto=True)
+        self.governor.register_thread()
+        interval = self._screenshot_interval()
+        while not self.stop_event.wait(interval):
+            interval = self._screenshot_tick()
+
+    def _govern_overhead(self):
+        self.governor.register_thread()
+        while not self.stop_event.wait(GOVERNOR_SAMPLE_INTERVAL_SECONDS):
+            self.governor.report_thread_cpu()
+            self.governor.sample()
             
     def take_manual_screenshot(self, bbox=None, is_auto=False):
         # 【核心修复】在函数执行时动态导入 SCREENSHOT_DIR，确保获取到最新的、已初始化的路径
@@ -115,66 +202,121 @@ class ActivityTracker:
 
         log.info(f"Using screenshot directory: {SCREENSHOT_DIR}")
 
+        shot_type = "auto" if is_auto else "manual"
         try:
-            log.info("Calling ImageGrab.grab()...")
-            screenshot = ImageGrab.grab(bbox=bbox, all_screens=True)
-            log.info(f"ImageGrab.grab() successful. Screenshot object: {screenshot}")
+            if bbox is None and SCREENSHOT_PER_MONITOR:
+                filepath = self._take_per_monitor_screenshot(SCREENSHOT_DIR, shot_type, is_auto)
+                if filepath: return filepath
+                log.warning("No monitors detected, falling back to a stitched screenshot.")
+
+            log.info(f"Calling {self.backend.name} backend grab()...")
+            with SCREENSHOT_PHASE_SECONDS.labels("grab").time():
+                screenshot = self.backend.grab(bbox=bbox)
+            log.info(f"grab() successful. Screenshot object: {screenshot}")
 
             if screenshot is None:
-                log.error("ImageGrab.grab() returned None.")
+                log.error("grab() returned None.")
+                SCREENSHOTS_TAKEN.labels(shot_type, "failed").inc()
                 return None
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-            shot_type = "auto" if is_auto else "manual"
+            # 仅自动截图受调节器影响；用户主动截图始终保留原始分辨率
+            scale = self.governor.settings["screenshot_scale"] if is_auto else 1.0
+            if scale < 1.0:
+                screenshot = screenshot.resize((max(1, int(screenshot.width * scale)), max(1, int(screenshot.height * scale))), Image.LANCZOS)
+
+            timestamp = self.clock.now().strftime("%Y%m%d_%H%M%S_%f")
             filename = f"screenshot_{shot_type}_{timestamp}.png"
             filepath = SCREENSHOT_DIR / filename
             log.info(f"Generated filepath: {filepath}")
 
             log.info("Calling screenshot.save()...")
-            screenshot.save(filepath, "PNG")
+            with SCREENSHOT_PHASE_SECONDS.labels("write").time():
+                if is_auto and SCREENSHOT_DELTA_ENABLED:
+                    # 自动截图进入关键帧/差分存储，只写变化的图块
+                    stored = get_store().put(filename, screenshot)
+                    sha256, size_bytes, written = stored["sha256"], stored["size_bytes"], stored["stored_bytes"]
+                    pixels = stored["pixel_sha256"]
+                else:
+                    # 编码结果边写盘边计算 SHA-256，摘要写入事件，使哈希链覆盖图片内容本身
+                    with open(filepath, "wb") as f:
+                        writer = HashingWriter(f)
+                        screenshot.save(writer, "PNG")
+                    sha256, size_bytes, written = writer.hexdigest(), writer.size, writer.size
+                    pixels = None
+            self.governor.charge_write(written)
             log.info("screenshot.save() successful.")
 
             event_type = "screenshot_auto" if is_auto else "screenshot_manual"
-            details = {"filename": filename}
+            details = {"filename": filename, "sha256": sha256, "size_bytes": size_bytes}
+            if pixels:
+                # 帧存储中的截图读取时重新编码，编码器升级后以像素摘要校验（见 screenshot_store.py）
+                details["pixel_sha256"] = pixels
             if bbox: 
                 details["bbox"] = bbox
+            if scale < 1.0:
+                details["scale"] = scale
             
             log.info("Updating activity log for screenshot event...")
             self._update_activity(event_type, details)
             log.info("--- Screenshot process completed successfully. ---")
+            SCREENSHOTS_TAKEN.labels(shot_type, "success").inc()
             
             return str(filepath)
             
         except Exception as e:
             log.critical(f"--- Screenshot process FAILED. Error: {e} ---", exc_info=True)
+            SCREENSHOTS_TAKEN.labels(shot_type, "failed").inc()
             return None
         
+    def _take_per_monitor_screenshot(self, directory, shot_type: str, is_auto: bool):
+        """逐个显示器截取并记录一条截图事件，返回第一个显示器的文件路径；没有检测到显示器时返回 None"""
+        scale = self.governor.settings["screenshot_scale"] if is_auto else 1.0
+        prefix = f"screenshot_{shot_type}_{self.clock.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        monitors, written = self.monitor_capture.capture(directory, prefix, scale)
+        if monitors is None: return None
+        self.governor.charge_write(written)
+        details = {"monitors": monitors}
+        if scale < 1.0:
+            details["scale"] = scale
+        self._update_activity(f"screenshot_{shot_type}", details)
+        SCREENSHOTS_TAKEN.labels(shot_type, "success").inc()
+        log.info(f"Per-monitor screenshot recorded: {sum(1 for m in monitors if 'filename' in m)} of {len(monitors)} monitors written.")
+        first = monitors[0]
+        return str(directory / first.get("filename", first.get("same_as")))
+
     def take_fullscreen_screenshot(self):
         if not self.is_running: 
             return None
         return self.take_manual_screenshot(bbox=None, is_auto=False)
 
-    def start(self):
+    def start(self, run_threads: bool = True):
+        """run_threads 为 False 时只开始会话，不启动键盘钩子与监控线程，由调用方驱动各 tick（见 replay.py）"""
         if self.is_running: return
-        self.stop_event.clear(); self.last_activity_time = time.time(); self.is_running = True
-        self.session_start_time = datetime.now()
+        self.stop_event.clear(); self.last_activity_time = self.last_heartbeat_time = self.clock.time(); self.is_running = True
+        self.session_start_time = self.clock.now()
+        self.governor.reset()
+        self.monitor_capture.reset()
+        if not run_threads: return
         
-        kb_listener = keyboard.Listener(on_press=self._on_press)
-        self.listeners = [kb_listener]
+        self.listeners = [self.backend.keyboard_listener(self._on_press)]
         
         for l in self.listeners: l.start()
         
         self.threads = [threading.Thread(target=self._monitor_idle_status, daemon=True), threading.Thread(target=self._monitor_active_window, daemon=True), threading.Thread(target=self._auto_screenshot_taker, daemon=True)]
+        if GOVERNOR_ENABLED: self.threads.append(threading.Thread(target=self._govern_overhead, daemon=True))
+        if RETENTION_ENABLED and self.run_retention: self.threads.append(threading.Thread(target=self.retention.run, args=(self.stop_event,), daemon=True))
         for t in self.threads: t.start()
         
         if WATCHED_DIRECTORIES:
             self.file_observer = Observer(); event_handler = FileChangeEventHandler(self)
             for path in WATCHED_DIRECTORIES: self.file_observer.schedule(event_handler, path, recursive=True)
             self.file_observer.start()
+        self.governor.register_threads(self.threads + self.listeners + ([self.file_observer, *self.file_observer.emitters] if self.file_observer else []))
         log.info("TRACKER: All monitors started.")
 
     def stop(self):
         if not self.is_running: return None
+        self._flush_pending_keys()
         self._end_app_session()
         self.stop_event.set()
         for l in self.listeners:
@@ -184,6 +326,4 @@ class ActivityTracker:
         for t in self.threads: t.join(timeout=2)
         self.threads.clear(); self.listeners.clear(); self.is_running = False
         log.info("TRACKER: All monitors stopped.")
-        return {"start_time": self.session_start_time, "end_time": datetime.now()}
-
-activity_tracker = ActivityTracker()
\ No newline at end of file
+        return {"start_time": self.session_start_time, "end_time": self.clock.now()}
@@ -0,0 +1,125 @@
+# core_py/workload.py
+"""
+确定性的合成工作负载生成器，供基准测试使用。
+相同的 seed 与起始时间总是生成完全相同的事件序列，无需真实的显示器或输入设备。
+"""
+
+import random
+from datetime import datetime, timedelta
+
+DEFAULT_START = datetime(2024, 1, 1, 9, 0, 0)
+
+PROCESSES = [
+    ("code.exe", ["main.py - lex-laboris", "tracker.py - lex-laboris", "README.md - lex-laboris"]),
+    ("chrome.exe", ["JIRA-1024 修复登录超时 - Google Chrome", "Pull Request #88 - GitHub", "周报 - 飞书文档"]),
+    ("WINWORD.EXE", ["需求规格说明书_v3.docx - Word", "会议纪要_0415.docx - Word"]),
+    ("explorer.exe", ["下载", "项目资料"]),
+    ("WeChat.exe", ["微信"]),
+]
+WATCHED_FILES = [f"C:\\Users\\worker\\project\\src\\module_{i:02d}.py" for i in range(40)]
+
+
+class SyntheticWorkload:
+    """
+    按“场景块”生成事件：键盘连击、应用切换、文件监控风暴、定时截屏、心跳与空闲。
+    生成的每一项是 (timestamp, event_type, details) 三元组。
+    """
+    def __init__(self, seed: int = 42, start: datetime = DEFAULT_START):
+        self.rng = random.Random(seed)
+        self.now = start
+        self.current_app = None
+        self.session_start = start
+        self.shot_counter = 0
+
+    def _advance(self, seconds: float):
+        self.now += timedelta(seconds=seconds)
+        return self.now
+
+    def _keypress_burst(self):
+        for _ in range(self.rng.randint(5, 60)):
+            yield self._advance(self.rng.uniform(0.05, 0.4)), "keyboard_press", {}
+
+    def _app_switch(self):
+        process_name, titles = self.rng.choice(PROCESSES)
+        title = self.rng.choice(titles)
+        if self.current_app:
+            end = self._advance(self.rng.uniform(0.5, 2))
+            duration = (end - self.session_start).total_seconds()
+            if duration > 1:
+                yield end, "app_session", {
+                    "process_name": self.current_app[0], "app_title": self.current_app[1],
+                    "start_time": self.session_start.isoformat(), "end_time": end.isoformat(),
+                    "duration_seconds": round(duration)
+                }
+        self.current_app = (process_name, title)
+        self.session_start = self.now
+
+    def _file_storm(self):
+        for _ in range(self.rng.randint(10, 120)):
+            event_type = self.rng.choice(["file_modified", "file_modified", "file_modified", "file_created", "file_deleted"])
+            yield self._advance(self.rng.uniform(0.001, 0.05)), event_type, {"path": self.rng.choice(WATCHED_FILES)}
+
+    def _screenshot(self):
+        self.shot_counter += 1
+        ts = self._advance(self.rng.uniform(0.1, 1))
+        yield ts, "screenshot_auto", {"filename": f"screenshot_auto_{ts.strftime('%Y%m%d_%H%M%S_%f')}.png"}
+
+    def _heartbeat(self):
+        yield self._advance(self.rng.uniform(1, 30)), "heartbeat", {"message": "User is active."}
+
+    def _idle_period(self):
+        idle_seconds = self.rng.randint(300, 3600)
+        yield self._advance(300), "status_change", {"status": "idle", "duration_seconds": 300}
+        yield self._advance(idle_seconds - 300), "status_change", {"status": "active"}
+
+    def events(self, count: int):
+        """生成恰好 count 条事件"""
+        scenarios = [
+            (self._keypress_burst, 45), (self._app_switch, 20), (self._file_storm, 8),
+            (self._screenshot, 5), (self._heartbeat, 15), (self._idle_period, 2),
+        ]
+        funcs = [f for f, _ in scenarios]
+        weights = [w for _, w in scenarios]
+        produced = 0
+        while produced < count:
+            for item in self.rng.choices(funcs, weights)[0]():
+                yield item
+                produced += 1
+                if produced >= count: return
+
+
+def populate_database(count: int, seed: int = 42, batch_size: int = 5000):
+    """
+    以合法的哈希链批量写入 count 条合成事件（绕过逐条提交，用于快速构造大库）。
+    派生表与 save_event 一样在同一事务中维护。数据库必须已经初始化。返回最后一条事件的哈希。
+    """
+    import database
+    from database import Event, SIDE_COLUMNS, _compute_hash, _side_columns, _encode_details_columns, _update_derived_tables_bulk
+    from details_codec import canonical_json
+    from sqlalchemy import func
+
+    previous_hash = database.get_last_hash()
+    batch, derived = [], []
+    with database.db_lock, database.SessionLocal() as db:
+        next_id = (db.query(func.max(Event.id)).scalar() or 0) + 1
+        def flush():
+            db.execute(Event.__table__.insert(), batch)
+            _update_derived_tables_bulk(db, derived)
+            batch.clear(); derived.clear()
+        for timestamp, event_type, details in SyntheticWorkload(seed).events(count):
+            details_json = canonical_json(details)
+            data_hash = _compute_hash(previous_hash, timestamp, event_type, details_json)
+            batch.append({
+                "id": next_id, "timestamp": timestamp, "event_type": event_type,
+                "data_hash": data_hash, "previous_hash": previous_hash,
+                "details": None, "details_blob": None, "details_encoding": None,
+                **_encode_details_columns(db, details, details_json),
+                **{name: None for name in SIDE_COLUMNS}, **_side_columns(event_type, details)
+            })
+            derived.append((next_id, timestamp, event_type, details))
+            previous_hash = data_hash; next_id += 1
+            if len(batch) >= batch_size: flush()
+        if batch: flush()
+        db.commit()
+    database.warm_recent_events()
+    return previous_hash
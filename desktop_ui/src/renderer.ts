@@ -12,6 +12,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const eventsLog = document.getElementById('events-log');
     const generateReportBtn = document.getElementById('generate-report-btn') as HTMLButtonElement;
     const userNameInput = document.getElementById('userName') as HTMLInputElement;
+    const embedThumbnailsInput = document.getElementById('embedThumbnails') as HTMLInputElement;
     const reportStatusDiv = document.getElementById('report-status');
     // 【移除】不再需要获取删除按钮和其状态 div
     // const deleteDbBtn = document.getElementById('delete-db-btn') as HTMLButtonElement;
@@ -21,7 +22,7 @@ document.addEventListener('DOMContentLoaded', () => {
         "environment_snapshot": "环境快照", "status_change": "状态变更", "keyboard_press": "键盘输入",
         "heartbeat": "活跃心跳", "app_session": "应用聚焦", 
         "screenshot_manual": "手动截屏", "screenshot_auto": "自动截屏", "file_created": "文件创建", 
-        "file_modified": "文件修改", "file_deleted": "文件删除", "file_moved": "文件移动"
+        "file_modified": "文件修改", "file_deleted": "文件删除", "file_moved": "文件移动", "governor_throttle": "资源调节", "retention_downsample": "截图降采样"
     };
 
     function updateUI(status: { is_tracking: boolean; is_idle: boolean }) {
@@ -45,12 +46,17 @@ document.addEventListener('DOMContentLoaded', () => {
         if (e.event_type.startsWith('screenshot_') && e.details.filepath) {
             const screenshotUrl = api.getScreenshotUrl(e.details.filepath);
             detailsHTML = `<a href="${screenshotUrl}" class="external-link">点击查看截图: ${e.details.filename}</a>`; 
+        } else if (e.event_type.startsWith('screenshot_') && e.details.monitors) {
+            // 分屏截图：每个显示器一个链接，画面未变化的显示器指向上一次保存的文件名
+            detailsHTML = e.details.monitors.map((m: any) => m.filepath
+                ? `<a href="${api.getScreenshotUrl(m.filepath)}" class="external-link">显示器 ${m.index}: ${m.filename}</a>`
+                : `<i>显示器 ${m.index}: 画面未变化（同 ${m.same_as}）</i>`).join('<br>');
         } else if (e.event_type === 'app_session') {
             const title = e.details.app_title ? ` - ${e.details.app_title}` : '';
             detailsHTML = `<strong>[${e.details.process_name}]${title}</strong><br>持续聚焦 ${e.details.duration_seconds} 秒。`;
         } 
         else if (e.event_type === 'keyboard_press') {
-            detailsHTML = `<i>检测到键盘输入...</i>`;
+            detailsHTML = e.details.count ? `<i>检测到键盘输入（聚合 ${e.details.count} 次）...</i>` : `<i>检测到键盘输入...</i>`;
         }
         else if (e.event_type === 'heartbeat') {
             detailsHTML = `<i>用户保持活跃...</i>`;
@@ -130,6 +136,7 @@ document.addEventListener('DOMContentLoaded', () => {
         const result = await api.generateReport({
             userInfo: { name: userNameInput.value || "匿名用户" },
             savePath: savePath, startDate: lastSession.startTime, endDate: lastSession.endTime,
+            embedThumbnails: embedThumbnailsInput.checked,
         });
         
         if (result.status === 'success') {